@@ -1,8 +1,12 @@
 try:
     from .comfyui_pano_suite.nodes import NODE_CLASS_MAPPINGS, NODE_DISPLAY_NAME_MAPPINGS
+    from .comfyui_pano_suite.server import register_routes
 except ImportError:
     # Allow direct module loading in test runners without package context.
     from comfyui_pano_suite.nodes import NODE_CLASS_MAPPINGS, NODE_DISPLAY_NAME_MAPPINGS
+    from comfyui_pano_suite.server import register_routes
+
+register_routes()
 
 WEB_DIRECTORY = "web"
 
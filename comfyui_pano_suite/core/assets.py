@@ -0,0 +1,345 @@
+import base64
+import binascii
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+from .state import dump_state
+
+try:
+    import folder_paths
+except Exception:  # pragma: no cover - optional in non-Comfy test environments
+    folder_paths = None
+
+# Content-addressed sticker images live in <input>/ASSET_SUBFOLDER/<sha256>.<ext>,
+# so the frontend can show them through ComfyUI's /view like any input image.
+ASSET_SUBFOLDER = "pano_assets"
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+_MIME_EXT = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/jpg": "jpg",
+    "image/webp": "webp",
+    "image/gif": "gif",
+}
+_EXTS = set(_MIME_EXT.values())
+
+
+def default_store_dir() -> Path | None:
+    if folder_paths is None:
+        return None
+    return Path(folder_paths.get_input_directory()) / ASSET_SUBFOLDER
+
+
+def decode_dataurl(value: str) -> tuple[bytes, str] | None:
+    # (raw bytes, file extension) of a base64 image data URL, or None.
+    if not isinstance(value, str) or not value.startswith("data:image"):
+        return None
+    head, sep, payload = value.partition(",")
+    if not sep or ";base64" not in head:
+        return None
+    ext = _MIME_EXT.get(head[5:].split(";", 1)[0].strip().lower())
+    if ext is None:
+        return None
+    try:
+        return base64.b64decode(payload, validate=False), ext
+    except (binascii.Error, ValueError):
+        return None
+
+
+def put_asset_bytes(data: bytes, ext: str, store_dir: str | Path | None = None) -> str:
+    """Stores ``data`` under its SHA-256 digest and returns the digest."""
+    store = Path(store_dir) if store_dir is not None else default_store_dir()
+    if store is None:
+        raise ValueError("no asset store directory")
+    if ext not in _EXTS:
+        raise ValueError(f"unsupported asset type: {ext}")
+    digest = hashlib.sha256(data).hexdigest()
+    path = store / f"{digest}.{ext}"
+    if not path.exists():
+        store.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{digest}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+    return digest
+
+
+def hash_asset_path(asset_info: dict, store_dir: str | Path | None = None) -> Path | None:
+    if not isinstance(asset_info, dict):
+        return None
+    digest = str(asset_info.get("hash") or "").strip().lower()
+    ext = str(asset_info.get("ext") or "png").strip().lower()
+    if not _HASH_RE.match(digest) or ext not in _EXTS:
+        return None
+    store = Path(store_dir) if store_dir is not None else default_store_dir()
+    if store is None:
+        return None
+    p = store / f"{digest}.{ext}"
+    if not p.is_file():
+        return None
+    return p
+
+
+def externalize_assets(assets: dict, store_dir: str | Path | None = None) -> tuple[dict, bool]:
+    """Replaces data URL assets with ``{"type": "hash", ...}`` references.
+
+    Returns a new assets dict (other entries are shared) and whether anything
+    was replaced. Data URLs that cannot be decoded are left as they are.
+    """
+    if not isinstance(assets, dict):
+        return assets, False
+    out = dict(assets)
+    changed = False
+    for asset_id, asset in assets.items():
+        if not isinstance(asset, dict) or str(asset.get("type") or "").strip().lower() != "dataurl":
+            continue
+        decoded = decode_dataurl(asset.get("value"))
+        if decoded is None:
+            continue
+        data, ext = decoded
+        ref = {k: v for k, v in asset.items() if k != "value"}
+        ref.update({"type": "hash", "hash": put_asset_bytes(data, ext, store_dir), "ext": ext})
+        out[asset_id] = ref
+        changed = True
+    return out, changed
+
+
+def externalize_state_json(text: str, store_dir: str | Path | None = None) -> str:
+    # Returns ``text`` unchanged unless it holds data URL assets.
+    if not isinstance(text, str) or "data:image" not in text:
+        return text
+    try:
+        state = json.loads(text)
+    except Exception:
+        return text
+    if not isinstance(state, dict):
+        return text
+    if "state_ref" in state and isinstance(state.get("state"), dict):
+        # A state store reference with the document embedded (saved workflows).
+        inner = state["state"]
+        assets, changed = externalize_assets(inner.get("assets"), store_dir)
+        if not changed:
+            return text
+        return dump_state({**state, "state": {**inner, "assets": assets}})
+    assets, changed = externalize_assets(state.get("assets"), store_dir)
+    if not changed:
+        return text
+    return dump_state({**state, "assets": assets})
+
+
+# Editor uploads are deduplicated against everything already in the input
+# directory: a SHA-256 index keyed by (relpath, mtime, size) is persisted at
+# <input>/ASSET_SUBFOLDER/INPUT_INDEX_NAME, and only changed files are rehashed.
+# Uploads look up the index as it stands; rescans run on a background thread
+# at most once per INDEX_REFRESH_INTERVAL_S, so a large or never-indexed input
+# directory does not stall the request that triggers them.
+INPUT_INDEX_NAME = ".input_index.json"
+UPLOAD_SUBFOLDER = "panorama_stickers"
+INDEX_REFRESH_INTERVAL_S = 30.0
+
+_UPLOAD_EXTS = _EXTS | {"jpeg"}
+_SAFE_NAME_RE = re.compile(r"[^A-Za-z0-9._ ()-]+")
+
+
+def _sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class InputHashIndex:
+    def __init__(self, root: str | Path, index_path: str | Path | None = None):
+        self.root = Path(root)
+        self.index_path = Path(index_path) if index_path is not None else self.root / ASSET_SUBFOLDER / INPUT_INDEX_NAME
+        self._files = {}
+        self._by_hash = {}
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._refreshed_at = None
+        self._load()
+
+    def _load(self):
+        try:
+            data = json.loads(self.index_path.read_text(encoding="utf-8"))
+        except Exception:
+            return
+        files = data.get("files") if isinstance(data, dict) else None
+        for rel, entry in (files or {}).items():
+            if isinstance(entry, list) and len(entry) == 3 and _HASH_RE.match(str(entry[2])):
+                self._files[rel] = (int(entry[0]), int(entry[1]), str(entry[2]))
+        self._rebuild()
+
+    def _rebuild(self):
+        self._by_hash = {}
+        for rel in sorted(self._files):
+            self._by_hash.setdefault(self._files[rel][2], rel)
+
+    def save(self):
+        with self._lock:
+            payload = {"version": 1, "files": {rel: list(v) for rel, v in self._files.items()}}
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_path.with_name(f".{self.index_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(payload, separators=(",", ":")), encoding="utf-8")
+        tmp.replace(self.index_path)
+
+    def refresh(self) -> bool:
+        """Stats every image under the root and rehashes new or changed files.
+
+        Returns whether the index changed.
+        """
+        seen = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for name in filenames:
+                if name.startswith(".") or name.rsplit(".", 1)[-1].lower() not in _UPLOAD_EXTS:
+                    continue
+                p = Path(dirpath) / name
+                try:
+                    st = p.stat()
+                except OSError:
+                    continue
+                seen[p.relative_to(self.root).as_posix()] = (p, st.st_mtime_ns, st.st_size)
+
+        with self._lock:
+            old = dict(self._files)
+        files = {}
+        for rel, (p, mtime_ns, size) in seen.items():
+            prev = old.get(rel)
+            if prev is not None and prev[0] == mtime_ns and prev[1] == size:
+                files[rel] = prev
+                continue
+            try:
+                files[rel] = (mtime_ns, size, _sha256_file(p))
+            except OSError:
+                continue
+        with self._lock:
+            # Keep entries added by uploads that landed after the walk.
+            for rel, entry in self._files.items():
+                if rel not in old and rel not in files:
+                    files[rel] = entry
+            changed = files != self._files
+            self._files = files
+            self._rebuild()
+            self._refreshed_at = time.monotonic()
+        return changed
+
+    def refresh_in_background(self, max_age: float = INDEX_REFRESH_INTERVAL_S) -> threading.Thread | None:
+        """Starts a background :meth:`refresh` (saving the index if it changed)
+        unless one is running or the last refresh is younger than ``max_age``.
+
+        Returns the started thread, if any.
+        """
+        with self._lock:
+            busy = self._refresh_thread is not None and self._refresh_thread.is_alive()
+            fresh = self._refreshed_at is not None and time.monotonic() - self._refreshed_at < max_age
+            if busy or fresh:
+                return None
+            self._refresh_thread = threading.Thread(target=self._background_refresh, name="pano-input-index", daemon=True)
+            self._refresh_thread.start()
+            return self._refresh_thread
+
+    def _background_refresh(self):
+        try:
+            if self.refresh():
+                self.save()
+        except OSError:
+            pass
+
+    def find(self, digest: str) -> str | None:
+        # Relative path of an indexed file with this content that is unchanged on disk.
+        with self._lock:
+            rel = self._by_hash.get(digest)
+            entry = self._files.get(rel) if rel is not None else None
+        if entry is None:
+            return None
+        try:
+            st = (self.root / rel).stat()
+        except OSError:
+            return None
+        return rel if (st.st_mtime_ns, st.st_size) == entry[:2] else None
+
+    def add(self, rel: str, digest: str):
+        st = (self.root / rel).stat()
+        with self._lock:
+            self._files[rel] = (st.st_mtime_ns, st.st_size, digest)
+            self._by_hash.setdefault(digest, rel)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+_upload_lock = threading.Lock()
+
+
+def input_hash_index(input_dir: str | Path | None = None) -> InputHashIndex:
+    if input_dir is None:
+        if folder_paths is None:
+            raise ValueError("no input directory")
+        input_dir = folder_paths.get_input_directory()
+    key = str(Path(input_dir).resolve())
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = InputHashIndex(key)
+        return index
+
+
+def _upload_name(filename: str) -> tuple[str, str]:
+    name = _SAFE_NAME_RE.sub("_", Path(str(filename or "")).name).strip(" .") or "sticker.png"
+    stem, _, ext = name.rpartition(".")
+    ext = ext.lower()
+    if not stem or ext not in _UPLOAD_EXTS:
+        raise ValueError(f"unsupported upload type: {name}")
+    return stem, ext
+
+
+def store_upload(data: bytes, filename: str, subfolder: str = UPLOAD_SUBFOLDER, input_dir: str | Path | None = None) -> dict:
+    """Saves an uploaded image unless identical bytes are already in the input
+    directory, and returns a ``comfy_image`` asset for the stored file.
+
+    ``deduplicated`` tells whether an existing file was returned. Only files
+    the index has seen are matched; the index is refreshed in the background.
+    """
+    index = input_hash_index(input_dir)
+    root = index.root
+    stem, ext = _upload_name(filename)
+    target_dir = (root / str(subfolder or "").strip("/\\")).resolve()
+    try:
+        target_dir.relative_to(root.resolve())
+    except ValueError:
+        raise ValueError("invalid subfolder") from None
+
+    digest = hashlib.sha256(data).hexdigest()
+    with _upload_lock:
+        rel = index.find(digest)
+        deduplicated = rel is not None
+        if rel is None:
+            target_dir.mkdir(parents=True, exist_ok=True)
+            path = target_dir / f"{stem}.{ext}"
+            i = 1
+            while path.exists():
+                path = target_dir / f"{stem} ({i}).{ext}"
+                i += 1
+            tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(data)
+            tmp.replace(path)
+            rel = path.relative_to(root.resolve()).as_posix()
+            index.add(rel, digest)
+            index.save()
+    index.refresh_in_background()
+
+    sub, _, name = rel.rpartition("/")
+    return {
+        "type": "comfy_image",
+        "filename": name,
+        "subfolder": sub,
+        "storage": "input",
+        "hash": digest,
+        "deduplicated": deduplicated,
+    }
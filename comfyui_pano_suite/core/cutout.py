@@ -1,11 +1,84 @@
 import math
+from functools import lru_cache
+
 import numpy as np
 
-from .math import DEG2RAD, dir_to_lon_lat, lon_lat_to_erp, sample_erp_bilinear, yaw_pitch_to_dir, orthonormal_basis_from_forward
+from . import profiling
+from .memory import plan_cutout_band_rows, track_peak
+from .math import HAS_TORCH, DEG2RAD, basis_is_yaw_equivariant, dir_to_lon_lat, lon_lat_to_erp, preview_render_size, resize_image, sample_erp_bilinear, yaw_pitch_to_dir, orthonormal_basis_from_forward
+from .source import ErpSource
 
+if HAS_TORCH:
+    import torch
+    import torch.nn.functional as F
 
-def cutout_from_erp(
-    erp_rgb: np.ndarray,
+# Fast-math maps evaluate the exact projection on a coarse grid (one node every
+# FAST_MAP_STEPS[i] output pixels) and interpolate in between. The interpolated map
+# is checked against the exact map at every coarse cell midpoint with half of the
+# FAST_MAP_MAX_ERR_PX budget. The error is in ERP pixels. Frames with a pole
+# (and so the seam, see _pole_in_frame) fall back to the exact map without
+# probing, and a failed probe only moves on to the finer step when its error,
+# which scales with the square of the step, predicts that step will pass. A step
+# of 2 would probe as many points as the exact map has, so it is not offered.
+FAST_MAP_STEPS = (8, 4)
+FAST_MAP_MAX_ERR_PX = 0.25
+# Poles this far outside the frame (as a fraction of its half-extent) still
+# count as inside; the map curves sharply next to them.
+FAST_MAP_POLE_MARGIN = 0.1
+
+# Outputs above this many pixels are produced in row bands of at most this many
+# pixels, so peak memory is the output plus one band of maps and samples. Bands
+# get smaller when the estimated working set is over the memory budget.
+CUTOUT_BAND_PIXELS = 1 << 22
+
+
+def _camera_rays(h_fov_deg: float, v_fov_deg: float, out_w: int, out_h: int, px: np.ndarray, py: np.ndarray) -> np.ndarray:
+    # Unit camera-space rays (x right, y up, z forward) through output pixel
+    # coordinates px/py; pixel centers sit at i + 0.5.
+    h_tan = math.tan(max(1e-3, h_fov_deg) * 0.5 * DEG2RAD)
+    v_tan = math.tan(max(1e-3, v_fov_deg) * 0.5 * DEG2RAD)
+
+    xs = (np.asarray(px, dtype=np.float32) / out_w * 2.0 - 1.0) * h_tan
+    ys = (1.0 - np.asarray(py, dtype=np.float32) / out_h * 2.0) * v_tan
+
+    rays = np.empty((len(ys), len(xs), 3), dtype=np.float32)
+    rays[..., 0] = xs[None, :]
+    rays[..., 1] = ys[:, None]
+    rays[..., 2] = 1.0
+    norm = np.sqrt(np.square(xs)[None, :] + np.square(ys)[:, None] + 1.0)
+    rays /= norm[..., None]
+    return rays
+
+
+@lru_cache(maxsize=4)
+def _camera_ray_grid(h_fov_deg: float, v_fov_deg: float, out_w: int, out_h: int) -> np.ndarray:
+    # Rays depend only on the intrinsics, so orientation changes reuse them.
+    px = np.arange(out_w, dtype=np.float32) + 0.5
+    py = np.arange(out_h, dtype=np.float32) + 0.5
+    rays = _camera_rays(h_fov_deg, v_fov_deg, out_w, out_h, px, py)
+    rays.flags.writeable = False
+    return rays
+
+
+def _shot_rotation(yaw_deg: float, pitch_deg: float, roll_deg: float) -> np.ndarray:
+    # Rows are the world-space right, up and forward axes of the rolled camera,
+    # so world directions are rays @ rotation.
+    forward = yaw_pitch_to_dir(yaw_deg, pitch_deg)
+    right, up, fwd = orthonormal_basis_from_forward(forward)
+    if abs(roll_deg) > 1e-6:
+        rr = roll_deg * DEG2RAD
+        cr = math.cos(rr)
+        sr = math.sin(rr)
+        right, up = right * cr + up * sr, up * cr - right * sr
+    return np.stack([right, up, fwd]).astype(np.float32)
+
+
+def _rays_to_lon_lat(rays: np.ndarray, rotation: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    dirs = rays.reshape(-1, 3) @ rotation
+    return dir_to_lon_lat(dirs.reshape(rays.shape))
+
+
+def _shot_lon_lat(
     yaw_deg: float,
     pitch_deg: float,
     h_fov_deg: float,
@@ -13,36 +86,306 @@ def cutout_from_erp(
     roll_deg: float,
     out_w: int,
     out_h: int,
-) -> np.ndarray:
+    px: np.ndarray,
+    py: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    rays = _camera_rays(h_fov_deg, v_fov_deg, out_w, out_h, px, py)
+    return _rays_to_lon_lat(rays, _shot_rotation(yaw_deg, pitch_deg, roll_deg))
+
+
+def _upsample_map(coarse: np.ndarray, out_h: int, out_w: int) -> np.ndarray:
+    # Separable linear interpolation from an evenly spaced node grid whose first and
+    # last nodes sit on the first and last output pixel centers.
+    ch, cw = coarse.shape
+    if HAS_TORCH:
+        t = torch.from_numpy(np.ascontiguousarray(coarse, dtype=np.float32))[None, None]
+        t = F.interpolate(t, size=(out_h, out_w), mode="bilinear", align_corners=True)
+        return t[0, 0].numpy()
+
+    fx = np.arange(out_w, dtype=np.float32) * ((cw - 1) / max(out_w - 1, 1))
+    fy = np.arange(out_h, dtype=np.float32) * ((ch - 1) / max(out_h - 1, 1))
+    x0 = np.minimum(fx.astype(np.int32), cw - 2)
+    y0 = np.minimum(fy.astype(np.int32), ch - 2)
+    tx = fx - x0
+    ty = (fy - y0)[:, None]
+
+    rows = coarse[:, x0] * (1.0 - tx) + coarse[:, x0 + 1] * tx
+    return rows[y0] * (1.0 - ty) + rows[y0 + 1] * ty
+
+
+def _pole_in_frame(yaw_deg: float, pitch_deg: float, h_fov_deg: float, v_fov_deg: float, roll_deg: float) -> bool:
+    # The relative-longitude seam is the meridian behind the camera. The frame is
+    # convex and contains the forward direction, so it can only reach that
+    # meridian across a pole: testing the two poles covers the seam as well.
+    rotation = _shot_rotation(yaw_deg, pitch_deg, roll_deg)
+    h_tan = math.tan(max(1e-3, h_fov_deg) * 0.5 * DEG2RAD) * (1.0 + FAST_MAP_POLE_MARGIN)
+    v_tan = math.tan(max(1e-3, v_fov_deg) * 0.5 * DEG2RAD) * (1.0 + FAST_MAP_POLE_MARGIN)
+    for sign in (1.0, -1.0):
+        # Camera-space (right, up, forward) coordinates of the pole (0, sign, 0).
+        x, y, z = (float(c) * sign for c in rotation[:, 1])
+        if z > 1e-6 and abs(x) <= h_tan * z and abs(y) <= v_tan * z:
+            return True
+    return False
+
+
+def _fast_cutout_uv(
+    yaw_deg: float,
+    pitch_deg: float,
+    h_fov_deg: float,
+    v_fov_deg: float,
+    roll_deg: float,
+    out_w: int,
+    out_h: int,
+    erp_w: int,
+    erp_h: int,
+) -> tuple[np.ndarray, np.ndarray] | None:
+    if _pole_in_frame(yaw_deg, pitch_deg, h_fov_deg, v_fov_deg, roll_deg):
+        return None
+    yaw_rad = yaw_deg * DEG2RAD
+    u_scale = erp_w / (2.0 * math.pi)
+    v_scale = erp_h / math.pi
+
+    def rel_maps(xs, ys):
+        # Longitude relative to the shot yaw keeps the ERP seam behind the camera,
+        # so the map stays smooth for any yaw.
+        lon, lat = _shot_lon_lat(yaw_deg, pitch_deg, h_fov_deg, v_fov_deg, roll_deg, out_w, out_h, xs, ys)
+        lon_rel = np.mod(lon - yaw_rad + math.pi, 2.0 * math.pi) - math.pi
+        return lon_rel * u_scale, lat * v_scale
+
+    limit = FAST_MAP_MAX_ERR_PX * 0.5
+    err = math.inf
+    prev_step = None
+    for step in FAST_MAP_STEPS:
+        if prev_step is not None and not (np.isfinite(err) and err * (step / prev_step) ** 2 <= limit):
+            break
+        prev_step = step
+        nx = max(2, int(math.ceil((out_w - 1) / step)) + 1)
+        ny = max(2, int(math.ceil((out_h - 1) / step)) + 1)
+        if nx * ny * 4 > out_w * out_h:
+            break
+        px = np.linspace(0.5, out_w - 0.5, nx, dtype=np.float32)
+        py = np.linspace(0.5, out_h - 0.5, ny, dtype=np.float32)
+        mx = (px[:-1] + px[1:]) * 0.5
+        my = (py[:-1] + py[1:]) * 0.5
+        cu, cv = rel_maps(px, py)
+        # Interpolated values at cell and edge midpoints are means of the nodes.
+        err = 0.0
+        for xs, ys, mean in (
+            (mx, my, lambda a: (a[:-1, :-1] + a[:-1, 1:] + a[1:, :-1] + a[1:, 1:]) * 0.25),
+            (mx, py, lambda a: (a[:, :-1] + a[:, 1:]) * 0.5),
+            (px, my, lambda a: (a[:-1, :] + a[1:, :]) * 0.5),
+        ):
+            eu, ev = rel_maps(xs, ys)
+            err = max(err, float(np.max(np.abs(mean(cu) - eu))), float(np.max(np.abs(mean(cv) - ev))))
+        if np.isfinite(err) and err <= limit:
+            break
+    if not (np.isfinite(err) and err <= limit):
+        return None
+
+    u = _upsample_map(cu, out_h, out_w) + np.float32((yaw_deg / 360.0 + 0.5) * erp_w)
+    v = np.float32(0.5 * erp_h) - _upsample_map(cv, out_h, out_w)
+    u = np.mod(u, erp_w)
+    v = np.clip(v, 0.0, erp_h - 1.0)
+    return u, v
+
+
+@lru_cache(maxsize=8)
+def _yaw0_uv_maps(
+    pitch_deg: float,
+    h_fov_deg: float,
+    v_fov_deg: float,
+    roll_deg: float,
+    out_w: int,
+    out_h: int,
+    erp_w: int,
+    erp_h: int,
+    fast_math: bool,
+) -> tuple[np.ndarray, np.ndarray]:
+    maps = None
+    with profiling.span("cutout.maps", w=out_w, h=out_h, fast_math=fast_math):
+        if fast_math:
+            maps = _fast_cutout_uv(0.0, pitch_deg, h_fov_deg, v_fov_deg, roll_deg, out_w, out_h, erp_w, erp_h)
+        if maps is None:
+            rays = _camera_ray_grid(h_fov_deg, v_fov_deg, out_w, out_h)
+            lon, lat = _rays_to_lon_lat(rays, _shot_rotation(0.0, pitch_deg, roll_deg))
+            maps = lon_lat_to_erp(lon, lat, erp_w, erp_h)
+    for m in maps:
+        m.flags.writeable = False
+    profiling.add_cache_bytes("cutout.yaw0_maps", sum(m.nbytes for m in maps))
+    return maps
+
+
+profiling.register_cache("cutout.rays", _camera_ray_grid)
+profiling.register_cache("cutout.yaw0_maps", _yaw0_uv_maps)
+
+# What the map caches can hold per output pixel when full of one size: float32
+# (u, v) per yaw-0 entry and float32 xyz per ray grid.
+CUTOUT_CACHE_BYTES_PER_PIXEL = (
+    _yaw0_uv_maps.cache_parameters()["maxsize"] * 8
+    + _camera_ray_grid.cache_parameters()["maxsize"] * 12
+)
+
+
+def cutout_uv_maps(
+    yaw_deg: float,
+    pitch_deg: float,
+    h_fov_deg: float,
+    v_fov_deg: float,
+    roll_deg: float,
+    out_w: int,
+    out_h: int,
+    erp_w: int,
+    erp_h: int,
+    fast_math: bool = False,
+) -> tuple[np.ndarray, np.ndarray]:
     out_w = max(8, int(out_w))
     out_h = max(8, int(out_h))
 
-    h_tan = math.tan(max(1e-3, h_fov_deg) * 0.5 * DEG2RAD)
-    v_tan = math.tan(max(1e-3, v_fov_deg) * 0.5 * DEG2RAD)
+    if basis_is_yaw_equivariant(pitch_deg):
+        # Maps are cached at yaw=0; any other yaw is a wrapped horizontal shift.
+        # The returned v map is shared with the cache and must not be modified.
+        u0, v = _yaw0_uv_maps(
+            float(pitch_deg), float(h_fov_deg), float(v_fov_deg), float(roll_deg),
+            out_w, out_h, int(erp_w), int(erp_h), bool(fast_math),
+        )
+        u = u0 + np.float32((yaw_deg / 360.0) % 1.0 * erp_w)
+        u[u >= erp_w] -= erp_w
+        return u, v
 
-    forward = yaw_pitch_to_dir(yaw_deg, pitch_deg)
-    right, up, fwd = orthonormal_basis_from_forward(forward)
+    if fast_math:
+        maps = _fast_cutout_uv(yaw_deg, pitch_deg, h_fov_deg, v_fov_deg, roll_deg, out_w, out_h, erp_w, erp_h)
+        if maps is not None:
+            return maps
 
-    xs = (np.arange(out_w, dtype=np.float32) + 0.5) / out_w * 2.0 - 1.0
-    ys = 1.0 - (np.arange(out_h, dtype=np.float32) + 0.5) / out_h * 2.0
-    xg, yg = np.meshgrid(xs, ys)
+    rays = _camera_ray_grid(float(h_fov_deg), float(v_fov_deg), out_w, out_h)
+    lon, lat = _rays_to_lon_lat(rays, _shot_rotation(yaw_deg, pitch_deg, roll_deg))
+    return lon_lat_to_erp(lon, lat, erp_w, erp_h)
 
-    x = xg * h_tan
-    y = yg * v_tan
 
-    if abs(roll_deg) > 1e-6:
-        rr = roll_deg * DEG2RAD
-        cr = math.cos(rr)
-        sr = math.sin(rr)
-        xr = x * cr - y * sr
-        yr = x * sr + y * cr
-        x, y = xr, yr
+def map_footprint(u: np.ndarray, v: np.ndarray, erp_w: int, erp_h: int) -> tuple[int, int, int, int]:
+    """Returns the source rows [row0, row1) and columns [col0, col1) a (u, v) map
+    samples, including the bilinear neighbours. col1 may exceed erp_w when the
+    footprint wraps around the seam."""
+    row0 = int(np.floor(v.min()))
+    row1 = min(erp_h, int(np.floor(v.max())) + 2)
+
+    used = np.zeros(erp_w, dtype=bool)
+    used[np.minimum(u.astype(np.int32), erp_w - 1)] = True
+    free = np.flatnonzero(~used)
+    if free.size == 0:
+        return row0, row1, 0, erp_w
+
+    # The footprint starts right after the widest circular run of unused columns.
+    runs = np.split(free, np.flatnonzero(np.diff(free) != 1) + 1)
+    if len(runs) > 1 and runs[0][0] == 0 and runs[-1][-1] == erp_w - 1:
+        runs = [np.concatenate([runs[-1], runs[0] + erp_w])] + runs[1:-1]
+    widest = max(runs, key=len)
+    span = erp_w - len(widest)
+    if span + 1 >= erp_w:
+        return row0, row1, 0, erp_w
+    col0 = int(widest[-1] + 1) % erp_w
+    return row0, row1, col0, col0 + span + 1
+
+
+def _sample_source(source: ErpSource, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    # Reads only the footprint of the map and shifts the map into it. A partial
+    # footprint already holds every bilinear neighbour, so it is sampled without
+    # the seam padding copy.
+    erp_h, erp_w = source.height, source.width
+    row0, row1, col0, col1 = map_footprint(u, v, erp_w, erp_h)
+    with profiling.span("cutout.read", rows=row1 - row0, cols=col1 - col0):
+        block = source.read(row0, row1, col0, col1)
+    v = v - row0
+    if col1 - col0 >= erp_w:
+        return sample_erp_bilinear(block, u, v)
+    u = u - col0
+    u[u < 0] += erp_w
+    return sample_erp_bilinear(block, u, v, wrap=False)
+
+
+def _cutout_band(
+    source: ErpSource,
+    rotation: np.ndarray,
+    h_fov_deg: float,
+    v_fov_deg: float,
+    out_w: int,
+    out_h: int,
+    row0: int,
+    row1: int,
+) -> np.ndarray:
+    px = np.arange(out_w, dtype=np.float32) + 0.5
+    py = np.arange(row0, row1, dtype=np.float32) + 0.5
+    rays = _camera_rays(h_fov_deg, v_fov_deg, out_w, out_h, px, py)
+    lon, lat = _rays_to_lon_lat(rays, rotation)
+    u, v = lon_lat_to_erp(lon, lat, source.width, source.height)
+    return _sample_source(source, u, v)
+
+
+def cutout_from_erp(
+    erp_rgb: np.ndarray | ErpSource,
+    yaw_deg: float,
+    pitch_deg: float,
+    h_fov_deg: float,
+    v_fov_deg: float,
+    roll_deg: float,
+    out_w: int,
+    out_h: int,
+    fast_math: bool = False,
+    band_pixels: int | None = None,
+    map_bundle=None,
+    quality: str = "export",
+) -> np.ndarray:
+    with profiling.span("cutout", w=int(out_w), h=int(out_h), quality=quality, fast_math=bool(fast_math)), track_peak("cutout.memory") as mem:
+        return _cutout(erp_rgb, yaw_deg, pitch_deg, h_fov_deg, v_fov_deg, roll_deg, out_w, out_h, fast_math, band_pixels, map_bundle, quality, mem)
+
+
+def _cutout(erp_rgb, yaw_deg, pitch_deg, h_fov_deg, v_fov_deg, roll_deg, out_w, out_h, fast_math, band_pixels, map_bundle, quality, mem) -> np.ndarray:
+    out_w = max(8, int(out_w))
+    out_h = max(8, int(out_h))
+    # In-memory arrays go through the same footprint reads, so only the pixels
+    # the shot touches are sliced and converted to float32.
+    source = erp_rgb if isinstance(erp_rgb, ErpSource) else ErpSource(erp_rgb)
+    if band_pixels is None:
+        rows, estimate = plan_cutout_band_rows(
+            out_w, out_h, source.width, source.height, source.channels, h_fov_deg, v_fov_deg,
+            cache_bytes_per_pixel=CUTOUT_CACHE_BYTES_PER_PIXEL,
+        )
+        band_pixels = min(CUTOUT_BAND_PIXELS, rows * out_w)
+        mem["estimate_bytes"] = estimate
+    band_pixels = max(1, int(band_pixels))
+    mem["band_rows"] = min(out_h, max(1, band_pixels // out_w))
+
+    if quality == "preview":
+        pw, ph = preview_render_size(out_w, out_h)
+        if (pw, ph) != (out_w, out_h):
+            small = cutout_from_erp(source, yaw_deg, pitch_deg, h_fov_deg, v_fov_deg, roll_deg, pw, ph, fast_math=True, band_pixels=band_pixels)
+            return resize_image(small, out_w, out_h, nearest=True)
+
+    # Precompiled maps (see map_bundle.py) replace the projection entirely.
+    maps = None
+    if map_bundle is not None:
+        maps = map_bundle.get(yaw_deg, pitch_deg, h_fov_deg, v_fov_deg, roll_deg, out_w, out_h, source.width, source.height)
 
-    dirs = fwd[None, None, :] + x[..., None] * right[None, None, :] + y[..., None] * up[None, None, :]
-    norm = np.linalg.norm(dirs, axis=-1, keepdims=True)
-    dirs = dirs / np.maximum(norm, 1e-8)
+    if maps is not None and out_w * out_h <= band_pixels:
+        return _sample_source(source, np.asarray(maps[0]), np.asarray(maps[1])).astype(np.float32, copy=False)
 
-    lon, lat = dir_to_lon_lat(dirs)
-    u, v = lon_lat_to_erp(lon, lat, erp_rgb.shape[1], erp_rgb.shape[0])
+    if out_w * out_h <= band_pixels:
+        u, v = cutout_uv_maps(
+            yaw_deg, pitch_deg, h_fov_deg, v_fov_deg, roll_deg,
+            out_w, out_h, source.width, source.height,
+            fast_math=fast_math,
+        )
+        return _sample_source(source, u, v).astype(np.float32, copy=False)
 
-    return sample_erp_bilinear(erp_rgb, u, v).astype(np.float32)
+    # Streaming path: maps are built (or read from the bundle) per row band and
+    # never cached, and the fast-math approximation is not used.
+    out = np.empty((out_h, out_w, source.channels), dtype=np.float32)
+    rotation = _shot_rotation(yaw_deg, pitch_deg, roll_deg)
+    band_rows = max(1, band_pixels // out_w)
+    for row0 in range(0, out_h, band_rows):
+        row1 = min(out_h, row0 + band_rows)
+        if maps is not None:
+            out[row0:row1] = _sample_source(source, np.asarray(maps[0][row0:row1]), np.asarray(maps[1][row0:row1]))
+        else:
+            out[row0:row1] = _cutout_band(source, rotation, h_fov_deg, v_fov_deg, out_w, out_h, row0, row1)
+    return out
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import logging
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from . import profiling
+from .cutout import cutout_uv_maps
+from .model import compile_shot
+
+MAP_BUNDLE_FORMAT = "pano_map_bundle"
+MAP_BUNDLE_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+# PanoramaCutoutNode.MAX_OUTPUT_SIDE; bundles must resolve sizes the way the node does.
+DEFAULT_MAX_SIDE = 16384
+
+
+def _geometry(yaw_deg, pitch_deg, h_fov_deg, v_fov_deg, roll_deg, out_w, out_h, erp_w, erp_h) -> dict:
+    return {
+        "yaw_deg": float(yaw_deg),
+        "pitch_deg": float(pitch_deg),
+        "hFOV_deg": float(h_fov_deg),
+        "vFOV_deg": float(v_fov_deg),
+        "roll_deg": float(roll_deg),
+        "out_w": max(8, int(out_w)),
+        "out_h": max(8, int(out_h)),
+        "erp_w": int(erp_w),
+        "erp_h": int(erp_h),
+    }
+
+
+def map_key(yaw_deg, pitch_deg, h_fov_deg, v_fov_deg, roll_deg, out_w, out_h, erp_w, erp_h) -> str:
+    geom = _geometry(yaw_deg, pitch_deg, h_fov_deg, v_fov_deg, roll_deg, out_w, out_h, erp_w, erp_h)
+    text = json.dumps(geom, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:20]
+
+
+def compile_map_bundle(
+    shots: list[dict],
+    erp_w: int,
+    erp_h: int,
+    out_dir: str | Path,
+    fast_math: bool = False,
+    megapixels: float = 1.0,
+    max_side: int = DEFAULT_MAX_SIDE,
+) -> Path:
+    """Writes the (u, v) maps of every shot for one ERP size to ``out_dir``.
+
+    Shots use the state JSON keys (``yaw_deg``, ``hFOV_deg``, ``out_w``, ...) and
+    are resolved like the cutout node does: FOVs clamped by compile_shot and the
+    size from Shot.output_size(megapixels, max_side), so pass the node's
+    ``output_megapixels``. Maps are stored as float32 ``.npy`` files next to a
+    ``manifest.json`` and are memory-mapped on load. Compiling into an existing
+    bundle adds to it.
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    manifest_path = out / MANIFEST_NAME
+    entries = {}
+    if manifest_path.exists():
+        entries = _read_manifest(manifest_path)["maps"]
+
+    for raw in shots:
+        shot = compile_shot(raw)
+        if shot is None:
+            continue
+        out_w, out_h = shot.output_size(megapixels, max_side)
+        geom = _geometry(
+            shot.yaw_deg, shot.pitch_deg, shot.hfov_deg, shot.vfov_deg, shot.roll_deg,
+            out_w, out_h, erp_w, erp_h,
+        )
+        key = map_key(*geom.values())
+        u, v = cutout_uv_maps(
+            geom["yaw_deg"], geom["pitch_deg"], geom["hFOV_deg"], geom["vFOV_deg"], geom["roll_deg"],
+            geom["out_w"], geom["out_h"], geom["erp_w"], geom["erp_h"],
+            fast_math=fast_math,
+        )
+        np.save(out / f"{key}_u.npy", np.ascontiguousarray(u, dtype=np.float32))
+        np.save(out / f"{key}_v.npy", np.ascontiguousarray(v, dtype=np.float32))
+        entries[key] = {**geom, "fast_math": bool(fast_math), "u": f"{key}_u.npy", "v": f"{key}_v.npy"}
+
+    manifest = {"format": MAP_BUNDLE_FORMAT, "version": MAP_BUNDLE_VERSION, "maps": entries}
+    tmp = manifest_path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+    tmp.replace(manifest_path)
+    return out
+
+
+def _read_manifest(path: Path) -> dict:
+    manifest = json.loads(path.read_text(encoding="utf-8"))
+    if not isinstance(manifest, dict) or manifest.get("format") != MAP_BUNDLE_FORMAT:
+        raise ValueError(f"{path} is not a map bundle manifest")
+    if manifest.get("version") != MAP_BUNDLE_VERSION:
+        raise ValueError(f"map bundle version {manifest.get('version')} is not supported (expected {MAP_BUNDLE_VERSION})")
+    if not isinstance(manifest.get("maps"), dict):
+        raise ValueError(f"{path} has no map table")
+    return manifest
+
+
+class MapBundle:
+    """Read-only view of a compiled map bundle; maps are memory-mapped on first use."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._entries = _read_manifest(self.path / MANIFEST_NAME)["maps"]
+        self._loaded = {}
+        self._missed = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, yaw_deg, pitch_deg, h_fov_deg, v_fov_deg, roll_deg, out_w, out_h, erp_w, erp_h):
+        key = map_key(yaw_deg, pitch_deg, h_fov_deg, v_fov_deg, roll_deg, out_w, out_h, erp_w, erp_h)
+        maps = self._loaded.get(key)
+        if maps is None:
+            entry = self._entries.get(key)
+            if entry is None:
+                if key not in self._missed:
+                    # Logged once per geometry: the caller falls back to computing the maps.
+                    self._missed.add(key)
+                    logging.getLogger(__name__).warning(
+                        "Map bundle %s has no maps for yaw=%g pitch=%g fov=%gx%g roll=%g size=%dx%d erp=%dx%d; computing them",
+                        self.path, yaw_deg, pitch_deg, h_fov_deg, v_fov_deg, roll_deg, out_w, out_h, erp_w, erp_h,
+                    )
+                return None
+            maps = (
+                np.load(self.path / entry["u"], mmap_mode="r"),
+                np.load(self.path / entry["v"], mmap_mode="r"),
+            )
+            self._loaded[key] = maps
+        return maps
+
+
+@lru_cache(maxsize=4)
+def _load_map_bundle(path: str, mtime_ns: int) -> MapBundle:
+    return MapBundle(path)
+
+
+profiling.register_cache("map_bundle.bundles", _load_map_bundle)
+
+
+def load_map_bundle(path: str | Path) -> MapBundle:
+    # Cached per manifest version, so recompiling a bundle is picked up.
+    p = Path(path).resolve()
+    return _load_map_bundle(str(p), (p / MANIFEST_NAME).stat().st_mtime_ns)
@@ -1,6 +1,8 @@
 import math
 import numpy as np
 
+from . import profiling
+
 try:
     import torch
     import torch.nn.functional as F
@@ -15,6 +17,8 @@ except ImportError:
     HAS_CV2 = False
 
 
+SAMPLE_BACKEND = "torch" if HAS_TORCH else ("cv2" if HAS_CV2 else "numpy")
+
 DEG2RAD = math.pi / 180.0
 RAD2DEG = 180.0 / math.pi
 
@@ -55,24 +59,38 @@ def lon_lat_to_erp(lon: np.ndarray, lat: np.ndarray, w: int, h: int) -> tuple[np
     return u, v
 
 
-def sample_erp_bilinear(erp: np.ndarray, u: np.ndarray, v: np.ndarray) -> np.ndarray:
-    """Samples an Equirectangular image using bilinear interpolation with horizontal wrapping."""
+def sample_erp_bilinear(erp: np.ndarray, u: np.ndarray, v: np.ndarray, wrap: bool = True) -> np.ndarray:
+    """Samples an Equirectangular image using bilinear interpolation with horizontal wrapping.
+
+    With wrap=False the image is treated as a crop that already contains every
+    column the map touches, and no wrap padding is added.
+    """
+    with profiling.span("math.sample", backend=SAMPLE_BACKEND, pixels=int(np.size(u))):
+        return _sample_erp_bilinear(erp, u, v, wrap)
+
+
+def _sample_erp_bilinear(erp: np.ndarray, u: np.ndarray, v: np.ndarray, wrap: bool) -> np.ndarray:
     h, w, c = erp.shape
     # Normalize coordinates to ensure correct wrapping and clipping across all paths
-    u = np.mod(u, w)
+    u = np.mod(u, w) if wrap else np.clip(u, 0.0, w - 1.0)
     v = np.clip(v, 0.0, h - 1.0)
 
     if HAS_TORCH:
-        # Ensure contiguous and correct dtype for torch
         # erp is (H, W, C) -> torch needs (B, C, H, W)
+        # Flipped or channel-reversed views have negative strides torch cannot wrap;
+        # contiguous input is not copied.
         t_erp = torch.from_numpy(np.ascontiguousarray(erp)).to(torch.float32).permute(2, 0, 1)[None, ...]
-        # Pad horizontally for wrapping
-        t_erp_padded = torch.cat([t_erp, t_erp[:, :, :, :1]], dim=3)
+        if wrap:
+            # Pad horizontally for wrapping
+            t_erp = torch.cat([t_erp, t_erp[:, :, :, :1]], dim=3)
+            u_denom = float(w)
+        else:
+            u_denom = float(w - 1) if w > 1 else 1.0
 
         # Grid sample coordinates in [-1, 1]
         # x corresponds to u (width), y corresponds to v (height)
-        # padded width is w+1. index 0 maps to -1, index w maps to 1.
-        grid_u = (torch.from_numpy(np.ascontiguousarray(u)).to(torch.float32) / w) * 2.0 - 1.0
+        # with wrap the padded width is w+1: index 0 maps to -1, index w maps to 1.
+        grid_u = (torch.from_numpy(np.ascontiguousarray(u)).to(torch.float32) / u_denom) * 2.0 - 1.0
 
         # Avoid division by zero if h=1
         v_denom = float(h - 1) if h > 1 else 1.0
@@ -81,13 +99,13 @@ def sample_erp_bilinear(erp: np.ndarray, u: np.ndarray, v: np.ndarray) -> np.nda
         grid = torch.stack([grid_u, grid_v], dim=-1)[None, ...]
 
         # Note: we use align_corners=True to exactly match pixel center sampling
-        out = F.grid_sample(t_erp_padded, grid, mode='bilinear', padding_mode='border', align_corners=True)
+        out = F.grid_sample(t_erp, grid, mode='bilinear', padding_mode='border', align_corners=True)
         return out[0].permute(1, 2, 0).cpu().numpy().astype(erp.dtype)
 
     if HAS_CV2:
         # Optimize by using cv2.remap. To handle horizontal wrapping (longitude),
         # we pad the image by 1 pixel on the right side.
-        erp_padded = np.concatenate([erp, erp[:, :1, :]], axis=1)
+        erp_padded = np.concatenate([erp, erp[:, :1, :]], axis=1) if wrap else np.ascontiguousarray(erp)
         # Using BORDER_REPLICATE for the vertical axis (latitude) to match np.clip.
         # The horizontal axis wrapping is handled by the padding + u coordinates in [0, w].
         return cv2.remap(
@@ -101,7 +119,7 @@ def sample_erp_bilinear(erp: np.ndarray, u: np.ndarray, v: np.ndarray) -> np.nda
     # Manual NumPy fallback
     x0 = np.floor(u).astype(np.int32)
     y0 = np.floor(v).astype(np.int32)
-    x1 = (x0 + 1) % w
+    x1 = (x0 + 1) % w if wrap else np.minimum(x0 + 1, w - 1)
     y1 = np.clip(y0 + 1, 0, h - 1)
 
     fx = (u - x0)[..., None]
@@ -117,6 +135,109 @@ def sample_erp_bilinear(erp: np.ndarray, u: np.ndarray, v: np.ndarray) -> np.nda
     return c0 * (1.0 - fy) + c1 * fy
 
 
+# "preview" quality renders at PREVIEW_RENDER_SCALE of the output size per side
+# (the long side stays at least PREVIEW_MIN_SIDE) with cheap sampling, then
+# upscales; "export" renders at full size.
+QUALITY_MODES = ("export", "preview")
+PREVIEW_RENDER_SCALE = 0.25
+PREVIEW_MIN_SIDE = 64
+
+
+def preview_render_size(out_w: int, out_h: int, scale: float = PREVIEW_RENDER_SCALE) -> tuple[int, int]:
+    long_side = max(int(out_w), int(out_h), 1)
+    s = min(1.0, max(float(scale), PREVIEW_MIN_SIDE / long_side))
+    return max(1, int(round(out_w * s))), max(1, int(round(out_h * s)))
+
+
+def resize_image(img: np.ndarray, out_w: int, out_h: int, nearest: bool = False) -> np.ndarray:
+    """Resizes an (H, W, C) float image: area filter when shrinking, bilinear otherwise.
+
+    ``nearest`` picks the source pixel under each output pixel center instead,
+    which is several times cheaper when upscaling.
+    """
+    h, w = img.shape[:2]
+    if (h, w) == (out_h, out_w):
+        return img
+    with profiling.span("math.resize", w=int(out_w), h=int(out_h), nearest=bool(nearest)):
+        return _resize_image(img, out_w, out_h, nearest)
+
+
+def _resize_image(img: np.ndarray, out_w: int, out_h: int, nearest: bool) -> np.ndarray:
+    h, w = img.shape[:2]
+    if nearest:
+        xi = np.minimum((np.arange(out_w) + 0.5) * (w / out_w), w - 1).astype(np.intp)
+        yi = np.minimum((np.arange(out_h) + 0.5) * (h / out_h), h - 1).astype(np.intp)
+        return np.take(np.take(img, yi, axis=0), xi, axis=1)
+    shrink = out_w <= w and out_h <= h
+    if HAS_TORCH:
+        t = torch.from_numpy(np.ascontiguousarray(img, dtype=np.float32)).permute(2, 0, 1)[None]
+        if shrink:
+            t = F.interpolate(t, size=(out_h, out_w), mode="area")
+        else:
+            t = F.interpolate(t, size=(out_h, out_w), mode="bilinear", align_corners=False)
+        return t[0].permute(1, 2, 0).contiguous().numpy()
+    if HAS_CV2 and img.shape[2] <= 4:
+        out = cv2.resize(
+            np.ascontiguousarray(img, dtype=np.float32),
+            (out_w, out_h),
+            interpolation=cv2.INTER_AREA if shrink else cv2.INTER_LINEAR,
+        )
+        return out.reshape(out_h, out_w, -1)
+
+    # Manual NumPy fallback: separable linear interpolation between pixel centers.
+    def axis(n_out, n_in):
+        f = np.clip((np.arange(n_out, dtype=np.float32) + 0.5) * (n_in / n_out) - 0.5, 0.0, n_in - 1.0)
+        i0 = np.floor(f).astype(np.int32)
+        return i0, np.minimum(i0 + 1, n_in - 1), f - i0
+
+    x0, x1, tx = axis(out_w, w)
+    y0, y1, ty = axis(out_h, h)
+    img = np.asarray(img, dtype=np.float32)
+    rows = img[:, x0] * (1.0 - tx)[None, :, None] + img[:, x1] * tx[None, :, None]
+    return rows[y0] * (1.0 - ty)[:, None, None] + rows[y1] * ty[:, None, None]
+
+
+def resize_erp(erp: np.ndarray, out_w: int, out_h: int) -> np.ndarray:
+    """Resizes an equirectangular (H, W, C) float image.
+
+    Shrinking uses the area filter of resize_image, whose bins never straddle
+    the frame edge. Enlarging is bilinear with columns wrapping across the
+    +-180 degree seam, so the two edges blend into each other instead of
+    clamping.
+    """
+    h, w = erp.shape[:2]
+    if (h, w) == (out_h, out_w):
+        return erp
+    with profiling.span("math.resize_erp", w=int(out_w), h=int(out_h)):
+        if out_w <= w and out_h <= h:
+            return _resize_image(erp, out_w, out_h, False)
+        return _resize_erp_bilinear(np.asarray(erp, dtype=np.float32), out_w, out_h)
+
+
+def _resize_erp_bilinear(erp: np.ndarray, out_w: int, out_h: int) -> np.ndarray:
+    h, w = erp.shape[:2]
+    x = (np.arange(out_w, dtype=np.float64) + 0.5) * (w / out_w) - 0.5
+    x0 = np.floor(x)
+    tx = (x - x0).astype(np.float32)[None, :, None]
+    x0 = x0.astype(np.intp) % w
+    rows = np.take(erp, x0, axis=1)
+    right = np.take(erp, (x0 + 1) % w, axis=1)
+    right -= rows
+    right *= tx
+    rows += right
+    del right
+
+    y = np.clip((np.arange(out_h, dtype=np.float64) + 0.5) * (h / out_h) - 0.5, 0.0, h - 1.0)
+    y0 = np.floor(y).astype(np.intp)
+    ty = (y - y0).astype(np.float32)[:, None, None]
+    out = np.take(rows, y0, axis=0)
+    below = np.take(rows, np.minimum(y0 + 1, h - 1), axis=0)
+    below -= out
+    below *= ty
+    out += below
+    return out
+
+
 def round_to_multiple(x: float, multiple: int = 8, min_val: int = 8) -> int:
     if multiple <= 0:
         raise ValueError("multiple must be > 0")
@@ -197,6 +318,14 @@ def orthonormal_basis_from_forward(forward: np.ndarray) -> tuple[np.ndarray, np.
     up = up / (np.linalg.norm(up) + 1e-8)
     return right, up, f
 
+
+def basis_is_yaw_equivariant(pitch_deg: float) -> bool:
+    # orthonormal_basis_from_forward switches its reference axis near the poles;
+    # everywhere else a yaw change rotates the whole basis about +Y, which in an
+    # ERP is a pure horizontal shift.
+    return abs(math.sin(pitch_deg * DEG2RAD)) <= 0.998
+
+
 def finite_float(value, default: float = 0.0) -> float:
     try:
         out = float(value)
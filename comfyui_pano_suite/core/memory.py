@@ -0,0 +1,164 @@
+import contextlib
+import logging
+import math
+import os
+import re
+import threading
+import tracemalloc
+
+from . import profiling
+
+# Compose and cutout estimate their peak working set from the shapes before
+# running and switch to row bands when it would exceed the budget. The budget
+# is MEMORY_BUDGET_ENV (e.g. "2G", "512M" or plain bytes) or
+# DEFAULT_MEMORY_BUDGET. The per-pixel costs below were measured with
+# tracemalloc on the NumPy paths, plus the torch sampler's grid and copies.
+MEMORY_BUDGET_ENV = "PANO_SUITE_MEMORY_BUDGET"
+DEFAULT_MEMORY_BUDGET = 4 << 30
+
+CUTOUT_BYTES_PER_PIXEL = 100
+STICKER_PATCH_BYTES_PER_PIXEL = 140
+STICKER_PATCH_NEAREST_BYTES_PER_PIXEL = 70
+MIN_BAND_ROWS = 8
+
+_UNITS = {"": 1, "b": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40}
+_BYTES_RE = re.compile(r"^\s*([0-9]*\.?[0-9]+)\s*([kmgt]?)(?:i?b)?\s*$", re.IGNORECASE)
+
+_local = threading.local()
+# tracemalloc is process-wide: one block at a time owns it.
+_trace_lock = threading.Lock()
+
+
+def parse_bytes(value) -> int | None:
+    # "512M", "2G", "1.5GiB", "1000000" -> bytes; None when unparseable.
+    if isinstance(value, (int, float)):
+        return int(value) if value > 0 else None
+    m = _BYTES_RE.match(str(value or ""))
+    if not m:
+        return None
+    n = int(float(m.group(1)) * _UNITS[m.group(2).lower()])
+    return n if n > 0 else None
+
+
+def memory_budget() -> int:
+    raw = os.environ.get(MEMORY_BUDGET_ENV)
+    if raw:
+        parsed = parse_bytes(raw)
+        if parsed is not None:
+            return parsed
+        logging.getLogger(__name__).warning("Ignoring invalid %s=%r", MEMORY_BUDGET_ENV, raw)
+    return DEFAULT_MEMORY_BUDGET
+
+
+def cutout_footprint_rows(rows: int, out_h: int, erp_h: int, h_fov_deg: float, v_fov_deg: float) -> int:
+    # Source rows a band of ``rows`` output rows can touch; the frame diagonal
+    # bounds its angular extent whatever the roll.
+    diag = math.degrees(2.0 * math.atan(math.hypot(
+        math.tan(math.radians(min(h_fov_deg, 179.0)) * 0.5),
+        math.tan(math.radians(min(v_fov_deg, 179.0)) * 0.5),
+    )))
+    frac = min(1.0, diag / 180.0) * rows / max(out_h, 1)
+    return min(erp_h, int(math.ceil(frac * erp_h)) + 2)
+
+
+def estimate_cutout_bytes(
+    out_w: int, out_h: int, rows: int, erp_w: int, erp_h: int, channels: int, h_fov_deg: float, v_fov_deg: float,
+    cache_bytes_per_pixel: int = 0,
+) -> int:
+    """Peak bytes of a cutout processed in bands of ``rows`` output rows.
+
+    Unbanded cutouts keep their maps and rays in lru caches; ``cache_bytes_per_pixel``
+    is what those caches can retain per output pixel when full of this size.
+    """
+    output = out_w * out_h * channels * 4
+    band = out_w * rows * CUTOUT_BYTES_PER_PIXEL
+    # Footprint converted to float32, plus the sampler's seam padding copy.
+    footprint = cutout_footprint_rows(rows, out_h, erp_h, h_fov_deg, v_fov_deg) * erp_w * channels * 4 * 2
+    cached = out_w * out_h * cache_bytes_per_pixel if rows >= out_h else 0
+    return output + band + footprint + cached
+
+
+def plan_cutout_band_rows(
+    out_w: int, out_h: int, erp_w: int, erp_h: int, channels: int, h_fov_deg: float, v_fov_deg: float,
+    budget: int | None = None, cache_bytes_per_pixel: int = 0,
+) -> tuple[int, int]:
+    """(rows per band, estimated peak bytes); out_h rows means no banding."""
+    budget = memory_budget() if budget is None else int(budget)
+    rows = out_h
+    est = estimate_cutout_bytes(out_w, out_h, rows, erp_w, erp_h, channels, h_fov_deg, v_fov_deg, cache_bytes_per_pixel)
+    while est > budget and rows > MIN_BAND_ROWS:
+        rows = max(MIN_BAND_ROWS, rows // 2)
+        est = estimate_cutout_bytes(out_w, out_h, rows, erp_w, erp_h, channels, h_fov_deg, v_fov_deg, cache_bytes_per_pixel)
+    if est > budget:
+        logging.getLogger(__name__).warning(
+            "Cutout %dx%d needs about %.0f MB, over the %.0f MB memory budget even in %d-row bands",
+            out_w, out_h, est / 1e6, budget / 1e6, rows,
+        )
+    return rows, est
+
+
+def estimate_compose_bytes(out_w: int, out_h: int, bg_shape: tuple | None, patch_pixels: int, nearest: bool = False, itemsize: int = 4) -> int:
+    """Peak bytes of a compose whose largest sticker band covers ``patch_pixels``.
+
+    ``itemsize`` is the canvas storage size per channel (4, 2 or 1 bytes).
+    """
+    canvas = out_w * out_h * 3 * itemsize
+    bg = 0
+    if bg_shape is not None and (bg_shape[0], bg_shape[1]) != (out_h, out_w):
+        # Same-size backgrounds are written straight into the canvas; a resize
+        # holds a float32 copy of the input, the result and one intermediate.
+        bg = (bg_shape[0] * bg_shape[1] + bg_shape[0] * out_w + out_w * out_h) * 3 * 4
+    per_px = STICKER_PATCH_NEAREST_BYTES_PER_PIXEL if nearest else STICKER_PATCH_BYTES_PER_PIXEL
+    return canvas + bg + patch_pixels * per_px
+
+
+def plan_compose_band_rows(out_w: int, out_h: int, bg_shape: tuple | None, max_patch: tuple[int, int], nearest: bool = False, budget: int | None = None, itemsize: int = 4) -> tuple[int | None, int]:
+    """(rows per sticker band or None for whole patches, estimated peak bytes)."""
+    budget = memory_budget() if budget is None else int(budget)
+    rows, cols = max_patch
+    est = estimate_compose_bytes(out_w, out_h, bg_shape, rows * cols, nearest, itemsize)
+    if est <= budget or rows <= MIN_BAND_ROWS:
+        return None, est
+    fixed = estimate_compose_bytes(out_w, out_h, bg_shape, 0, nearest, itemsize)
+    per_px = STICKER_PATCH_NEAREST_BYTES_PER_PIXEL if nearest else STICKER_PATCH_BYTES_PER_PIXEL
+    band = max(MIN_BAND_ROWS, (budget - fixed) // max(1, cols * per_px)) if budget > fixed else MIN_BAND_ROWS
+    est = fixed + min(rows, band) * cols * per_px
+    if est > budget:
+        logging.getLogger(__name__).warning(
+            "Compose %dx%d needs about %.0f MB, over the %.0f MB memory budget", out_w, out_h, est / 1e6, budget / 1e6,
+        )
+    return int(min(rows, band)), est
+
+
+@contextlib.contextmanager
+def track_peak(name: str, **fields):
+    """With profiling on, records the peak of traced (NumPy/Python) allocations
+    in the block as a ``name`` event; nested blocks are covered by the outermost.
+
+    Yields a dict whose entries are added to the event (e.g. the estimate).
+    Tracing is process-wide, so only a block that can start it itself measures:
+    while another thread's block or someone else's tracemalloc session is
+    active, the event has ``peak_bytes`` None rather than a figure the other
+    side could reset. Allocations by other threads during the block count.
+    """
+    fields = dict(fields)
+    if not profiling.enabled() or getattr(_local, "active", False):
+        yield fields
+        return
+    owned = _trace_lock.acquire(blocking=False)
+    if owned and tracemalloc.is_tracing():
+        _trace_lock.release()
+        owned = False
+    _local.active = True
+    try:
+        if owned:
+            tracemalloc.start()
+        yield fields
+    finally:
+        _local.active = False
+        peak = None
+        if owned:
+            peak = int(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            _trace_lock.release()
+        profiling.event(name, peak_bytes=peak, **fields)
@@ -0,0 +1,134 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from .math import calculate_dimensions_from_megapixels, finite_float, finite_int
+
+
+@dataclass(frozen=True, slots=True)
+class Sticker:
+    id: str
+    asset_id: str
+    yaw_deg: float
+    pitch_deg: float
+    hfov_deg: float
+    vfov_deg: float
+    rot_deg: float
+    crop: tuple[float, float, float, float]
+    z_index: float
+
+
+@dataclass(frozen=True, slots=True)
+class Shot:
+    id: str = ""
+    yaw_deg: float = 0.0
+    pitch_deg: float = 0.0
+    hfov_deg: float = 90.0
+    vfov_deg: float = 60.0
+    roll_deg: float = 0.0
+    out_w: int = 1024
+    out_h: int = 1024
+
+    def output_size(self, megapixels: float, max_side: int) -> tuple[int, int]:
+        # The editor's default 1024x1024 (or an unset size) means "derive from
+        # megapixels"; anything else is an explicit size.
+        if self.out_w <= 0 or self.out_h <= 0 or (self.out_w == 1024 and self.out_h == 1024):
+            return calculate_dimensions_from_megapixels(
+                max(0.01, finite_float(megapixels, 1.0)), self.hfov_deg, self.vfov_deg, max_side=max_side
+            )
+        return int(np.clip(self.out_w, 8, max_side)), int(np.clip(self.out_h, 8, max_side))
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledState:
+    bg_color: str
+    assets: dict
+    stickers: tuple[Sticker, ...]
+    shots: tuple[Shot, ...]
+
+    def sticker_array(self) -> np.ndarray:
+        """(N, 5) yaw, pitch, hFOV, vFOV, rotation of the drawable stickers in draw order."""
+        return np.array(
+            [(s.yaw_deg, s.pitch_deg, s.hfov_deg, s.vfov_deg, s.rot_deg) for s in self.stickers],
+            dtype=np.float64,
+        ).reshape(-1, 5)
+
+    def shot_array(self) -> np.ndarray:
+        """(N, 5) yaw, pitch, hFOV, vFOV, roll of every shot."""
+        return np.array(
+            [(s.yaw_deg, s.pitch_deg, s.hfov_deg, s.vfov_deg, s.roll_deg) for s in self.shots],
+            dtype=np.float64,
+        ).reshape(-1, 5)
+
+
+def _compile_crop(crop) -> tuple[float, float, float, float] | None:
+    if not isinstance(crop, dict):
+        crop = {}
+    x0 = finite_float(crop.get("x0", 0.0), 0.0)
+    y0 = finite_float(crop.get("y0", 0.0), 0.0)
+    x1 = finite_float(crop.get("x1", 1.0), 1.0)
+    y1 = finite_float(crop.get("y1", 1.0), 1.0)
+    cx0 = max(0.0, min(1.0, min(x0, x1)))
+    cy0 = max(0.0, min(1.0, min(y0, y1)))
+    cx1 = max(0.0, min(1.0, max(x0, x1)))
+    cy1 = max(0.0, min(1.0, max(y0, y1)))
+    if cx1 - cx0 < 1e-6 or cy1 - cy0 < 1e-6:
+        return None
+    return cx0, cy0, cx1, cy1
+
+
+def compile_sticker(st: dict, assets: dict) -> Sticker | None:
+    # None for stickers that cannot draw: unknown asset or an empty crop.
+    if not isinstance(st, dict) or st.get("asset_id") not in assets:
+        return None
+    crop = _compile_crop(st.get("crop"))
+    if crop is None:
+        return None
+    return Sticker(
+        id=str(st.get("id") or ""),
+        asset_id=st.get("asset_id"),
+        yaw_deg=finite_float(st.get("yaw_deg", 0.0), 0.0),
+        pitch_deg=finite_float(st.get("pitch_deg", 0.0), 0.0),
+        hfov_deg=max(0.1, finite_float(st.get("hFOV_deg", 20.0), 20.0)),
+        vfov_deg=max(0.1, finite_float(st.get("vFOV_deg", 20.0), 20.0)),
+        rot_deg=finite_float(st.get("rot_deg", 0.0), 0.0),
+        crop=crop,
+        z_index=finite_float(st.get("z_index", 0), 0.0),
+    )
+
+
+def compile_shot(shot: dict) -> Shot | None:
+    if not isinstance(shot, dict):
+        return None
+    return Shot(
+        id=str(shot.get("id") or ""),
+        yaw_deg=finite_float(shot.get("yaw_deg", 0.0), 0.0),
+        pitch_deg=finite_float(shot.get("pitch_deg", 0.0), 0.0),
+        hfov_deg=float(np.clip(finite_float(shot.get("hFOV_deg", 90.0), 90.0), 1.0, 179.0)),
+        vfov_deg=float(np.clip(finite_float(shot.get("vFOV_deg", 60.0), 60.0), 1.0, 179.0)),
+        roll_deg=finite_float(shot.get("roll_deg", 0.0), 0.0),
+        out_w=finite_int(shot.get("out_w", 1024), 1024),
+        out_h=finite_int(shot.get("out_h", 1024), 1024),
+    )
+
+
+def compile_state(state: dict) -> CompiledState:
+    """Validates and clamps a merged state once, for the render paths.
+
+    Stickers that cannot draw are dropped and the rest are sorted by z_index;
+    shots that are not objects are dropped.
+    """
+    state = state if isinstance(state, dict) else {}
+    assets = state.get("assets")
+    assets = assets if isinstance(assets, dict) else {}
+    stickers = state.get("stickers")
+    shots = state.get("shots")
+
+    compiled = [compile_sticker(st, assets) for st in (stickers if isinstance(stickers, list) else [])]
+    compiled_shots = [compile_shot(s) for s in (shots if isinstance(shots, list) else [])]
+    return CompiledState(
+        bg_color=str(state.get("bg_color") or "#00ff00"),
+        assets=assets,
+        stickers=tuple(sorted((s for s in compiled if s is not None), key=lambda s: s.z_index)),
+        shots=tuple(s for s in compiled_shots if s is not None),
+    )
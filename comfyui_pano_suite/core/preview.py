@@ -0,0 +1,206 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import uuid
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from . import profiling
+from .math import HAS_CV2, HAS_TORCH
+
+if HAS_TORCH:
+    import torch
+    import torch.nn.functional as F
+
+if HAS_CV2:
+    import cv2
+
+# Node UI previews are area-downsampled to at most PREVIEW_MAX_SIDE and encoded
+# lossy; files are named by a digest of the encoded pixels, so an unchanged
+# input reuses the file already in the temp directory.
+PREVIEW_MAX_SIDE = 2048
+PREVIEW_FORMAT = "jpeg"
+PREVIEW_QUALITY = 90
+PREVIEW_PREFIX = "pano_preview_"
+# Lower levels of the preview pyramid, written before the full preview so the
+# viewer can show something while the larger file is still on its way.
+PREVIEW_LOD_SIDES = (512,)
+
+_FORMAT_EXT = {"jpeg": "jpg", "webp": "webp", "png": "png"}
+
+
+def preview_size(h: int, w: int, max_side: int) -> tuple[int, int]:
+    scale = min(1.0, float(max_side) / float(max(h, w)))
+    return max(1, int(round(h * scale))), max(1, int(round(w * scale)))
+
+
+def downscale_to_uint8(image, max_side: int = PREVIEW_MAX_SIDE) -> np.ndarray:
+    """(H, W, C) float image in [0, 1] (tensor or array) -> (h, w, 3) uint8 with an area filter."""
+    h, w = int(image.shape[0]), int(image.shape[1])
+    oh, ow = preview_size(h, w, max_side)
+
+    if HAS_TORCH and isinstance(image, torch.Tensor):
+        t = image.detach()
+        t = t[..., :3] if t.shape[-1] >= 3 else t[..., :1].expand(h, w, 3)
+        if (oh, ow) != (h, w):
+            t = F.interpolate(t.permute(2, 0, 1)[None].float(), size=(oh, ow), mode="area")[0].permute(1, 2, 0)
+        t = (t.float() * 255.0).round_().clamp_(0.0, 255.0).to(torch.uint8)
+        return np.ascontiguousarray(t.cpu().numpy())
+
+    arr = np.asarray(image)
+    arr = arr[..., :3] if arr.shape[-1] >= 3 else np.repeat(arr[..., :1], 3, axis=-1)
+    arr = np.clip(arr.astype(np.float32) * 255.0 + 0.5, 0.0, 255.0).astype(np.uint8)
+    if (oh, ow) != (h, w):
+        if HAS_CV2:
+            arr = cv2.resize(arr, (ow, oh), interpolation=cv2.INTER_AREA)
+        else:
+            arr = np.asarray(Image.fromarray(arr).resize((ow, oh), Image.BOX))
+    return np.ascontiguousarray(arr)
+
+
+def _write_pixels(pixels: np.ndarray, out_dir: Path, fmt: str, quality: int) -> Path:
+    fmt = fmt if fmt in _FORMAT_EXT else PREVIEW_FORMAT
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{pixels.shape}|{fmt}|{quality}".encode("ascii"))
+    h.update(pixels.data)
+    name = f"{PREVIEW_PREFIX}{h.hexdigest()}.{_FORMAT_EXT[fmt]}"
+
+    path = out_dir / name
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        Image.fromarray(pixels).save(tmp, format=fmt.upper(), quality=int(quality))
+        tmp.replace(path)
+    return path
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _preview_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pano_preview")
+        return _executor
+
+
+# Entries handed out per input tensor. ComfyUI hands an unchanged upstream
+# output back as the same tensor, so a re-run returns the same filenames (and
+# URLs the browser already has) instead of linking new ones.
+RESERVED_CACHE_SIZE = 16
+_reserved = OrderedDict()
+_reserved_lock = threading.Lock()
+
+
+def _input_stamp(images):
+    # Identity plus in-place version of a torch tensor; None for other inputs,
+    # whose in-place changes cannot be detected.
+    version = getattr(images, "_version", None)
+    if version is None:
+        return None
+    return id(images), int(version), tuple(images.shape), images.data_ptr()
+
+
+def _reusable(images, stamp, options, out: Path):
+    with _reserved_lock:
+        hit = _reserved.get(stamp)
+        if hit is None:
+            return None
+        ref, hit_options, entries, future = hit
+        if ref() is not images or hit_options != options:
+            return None
+        _reserved.move_to_end(stamp)
+    if future.done() and (future.exception() is not None or not all((out / e["filename"]).exists() for e in entries)):
+        return None
+    return entries, future
+
+
+def save_previews_async(
+    images,
+    out_dir: str | Path,
+    on_ready=None,
+    max_side: int = PREVIEW_MAX_SIDE,
+    fmt: str = PREVIEW_FORMAT,
+    quality: int = PREVIEW_QUALITY,
+    lod_sides: tuple[int, ...] = PREVIEW_LOD_SIDES,
+) -> tuple[list[dict], Future]:
+    """Returns preview entries at once and writes the files on a worker thread.
+
+    Each entry's filename is reserved up front; once the digest-named preview
+    exists it is linked (or copied) to that name and ``on_ready(entries)`` runs
+    on the worker. Entries carry a ``lods`` list (smallest first) with the
+    lower pyramid levels. Passing the same, unmodified tensor again returns
+    the earlier entries and future without writing anything. ``images`` must
+    not be modified until the future is done.
+    """
+    fmt = fmt if fmt in _FORMAT_EXT else PREVIEW_FORMAT
+    out = Path(out_dir)
+    ext = _FORMAT_EXT[fmt]
+    full_side = max(preview_size(int(images.shape[1]), int(images.shape[2]), max_side))
+    sides = sorted({int(s) for s in lod_sides if 0 < int(s) < full_side})
+
+    stamp = _input_stamp(images)
+    options = (str(out), max_side, fmt, quality, tuple(sides))
+    hit = _reusable(images, stamp, options, out) if stamp is not None else None
+    if hit is not None:
+        entries, future = hit
+        if on_ready is not None:
+
+            def notify(f):
+                if f.exception() is None:
+                    on_ready(entries)
+
+            future.add_done_callback(notify)
+        return entries, future
+
+    def reserve():
+        return {"filename": f"{PREVIEW_PREFIX}{uuid.uuid4().hex}.{ext}", "subfolder": "", "type": "temp"}
+
+    entries = []
+    for _ in range(int(images.shape[0])):
+        entry = reserve()
+        entry["lods"] = [{**reserve(), "max_side": side} for side in sides]
+        entries.append(entry)
+
+    def publish(src: Path, entry: dict):
+        dst = out / entry["filename"]
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+
+    def job():
+        try:
+            for i, entry in enumerate(entries):
+                with profiling.span("preview.downscale", max_side=max_side):
+                    pixels = downscale_to_uint8(images[i], max_side)
+                # Lower levels come from the preview itself, which is cheap.
+                base = pixels.astype(np.float32) * (1.0 / 255.0)
+                for lod in entry["lods"]:
+                    publish(_write_pixels(downscale_to_uint8(base, lod["max_side"]), out, fmt, quality), lod)
+                with profiling.span("preview.encode", fmt=fmt):
+                    publish(_write_pixels(pixels, out, fmt, quality), entry)
+            if on_ready is not None:
+                on_ready(entries)
+        except Exception:
+            logging.getLogger(__name__).exception("Failed to write panorama preview")
+            raise
+        return entries
+
+    future = _preview_executor().submit(job)
+    if stamp is not None:
+        with _reserved_lock:
+            _reserved[stamp] = (weakref.ref(images), options, entries, future)
+            _reserved.move_to_end(stamp)
+            while len(_reserved) > RESERVED_CACHE_SIZE:
+                _reserved.popitem(last=False)
+    return entries, future
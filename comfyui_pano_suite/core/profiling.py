@@ -0,0 +1,135 @@
+import contextlib
+import logging
+import os
+import threading
+import time
+
+# Span timings, events and cache byte counts are recorded only when PROFILE_ENV
+# is set (e.g. PANO_SUITE_PROFILE=1). Records go to the "comfyui_pano_suite.profile"
+# logger at DEBUG, into the active collect() block (nodes put them in their ui
+# payload) and into cumulative totals served by the /pano_suite/profile route.
+PROFILE_ENV = "PANO_SUITE_PROFILE"
+
+logger = logging.getLogger("comfyui_pano_suite.profile")
+
+_enabled = os.environ.get(PROFILE_ENV, "").strip().lower() not in ("", "0", "false", "no", "off")
+_lock = threading.Lock()
+_local = threading.local()
+_span_totals = {}
+_cache_bytes = {}
+_events = {}
+_caches = {}
+_NULL = contextlib.nullcontext()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def set_enabled(value: bool):
+    global _enabled
+    _enabled = bool(value)
+
+
+class _Span:
+    __slots__ = ("name", "fields", "t0")
+
+    def __init__(self, name: str, fields: dict):
+        self.name = name
+        self.fields = fields
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        ms = (time.perf_counter() - self.t0) * 1000.0
+        record = {"span": self.name, "ms": round(ms, 3), **self.fields}
+        records = getattr(_local, "records", None)
+        if records is not None:
+            records.append(record)
+        with _lock:
+            t = _span_totals.setdefault(self.name, [0, 0.0, 0.0])
+            t[0] += 1
+            t[1] += ms
+            t[2] = max(t[2], ms)
+        logger.debug("span %s", record)
+        return False
+
+
+def span(name: str, **fields):
+    """Times the ``with`` block as ``name``; a shared no-op when profiling is off."""
+    if not _enabled:
+        return _NULL
+    return _Span(name, fields)
+
+
+def event(name: str, **fields):
+    # An untimed record, e.g. measured peak memory; snapshots keep the last one.
+    if not _enabled:
+        return
+    record = {"event": name, **fields}
+    records = getattr(_local, "records", None)
+    if records is not None:
+        records.append(record)
+    with _lock:
+        e = _events.setdefault(name, {"count": 0, "last": None})
+        e["count"] += 1
+        e["last"] = fields
+    logger.debug("event %s", record)
+
+
+@contextlib.contextmanager
+def collect():
+    # Yields the list that spans finished on this thread are appended to.
+    prev = getattr(_local, "records", None)
+    records = [] if _enabled else None
+    _local.records = records
+    try:
+        yield records
+    finally:
+        _local.records = prev
+        if records is not None and prev is not None:
+            prev.extend(records)
+
+
+def register_cache(name: str, fn):
+    # ``fn`` is an lru_cache wrapper; its cache_info() is read on snapshot.
+    _caches[name] = fn
+    return fn
+
+
+def add_cache_bytes(name: str, nbytes: int):
+    # Called on a cache miss with the size of the value that was stored.
+    if not _enabled:
+        return
+    with _lock:
+        _cache_bytes[name] = _cache_bytes.get(name, 0) + int(nbytes)
+
+
+def snapshot() -> dict:
+    with _lock:
+        spans = {
+            name: {"count": c, "total_ms": round(total, 3), "mean_ms": round(total / c, 3) if c else 0.0, "max_ms": round(mx, 3)}
+            for name, (c, total, mx) in sorted(_span_totals.items())
+        }
+        loaded = dict(_cache_bytes)
+        events = {name: dict(e) for name, e in sorted(_events.items())}
+    caches = {}
+    for name, fn in sorted(_caches.items()):
+        info = fn.cache_info()
+        caches[name] = {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+            "bytes_loaded": loaded.get(name, 0),
+        }
+    return {"enabled": _enabled, "spans": spans, "caches": caches, "events": events}
+
+
+def reset():
+    with _lock:
+        _span_totals.clear()
+        _cache_bytes.clear()
+        _events.clear()
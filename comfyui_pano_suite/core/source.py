@@ -0,0 +1,102 @@
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import tifffile
+    HAS_TIFFFILE = True
+except ImportError:
+    HAS_TIFFFILE = False
+
+try:
+    import zarr
+    HAS_ZARR = True
+except ImportError:
+    HAS_ZARR = False
+
+
+class ErpSource:
+    """Lazy (H, W, C) ERP access that only materializes the requested region.
+
+    Wraps anything with ``shape``, ``dtype`` and NumPy-style slicing: in-memory
+    arrays, ``np.memmap`` and tiled stores. Reads come back as float32 in [0, 1]
+    for integer sources.
+    """
+
+    def __init__(self, array):
+        if len(array.shape) not in (2, 3):
+            raise ValueError(f"ERP source must be 2D or 3D, got shape {tuple(array.shape)}")
+        self._array = array
+
+    @property
+    def height(self) -> int:
+        return int(self._array.shape[0])
+
+    @property
+    def width(self) -> int:
+        return int(self._array.shape[1])
+
+    @property
+    def channels(self) -> int:
+        return int(self._array.shape[2]) if len(self._array.shape) == 3 else 1
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        return self.height, self.width, self.channels
+
+    def read(self, row0: int, row1: int, col0: int = 0, col1: int | None = None) -> np.ndarray:
+        # Columns may run past the right edge (col1 > width); they wrap to the left.
+        w = self.width
+        col1 = w if col1 is None else col1
+        row0 = max(0, int(row0))
+        row1 = min(self.height, int(row1))
+        if col0 == 0 and col1 == w:
+            block = np.asarray(self._array[row0:row1])
+        elif col1 <= w:
+            block = np.asarray(self._array[row0:row1, col0:col1])
+        else:
+            block = np.concatenate([
+                np.asarray(self._array[row0:row1, col0:w]),
+                np.asarray(self._array[row0:row1, 0:col1 - w]),
+            ], axis=1)
+        if block.ndim == 2:
+            block = block[..., None]
+        return _to_float01(block)
+
+
+def _to_float01(block: np.ndarray) -> np.ndarray:
+    if np.issubdtype(block.dtype, np.integer):
+        return block.astype(np.float32) / float(np.iinfo(block.dtype).max)
+    if not block.flags.writeable:
+        # Read-only memory maps are copied so samplers get an owned array.
+        return np.array(block, dtype=np.float32)
+    return block.astype(np.float32, copy=False)
+
+
+def open_erp_source(
+    path: str | Path,
+    shape: tuple[int, ...] | None = None,
+    dtype: str | np.dtype | None = None,
+) -> ErpSource:
+    """Opens an ERP file without reading its pixels.
+
+    ``.npy`` files and raw files (``shape`` and ``dtype`` required) are
+    memory-mapped. TIFFs need ``tifffile``: uncompressed ones are memory-mapped,
+    tiled or compressed ones are read tile by tile through ``zarr``.
+    """
+    p = Path(path)
+    suffix = p.suffix.lower()
+    if suffix == ".npy":
+        return ErpSource(np.load(p, mmap_mode="r"))
+    if suffix in (".tif", ".tiff"):
+        if not HAS_TIFFFILE:
+            raise ValueError("reading TIFF ERP sources requires tifffile")
+        try:
+            return ErpSource(tifffile.memmap(p, mode="r"))
+        except ValueError:
+            if not HAS_ZARR:
+                raise ValueError("compressed or tiled TIFF ERP sources require zarr") from None
+            return ErpSource(zarr.open(tifffile.imread(p, aszarr=True), mode="r"))
+    if shape is None or dtype is None:
+        raise ValueError("raw ERP sources need an explicit shape and dtype")
+    return ErpSource(np.memmap(p, mode="r", dtype=np.dtype(dtype), shape=tuple(shape)))
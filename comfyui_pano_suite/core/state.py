@@ -1,6 +1,17 @@
+import hashlib
 import json
+import threading
 import uuid
-from copy import deepcopy
+from collections import OrderedDict
+from functools import lru_cache
+
+from . import profiling
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
 
 DEFAULT_STATE = {
     "version": 1,
@@ -23,9 +34,23 @@ def make_id(prefix: str) -> str:
 
 
 def merge_state(state_in: str | None, internal_state: str | None, fallback_preset: int = 2048, fallback_bg: str = "#00ff00") -> dict:
-    state = deepcopy(DEFAULT_STATE)
+    """Returns a normalized state dict.
+
+    The top-level dict and "active" are fresh; assets, stickers and shots are
+    shared with the parse memo and must be treated as read-only.
+    """
+    with profiling.span("state.merge"):
+        return _merge_state(state_in, internal_state, fallback_preset, fallback_bg)
+
+
+def _merge_state(state_in, internal_state, fallback_preset, fallback_bg) -> dict:
+    state = dict(DEFAULT_STATE)
     state["output_preset"] = int(fallback_preset)
     state["bg_color"] = fallback_bg
+    state["assets"] = {}
+    state["stickers"] = []
+    state["shots"] = []
+    state["active"] = None
 
     for src in (internal_state, state_in):
         parsed = parse_state(src)
@@ -36,18 +61,16 @@ def merge_state(state_in: str | None, internal_state: str | None, fallback_prese
     state["version"] = 1
     state["projection_model"] = "pinhole_rectilinear"
     state["alpha_mode"] = "straight"
-    if "assets" not in state or not isinstance(state["assets"], dict):
+    if not isinstance(state["assets"], dict):
         state["assets"] = {}
-    if "stickers" not in state or not isinstance(state["stickers"], list):
+    if not isinstance(state["stickers"], list):
         state["stickers"] = []
-    if "shots" not in state or not isinstance(state["shots"], list):
+    if not isinstance(state["shots"], list):
         state["shots"] = []
-    if "active" not in state or not isinstance(state["active"], dict):
-        state["active"] = deepcopy(DEFAULT_STATE["active"])
-    if "selected_sticker_id" not in state["active"]:
-        state["active"]["selected_sticker_id"] = None
-    if "selected_shot_id" not in state["active"]:
-        state["active"]["selected_shot_id"] = None
+    active = state["active"] if isinstance(state["active"], dict) else DEFAULT_STATE["active"]
+    state["active"] = dict(active)
+    state["active"].setdefault("selected_sticker_id", None)
+    state["active"].setdefault("selected_shot_id", None)
     return state
 
 
@@ -58,15 +81,211 @@ def parse_state(state_raw: str | None) -> dict | None:
         text = state_raw.strip()
         if not text:
             return None
-        try:
-            parsed = json.loads(text)
-            if isinstance(parsed, dict):
-                return parsed
-        except Exception:
-            return None
+        parsed = _parse_state_text(text)
+        if parsed is not None and "state_ref" in parsed:
+            return STATE_STORE.resolve(parsed)
+        return parsed
     return None
 
 
+@lru_cache(maxsize=16)
+def _parse_state_text(text: str) -> dict | None:
+    # Memoized on the text itself: nodes re-run with the same state_json, and
+    # states with embedded data URLs can be megabytes.
+    profiling.add_cache_bytes("state.parse", len(text))
+    with profiling.span("state.parse", chars=len(text)):
+        parsed = None
+        if HAS_ORJSON:
+            try:
+                parsed = orjson.loads(text)
+            except orjson.JSONDecodeError:
+                parsed = None
+        if parsed is None:
+            try:
+                parsed = json.loads(text)
+            except Exception:
+                return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+profiling.register_cache("state.parse", _parse_state_text)
+
+
 def dump_state(state: dict) -> str:
-    return json.dumps(state, ensure_ascii=True, separators=(",", ":"))
-
+    return json.dumps(state, ensure_ascii=True, separators=(",", ":"))
+
+
+def state_fingerprint(state: dict, *extra) -> str:
+    # Canonical hash of everything that affects rendering: key order and the
+    # editor's selection ("active") do not change it.
+    payload = {k: v for k, v in state.items() if k != "active"} if isinstance(state, dict) else state
+    text = json.dumps([payload, list(extra)], sort_keys=True, ensure_ascii=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+PATCH_COLLECTIONS = ("stickers", "shots")
+PATCH_SETTABLE = ("bg_color", "output_preset", "active")
+
+
+def apply_state_patch(state: dict, ops: list) -> dict:
+    """Returns a new state with ``ops`` applied; ``state`` is not modified.
+
+    Ops:
+      {"op": "add", "collection": "stickers"|"shots", "value": {...}}
+      {"op": "update", "collection": ..., "id": ..., "value": {partial fields}}
+      {"op": "remove", "collection": ..., "id": ...}
+      {"op": "put_asset", "id": ..., "value": {...}} / {"op": "remove_asset", "id": ...}
+      {"op": "set", "key": "bg_color"|"output_preset"|"active", "value": ...}
+
+    Untouched stickers, shots and assets are shared with ``state``.
+    """
+    if not isinstance(ops, list):
+        raise ValueError("patch ops must be a list")
+    out = dict(state)
+    for op in ops:
+        kind = op.get("op") if isinstance(op, dict) else None
+        if kind in ("add", "update", "remove"):
+            coll = op.get("collection")
+            if coll not in PATCH_COLLECTIONS:
+                raise ValueError(f"unknown patch collection: {coll}")
+            items = list(out.get(coll) or [])
+            if kind == "add":
+                value = op.get("value")
+                if not isinstance(value, dict):
+                    raise ValueError("add needs an object value")
+                items = [it for it in items if not (isinstance(it, dict) and value.get("id") is not None and it.get("id") == value.get("id"))]
+                items.append(dict(value))
+            else:
+                idx = next((i for i, it in enumerate(items) if isinstance(it, dict) and it.get("id") == op.get("id")), None)
+                if idx is None:
+                    raise ValueError(f"no {coll} item with id {op.get('id')!r}")
+                if kind == "remove":
+                    del items[idx]
+                else:
+                    value = op.get("value")
+                    if not isinstance(value, dict):
+                        raise ValueError("update needs an object value")
+                    items[idx] = {**items[idx], **value, "id": items[idx].get("id")}
+            out[coll] = items
+        elif kind in ("put_asset", "remove_asset"):
+            assets = dict(out.get("assets") or {})
+            asset_id = str(op.get("id") or "")
+            if not asset_id:
+                raise ValueError(f"{kind} needs an id")
+            if kind == "put_asset":
+                if not isinstance(op.get("value"), dict):
+                    raise ValueError("put_asset needs an object value")
+                assets[asset_id] = dict(op["value"])
+            else:
+                assets.pop(asset_id, None)
+            out["assets"] = assets
+        elif kind == "set":
+            if op.get("key") not in PATCH_SETTABLE:
+                raise ValueError(f"cannot set state key: {op.get('key')}")
+            out[op["key"]] = op.get("value")
+        else:
+            raise ValueError(f"unknown patch op: {kind}")
+    return out
+
+
+class StateConflict(ValueError):
+    def __init__(self, key: str, version: int):
+        super().__init__(f"state {key!r} is at version {version}")
+        self.key = key
+        self.version = version
+
+
+class MissingState(ValueError):
+    def __init__(self, key: str, version):
+        at = "" if version is None else f" version {version}"
+        super().__init__(
+            f"panorama state {key!r}{at} is not on the server; editor states are kept in memory only and are lost "
+            "when ComfyUI restarts. Open the node's editor so it sends the full state again, then re-queue."
+        )
+        self.key = key
+        self.version = version
+
+
+class StateStore:
+    """Versioned editor states keyed by a client-chosen id.
+
+    The editor puts a full state once and then sends patches against the
+    version it last saw; ``state_json`` can then be a small
+    ``{"state_ref": key, "version": n}`` reference. The last few versions of
+    each key are kept so prompts queued before later edits still resolve.
+    Keys carry a per-page id, so the same node id in two open workflows does
+    not share one version chain. The store is in memory only; a reference may carry the full document as
+    ``"state"``, which is used (and stored again) when the version is gone,
+    e.g. after a restart.
+    """
+
+    def __init__(self, max_entries: int = 64, keep_versions: int = 8):
+        self.max_entries = int(max_entries)
+        self.keep_versions = max(1, int(keep_versions))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, key: str, state: dict) -> int:
+        if not isinstance(state, dict):
+            raise ValueError("state must be an object")
+        with self._lock:
+            versions = self._entries.get(key)
+            version = next(reversed(versions)) + 1 if versions else 1
+            self._set(key, version, state)
+            return version
+
+    def patch(self, key: str, base_version: int, ops: list) -> int:
+        with self._lock:
+            versions = self._entries.get(key)
+            if not versions:
+                raise StateConflict(key, 0)
+            version = next(reversed(versions))
+            if _parse_version(base_version) != version:
+                raise StateConflict(key, version)
+            self._set(key, version + 1, apply_state_patch(versions[version], ops))
+            return version + 1
+
+    def get(self, key: str, version: int | None = None) -> tuple[int, dict] | None:
+        with self._lock:
+            versions = self._entries.get(key)
+            if not versions:
+                return None
+            self._entries.move_to_end(key)
+            if version is None:
+                version = next(reversed(versions))
+            state = versions.get(int(version))
+            return None if state is None else (int(version), state)
+
+    def resolve(self, ref: dict) -> dict:
+        key = str(ref.get("state_ref"))
+        version = ref.get("version")
+        version = None if version is None else _parse_version(version)
+        entry = self.get(key, version)
+        if entry is not None:
+            return entry[1]
+        state = ref.get("state")
+        if not isinstance(state, dict):
+            raise MissingState(key, version)
+        with self._lock:
+            if key not in self._entries:
+                self._set(key, 1 if version is None else version, state)
+        return state
+
+    def _set(self, key: str, version: int, state: dict):
+        versions = self._entries.setdefault(key, OrderedDict())
+        versions[version] = state
+        while len(versions) > self.keep_versions:
+            versions.popitem(last=False)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+def _parse_version(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid state version: {value!r}") from None
+
+
+STATE_STORE = StateStore()
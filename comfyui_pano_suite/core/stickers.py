@@ -1,13 +1,20 @@
 import base64
 import io
 import math
+import threading
+import weakref
+from collections import OrderedDict
 from functools import lru_cache
 from pathlib import Path
 
 import numpy as np
 from PIL import Image
 
-from .math import DEG2RAD, orthonormal_basis_from_forward, yaw_pitch_to_dir
+from . import profiling
+from .assets import hash_asset_path
+from .memory import plan_compose_band_rows, track_peak
+from .math import DEG2RAD, basis_is_yaw_equivariant, orthonormal_basis_from_forward, preview_render_size, resize_erp, resize_image, yaw_pitch_to_dir
+from .model import CompiledState, compile_state
 
 try:
     import folder_paths
@@ -27,14 +34,86 @@ def _hex_to_rgb01(hex_color: str) -> np.ndarray:
 
 @lru_cache(maxsize=32)
 def _load_dataurl_cached(v: str) -> np.ndarray:
-    payload = v.split(",", 1)[1]
-    raw = base64.b64decode(payload)
-    img = Image.open(io.BytesIO(raw)).convert("RGBA")
-    arr = np.asarray(img, dtype=np.float32) / 255.0
+    with profiling.span("stickers.decode_asset", source="dataurl"):
+        payload = v.split(",", 1)[1]
+        raw = base64.b64decode(payload)
+        img = Image.open(io.BytesIO(raw)).convert("RGBA")
+        arr = np.asarray(img, dtype=np.float32) / 255.0
     arr.flags.writeable = False
+    profiling.add_cache_bytes("stickers.dataurl", arr.nbytes)
     return arr
 
 
+@lru_cache(maxsize=32)
+def _load_hashed_file_cached(path: str) -> np.ndarray:
+    with profiling.span("stickers.decode_asset", source="hash"):
+        img = Image.open(path).convert("RGBA")
+        arr = np.asarray(img, dtype=np.float32) / 255.0
+    arr.flags.writeable = False
+    profiling.add_cache_bytes("stickers.hash", arr.nbytes)
+    return arr
+
+
+profiling.register_cache("stickers.dataurl", _load_dataurl_cached)
+profiling.register_cache("stickers.hash", _load_hashed_file_cached)
+
+
+def resolve_asset_path(asset_info: dict, base_dir: Path | None = None) -> Path | None:
+    # File location of a "path" or "comfy_image" asset, or None when it is not a
+    # file asset, escapes its base directory or does not exist.
+    if not isinstance(asset_info, dict):
+        return None
+    t = str(asset_info.get("type") or "").strip().lower()
+
+    if t == "path":
+        v = str(asset_info.get("value") or asset_info.get("path") or "").strip()
+        if not v:
+            return None
+        p = Path(v)
+        if base_dir is not None:
+            p = (base_dir / p).resolve()
+            try:
+                p.relative_to(base_dir.resolve())
+            except Exception:
+                return None
+        elif p.is_absolute():
+            return None
+        else:
+            p = p.resolve()
+            try:
+                p.relative_to(Path.cwd().resolve())
+            except Exception:
+                return None
+
+    elif t == "comfy_image" and folder_paths is not None:
+        filename = str(asset_info.get("filename") or "").strip()
+        if not filename:
+            return None
+        subfolder = str(asset_info.get("subfolder") or "").strip().strip("/\\")
+        storage = str(asset_info.get("storage") or "input").strip().lower()
+        if storage == "output":
+            base = Path(folder_paths.get_output_directory())
+        elif storage == "temp":
+            base = Path(folder_paths.get_temp_directory())
+        else:
+            base = Path(folder_paths.get_input_directory())
+        p = (base / subfolder / filename).resolve() if subfolder else (base / filename).resolve()
+        try:
+            p.relative_to(base.resolve())
+        except Exception:
+            return None
+
+    elif t == "hash":
+        return hash_asset_path(asset_info)
+
+    else:
+        return None
+
+    if not p.exists() or not p.is_file():
+        return None
+    return p
+
+
 def _load_asset_rgba(asset_info: dict, base_dir: Path | None = None) -> np.ndarray | None:
     if not isinstance(asset_info, dict):
         return None
@@ -47,218 +126,444 @@ def _load_asset_rgba(asset_info: dict, base_dir: Path | None = None) -> np.ndarr
                 return None
             return _load_dataurl_cached(v)
 
-        if t == "path":
-            v = str(asset_info.get("value") or asset_info.get("path") or "").strip()
-            if not v:
-                return None
-            p = Path(v)
-            if base_dir is not None:
-                p = (base_dir / p).resolve()
-                try:
-                    p.relative_to(base_dir.resolve())
-                except Exception:
-                    return None
-            elif p.is_absolute():
-                return None
-            else:
-                p = p.resolve()
-                try:
-                    p.relative_to(Path.cwd().resolve())
-                except Exception:
-                    return None
-
-            if not p.exists() or not p.is_file():
-                return None
-            img = Image.open(p).convert("RGBA")
-            return np.asarray(img, dtype=np.float32) / 255.0
-
-        if t == "comfy_image" and folder_paths is not None:
-            filename = str(asset_info.get("filename") or "").strip()
-            if not filename:
-                return None
-            subfolder = str(asset_info.get("subfolder") or "").strip().strip("/\\")
-            storage = str(asset_info.get("storage") or "input").strip().lower()
-            if storage == "output":
-                base = Path(folder_paths.get_output_directory())
-            elif storage == "temp":
-                base = Path(folder_paths.get_temp_directory())
-            else:
-                base = Path(folder_paths.get_input_directory())
-            p = (base / subfolder / filename).resolve() if subfolder else (base / filename).resolve()
-            try:
-                p.relative_to(base.resolve())
-            except Exception:
-                return None
-            if not p.exists() or not p.is_file():
-                return None
+        p = resolve_asset_path(asset_info, base_dir=base_dir)
+        if p is None:
+            return None
+        if t == "hash":
+            # Content-addressed files never change, so they are cached like data URLs.
+            return _load_hashed_file_cached(str(p))
+        with profiling.span("stickers.decode_asset", source=t):
             img = Image.open(p).convert("RGBA")
             return np.asarray(img, dtype=np.float32) / 255.0
     except Exception:
         return None
-    return None
-
-
-def _sample_rgba_bilinear(img: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
-    h, w, _ = img.shape
-    x = np.clip(x, 0.0, w - 1.0)
-    y = np.clip(y, 0.0, h - 1.0)
-
-    x0 = np.floor(x).astype(np.int32)
-    y0 = np.floor(y).astype(np.int32)
-    x1 = np.clip(x0 + 1, 0, w - 1)
-    y1 = np.clip(y0 + 1, 0, h - 1)
-
-    fx = (x - x0)[..., None]
-    fy = (y - y0)[..., None]
-
-    c00 = img[y0, x0]
-    c10 = img[y0, x1]
-    c01 = img[y1, x0]
-    c11 = img[y1, x1]
 
-    c0 = c00 * (1.0 - fx) + c10 * fx
-    c1 = c01 * (1.0 - fx) + c11 * fx
-    return c0 * (1.0 - fy) + c1 * fy
 
+def referenced_asset_stamps(state: dict, base_dir: Path | None = None) -> list:
+    """(asset_id, path, mtime_ns, size) of every file asset a sticker uses.
 
-def _alpha_over_straight(dst_rgb: np.ndarray, src_rgba: np.ndarray) -> np.ndarray:
-    src_a = src_rgba[..., 3:4]
-    src_rgb = src_rgba[..., :3]
-    return src_rgb * src_a + dst_rgb * (1.0 - src_a)
+    Missing files are listed with path None, so a file appearing later also
+    changes the result.
+    """
+    assets = state.get("assets", {}) if isinstance(state, dict) else {}
+    used = set()
+    for st in state.get("stickers", []) if isinstance(state, dict) else []:
+        if isinstance(st, dict) and st.get("asset_id") in assets:
+            used.add(str(st.get("asset_id")))
 
+    stamps = []
+    for asset_id in sorted(used):
+        info = assets.get(asset_id)
+        t = str(info.get("type") or "").strip().lower() if isinstance(info, dict) else ""
+        if t not in ("path", "comfy_image"):
+            continue
+        try:
+            p = resolve_asset_path(info, base_dir=base_dir)
+            st = p.stat() if p is not None else None
+        except OSError:
+            p, st = None, None
+        if st is None:
+            stamps.append((asset_id, None, -1, -1))
+        else:
+            stamps.append((asset_id, str(p), st.st_mtime_ns, st.st_size))
+    return stamps
+
+
+class _Workspace:
+    # Named scratch buffers reused across the stickers of one compose. Each grows
+    # to the largest size requested and is handed out as a view of that shape,
+    # so a view is only valid until the next request under the same name.
+    def __init__(self):
+        self._bufs = {}
+
+    def get(self, name: str, shape: tuple, dtype=np.float32) -> np.ndarray:
+        n = math.prod(shape)
+        buf = self._bufs.get(name)
+        if buf is None or buf.dtype != dtype or buf.size < n:
+            buf = np.empty(n, dtype=dtype)
+            self._bufs[name] = buf
+        return buf[:n].reshape(shape)
+
+
+def _sample_rgba_bilinear(img: np.ndarray, x: np.ndarray, y: np.ndarray, ws: _Workspace | None = None) -> np.ndarray:
+    # With a workspace, x and y are overwritten and the result is a workspace view.
+    if ws is None:
+        ws, x, y = _Workspace(), np.array(x, dtype=np.float32), np.array(y, dtype=np.float32)
+    h, w, c = img.shape
+    flat = np.ascontiguousarray(img).reshape(-1, c)
+    shape = x.shape
+    np.clip(x, 0.0, w - 1.0, out=x)
+    np.clip(y, 0.0, h - 1.0, out=y)
+
+    # x and y become the fractional offsets; idx is the top-left texel and dx/dy
+    # the steps to its neighbours, zero on the last column/row.
+    floor = ws.get("floor", shape, x.dtype)
+    x0 = ws.get("x0", shape, np.intp)
+    idx = ws.get("idx", shape, np.intp)
+    np.floor(x, out=floor)
+    np.copyto(x0, floor, casting="unsafe")
+    x -= floor
+    np.floor(y, out=floor)
+    np.copyto(idx, floor, casting="unsafe")
+    y -= floor
+    dx = np.less(x0, w - 1, out=ws.get("dx", shape, np.intp))
+    dy = np.less(idx, h - 1, out=ws.get("dy", shape, np.intp))
+    dy *= w
+    idx *= w
+    idx += x0
+
+    out_shape = shape + (c,)
+    c00 = np.take(flat, idx, axis=0, out=ws.get("c00", out_shape, img.dtype), mode="clip")
+    np.add(idx, dx, out=x0)
+    c10 = np.take(flat, x0, axis=0, out=ws.get("c10", out_shape, img.dtype), mode="clip")
+    idx += dy
+    c01 = np.take(flat, idx, axis=0, out=ws.get("c01", out_shape, img.dtype), mode="clip")
+    x0 += dy
+    c11 = np.take(flat, x0, axis=0, out=ws.get("c11", out_shape, img.dtype), mode="clip")
+
+    fx = x[..., None]
+    fy = y[..., None]
+    c10 -= c00
+    c10 *= fx
+    c00 += c10
+    c11 -= c01
+    c11 *= fx
+    c01 += c11
+    c01 -= c00
+    c01 *= fy
+    c00 += c01
+    return c00
+
+
+def _sample_rgba_nearest(img: np.ndarray, x: np.ndarray, y: np.ndarray, ws: _Workspace | None = None) -> np.ndarray:
+    if ws is None:
+        ws, x, y = _Workspace(), np.array(x, dtype=np.float32), np.array(y, dtype=np.float32)
+    h, w, c = img.shape
+    flat = np.ascontiguousarray(img).reshape(-1, c)
+    shape = x.shape
+    idx = ws.get("idx", shape, np.intp)
+    xi = ws.get("x0", shape, np.intp)
+    np.clip(np.rint(x, out=x), 0, w - 1, out=x)
+    np.clip(np.rint(y, out=y), 0, h - 1, out=y)
+    np.copyto(xi, x, casting="unsafe")
+    np.copyto(idx, y, casting="unsafe")
+    idx *= w
+    idx += xi
+    return np.take(flat, idx, axis=0, out=ws.get("c00", shape + (c,), img.dtype), mode="clip")
+
+
+# Canvas storage for compose. Blending math is float32 whatever the storage;
+# "float16" halves the canvas and "uint8" quarters it, which suits conditioning
+# images that are VAE-encoded anyway.
+COMPOSE_PRECISIONS = ("float32", "float16", "uint8")
+
+
+def _store(dst: np.ndarray, src: np.ndarray, ws: _Workspace, block_rows: int = 256):
+    # Writes float [0, 1] ``src`` into ``dst`` in its storage dtype.
+    if dst.dtype != np.uint8:
+        np.clip(src, 0.0, 1.0, out=dst)
+        return
+    for r0 in range(0, dst.shape[0], block_rows):
+        part = src[r0:r0 + block_rows]
+        tmp = np.clip(part, 0.0, 1.0, out=ws.get("store", part.shape))
+        tmp *= 255.0
+        tmp += 0.5
+        np.copyto(dst[r0:r0 + block_rows], tmp, casting="unsafe")
+
+
+# Resized backgrounds are kept for the last BG_CACHE_SIZE (owner, size) pairs,
+# where the owner is the object the caller got the background from (the node's
+# IMAGE tensor). Entries hold only a weak reference to it and go when it is
+# freed; torch's in-place version counter is part of the key.
+BG_CACHE_SIZE = 2
+_bg_cache = OrderedDict()
+_bg_cache_lock = threading.Lock()
+
+
+def _drop_background(key):
+    with _bg_cache_lock:
+        _bg_cache.pop(key, None)
+
+
+def _resized_background(bg: np.ndarray, out_w: int, out_h: int, owner=None) -> np.ndarray:
+    if owner is None:
+        with profiling.span("stickers.bg_resize"):
+            return resize_erp(bg, out_w, out_h)
+    key = (id(owner), getattr(owner, "_version", 0), tuple(bg.shape), out_w, out_h)
+    with _bg_cache_lock:
+        hit = _bg_cache.get(key)
+        if hit is not None and hit[0]() is owner:
+            _bg_cache.move_to_end(key)
+            return hit[1]
+    with profiling.span("stickers.bg_resize"):
+        resized = resize_erp(bg, out_w, out_h)
+    resized.flags.writeable = False
+    try:
+        ref = weakref.ref(owner, lambda _, key=key: _drop_background(key))
+    except TypeError:
+        return resized
+    with _bg_cache_lock:
+        _bg_cache[key] = (ref, resized)
+        while len(_bg_cache) > BG_CACHE_SIZE:
+            _bg_cache.popitem(last=False)
+    return resized
+
+
+# Sticker centers are snapped to 1/YAW_SUBPIXEL_STEPS of an ERP column so that
+# stickers differing only in yaw share one warped patch shifted by whole columns.
+YAW_SUBPIXEL_STEPS = 1024
+
+
+def _iter_u_segments(start: int, end: int, w: int):
+    # Splits the unwrapped column span [start, end) into (patch_offset, col0, col1)
+    # pieces inside [0, w).
+    j = 0
+    col = start % w
+    while j < end - start:
+        n = min(end - start - j, w - col)
+        yield j, col, col + n
+        j += n
+        col = 0
+
+
+def _yaw_frame_basis(yaw_deg: float, pitch_deg: float) -> tuple[tuple[np.ndarray, np.ndarray, np.ndarray], bool]:
+    # Returns the sticker basis expressed in a frame rotated by -yaw about +Y and
+    # whether that basis is independent of yaw.
+    if basis_is_yaw_equivariant(pitch_deg):
+        return orthonormal_basis_from_forward(yaw_pitch_to_dir(0.0, pitch_deg)), True
+    right, up, fwd = orthonormal_basis_from_forward(yaw_pitch_to_dir(yaw_deg, pitch_deg))
+    yr = yaw_deg * DEG2RAD
+    cy = math.cos(yr)
+    sy = math.sin(yr)
+    rot = np.array([[cy, 0.0, -sy], [0.0, 1.0, 0.0], [sy, 0.0, cy]], dtype=np.float32)
+    return (rot @ right, rot @ up, rot @ fwd), False
+
+
+def _warp_sticker_patch(
+    img: np.ndarray,
+    basis: tuple[np.ndarray, np.ndarray, np.ndarray],
+    h_fov: float,
+    v_fov: float,
+    rot: float,
+    crop: tuple[float, float, float, float],
+    lon_rel: np.ndarray,
+    lat: np.ndarray,
+    nearest: bool = False,
+    ws: _Workspace | None = None,
+) -> tuple[np.ndarray, np.ndarray] | None:
+    # Returns (rgba, inside) for the lat x lon_rel grid; with a workspace both
+    # are views into it.
+    ws = ws if ws is not None else _Workspace()
+    right, up, fwd = (np.asarray(a, dtype=np.float64) for a in basis)
+    cx0, cy0, cx1, cy1 = crop
+    shape = (len(lat), len(lon_rel))
+
+    # The ERP grid is separable: dir = (cos_lat sin_lon, sin_lat, cos_lat cos_lon),
+    # so any dot product with it is an outer product of 1D factors plus a row term.
+    # Roll and FOV are folded into the axes the normalised coordinates project on.
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon_rel, dtype=np.float64)
+    cos_lat = np.cos(lat).astype(np.float32)[:, None]
+    sin_lat = np.sin(lat)
+    sin_lon = np.sin(lon)
+    cos_lon = np.cos(lon)
+
+    def project(axis, name):
+        out = ws.get(name, shape)
+        np.multiply(cos_lat, (sin_lon * axis[0] + cos_lon * axis[2]).astype(np.float32)[None, :], out=out)
+        out += (sin_lat * axis[1]).astype(np.float32)[:, None]
+        return out
+
+    z = project(fwd, "z")
+    inside = np.greater(z, 1e-6, out=ws.get("inside", shape, bool))
+    if not inside.any():
+        return None
+    np.maximum(z, 1e-6, out=z)
+
+    rr = -rot * DEG2RAD
+    cr = math.cos(rr)
+    sr = math.sin(rr)
+    xn = project((right * cr - up * sr) / math.tan(h_fov * 0.5 * DEG2RAD), "xn")
+    yn = project((right * sr + up * cr) / math.tan(v_fov * 0.5 * DEG2RAD), "yn")
+    xn /= z
+    yn /= z
+
+    # z is free from here on and holds |xn| and |yn|.
+    ok = ws.get("ok", shape, bool)
+    inside &= np.less_equal(np.abs(xn, out=z), 1.0, out=ok)
+    inside &= np.less_equal(np.abs(yn, out=z), 1.0, out=ok)
+    if not inside.any():
+        return None
 
-def _iter_u_ranges(center_u: float, half_u: int, w: int):
-    start = int(math.floor(center_u - half_u))
-    end = int(math.ceil(center_u + half_u))
-    if start < 0:
-        yield (start + w, w)
-        yield (0, end)
-    elif end >= w:
-        yield (start, w)
-        yield (0, end - w)
-    else:
-        yield (start, end)
+    # Crop-space texture coordinates, mapped straight to pixels.
+    ih, iw, _ = img.shape
+    xn *= 0.5 * (cx1 - cx0) * (iw - 1)
+    xn += (cx0 + 0.5 * (cx1 - cx0)) * (iw - 1)
+    yn *= -0.5 * (cy1 - cy0) * (ih - 1)
+    yn += (cy0 + 0.5 * (cy1 - cy0)) * (ih - 1)
+    sample = _sample_rgba_nearest if nearest else _sample_rgba_bilinear
+    return sample(img, xn, yn, ws), inside
 
 
 def compose_stickers_to_erp(
-    state: dict,
+    state: dict | CompiledState,
     output_w: int,
     output_h: int,
     bg_erp: np.ndarray | None = None,
     base_dir: Path | None = None,
     quality: str = "export",
+    precision: str = "float32",
+    bg_owner=None,
 ) -> np.ndarray:
-    if bg_erp is not None:
-        canvas = np.clip(bg_erp.astype(np.float32), 0.0, 1.0)
-        if canvas.shape[0] != output_h or canvas.shape[1] != output_w:
-            canvas = np.asarray(
-                Image.fromarray((canvas * 255.0).astype(np.uint8)).resize((output_w, output_h), Image.BILINEAR),
-                dtype=np.float32,
-            ) / 255.0
-    else:
-        bg = _hex_to_rgb01(state.get("bg_color", "#00ff00"))
-        canvas = np.ones((output_h, output_w, 3), dtype=np.float32) * bg[None, None, :]
-
-    stickers = state.get("stickers", [])
-    assets = state.get("assets", {})
-    stickers_sorted = sorted(stickers, key=lambda s: float(s.get("z_index", 0)))
-
-    for st in stickers_sorted:
-        asset_id = st.get("asset_id")
-        if asset_id not in assets:
-            continue
-        img = _load_asset_rgba(assets[asset_id], base_dir=base_dir)
-        if img is None:
-            continue
-
-        yaw = float(st.get("yaw_deg", 0.0))
-        pitch = float(st.get("pitch_deg", 0.0))
-        h_fov = max(0.1, float(st.get("hFOV_deg", 20.0)))
-        v_fov = max(0.1, float(st.get("vFOV_deg", 20.0)))
-        rot = float(st.get("rot_deg", 0.0))
-        crop = st.get("crop", {"x0": 0.0, "y0": 0.0, "x1": 1.0, "y1": 1.0})
-
-        x0 = float(crop.get("x0", 0.0))
-        y0 = float(crop.get("y0", 0.0))
-        x1 = float(crop.get("x1", 1.0))
-        y1 = float(crop.get("y1", 1.0))
-        cx0 = max(0.0, min(1.0, min(x0, x1)))
-        cy0 = max(0.0, min(1.0, min(y0, y1)))
-        cx1 = max(0.0, min(1.0, max(x0, x1)))
-        cy1 = max(0.0, min(1.0, max(y0, y1)))
-        if cx1 - cx0 < 1e-6 or cy1 - cy0 < 1e-6:
+    """Returns the (output_h, output_w, 3) composite in ``precision``'s dtype:
+    float32 or float16 in [0, 1], or uint8 in [0, 255].
+
+    When ``bg_erp`` needs resizing and ``bg_owner`` is given (the object it was
+    taken from), the resized background is reused while that object lives.
+    """
+    if precision not in COMPOSE_PRECISIONS:
+        raise ValueError(f"Unknown compose precision {precision!r}")
+    with profiling.span("stickers.compose", w=int(output_w), h=int(output_h), quality=quality, precision=precision), track_peak("stickers.memory") as mem:
+        return _compose_stickers(state, output_w, output_h, bg_erp, bg_owner, base_dir, quality, np.dtype(precision), mem)
+
+
+def _warp_rows(img, key, basis, output_w, output_h, r0, r1, nearest, ws):
+    # Warps output rows [r0, r1) of the patch described by a job key.
+    _, pitch, h_fov, v_fov, rot, crop, frac, half_cols, _, _, _ = key
+    cols = np.arange(2 * half_cols + 1, dtype=np.float32) - (half_cols - 0.5 + frac)
+    lon_rel = cols[: output_w] * (2.0 * math.pi / output_w)
+    lat = (0.5 - (np.arange(r0, r1, dtype=np.float32) + 0.5) / output_h) * math.pi
+    with profiling.span("stickers.warp", asset=key[0], rows=r1 - r0, cols=len(lon_rel)):
+        return _warp_sticker_patch(img, basis, h_fov, v_fov, rot, crop, lon_rel, lat, nearest=nearest, ws=ws)
+
+
+def _blend_patch(canvas, rgba, inside, start, row0, ws):
+    # Straight alpha "over", in place on the canvas where the sticker is inside.
+    output_w = canvas.shape[1]
+    row1 = row0 + rgba.shape[0]
+    scale = 255.0 if canvas.dtype == np.uint8 else 1.0
+    for j, ux0, ux1 in _iter_u_segments(start, start + rgba.shape[1], output_w):
+        j1 = j + (ux1 - ux0)
+        patch = canvas[row0:row1, ux0:ux1, :]
+        src = rgba[:, j:j1]
+        where = inside[:, j:j1, None]
+        diff = ws.get("blend", patch.shape)
+        if canvas.dtype == np.float32:
+            np.subtract(src[..., :3], patch, out=diff)
+            diff *= src[..., 3:4]
+            np.add(patch, diff, out=patch, where=where)
             continue
-
-        cdir = yaw_pitch_to_dir(yaw, pitch)
-        right, up, fwd = orthonormal_basis_from_forward(cdir)
+        # Narrow storage: blend in float32 and write back only where inside.
+        cur = np.multiply(patch, 1.0 / scale, out=ws.get("blend_cur", patch.shape))
+        np.subtract(src[..., :3], cur, out=diff)
+        diff *= src[..., 3:4]
+        cur += diff
+        if scale != 1.0:
+            cur *= scale
+            cur += 0.5
+        np.copyto(patch, cur, casting="unsafe", where=where)
+
+
+def _compose_stickers(state, output_w, output_h, bg_erp, bg_owner, base_dir, quality, dtype, mem) -> np.ndarray:
+    compiled = state if isinstance(state, CompiledState) else compile_state(state)
+    assets = compiled.assets
+    preview = quality == "preview"
+    final_w, final_h = output_w, output_h
+    if preview:
+        # Composite at reduced size with nearest sticker sampling and upscale at the end.
+        output_w, output_h = preview_render_size(output_w, output_h)
+    ws = _Workspace()
+    with profiling.span("stickers.background"):
+        canvas = np.empty((output_h, output_w, 3), dtype=dtype)
+        if bg_erp is not None:
+            bg = bg_erp
+            if bg.shape[0] != output_h or bg.shape[1] != output_w:
+                bg = _resized_background(bg_erp, output_w, output_h, bg_owner)
+            _store(canvas, bg, ws)
+        else:
+            _store(canvas, np.broadcast_to(_hex_to_rgb01(compiled.bg_color), canvas.shape), ws)
+
+    jobs = []
+    for st in compiled.stickers:
+        asset_id = st.asset_id
+        yaw, pitch, h_fov, v_fov, rot = st.yaw_deg, st.pitch_deg, st.hfov_deg, st.vfov_deg, st.rot_deg
+        cx0, cy0, cx1, cy1 = st.crop
 
         max_fov = max(h_fov, v_fov)
-        half_u = int(math.ceil(output_w * (max_fov / 360.0) * (1.5 if quality == "preview" else 1.2)))
-        half_v = int(math.ceil(output_h * (max_fov / 180.0) * (1.5 if quality == "preview" else 1.2)))
+        half_u = int(math.ceil(output_w * (max_fov / 360.0) * 1.2))
+        half_v = int(math.ceil(output_h * (max_fov / 180.0) * 1.2))
 
-        center_u = ((yaw / 360.0) + 0.5) * output_w
         center_v = (0.5 - (pitch / 180.0)) * output_h
-
         y_min = max(0, int(center_v - half_v))
         y_max = min(output_h, int(center_v + half_v))
         if y_max <= y_min:
             continue
 
-        xs_lin = np.arange(output_w, dtype=np.float32) + 0.5
-        ys_lin = np.arange(y_min, y_max, dtype=np.float32) + 0.5
-
-        for ux0, ux1 in _iter_u_ranges(center_u, half_u, output_w):
-            ux0 = max(0, ux0)
-            ux1 = min(output_w, ux1)
-            if ux1 <= ux0:
-                continue
-
-            xs = xs_lin[ux0:ux1]
-            ys = ys_lin
-            xg, yg = np.meshgrid(xs, ys)
-
-            lon = (xg / output_w - 0.5) * (2.0 * math.pi)
-            lat = (0.5 - yg / output_h) * math.pi
-            dirs = np.stack([
-                np.cos(lat) * np.sin(lon),
-                np.sin(lat),
-                np.cos(lat) * np.cos(lon),
-            ], axis=-1).astype(np.float32)
-
-            z = np.sum(dirs * fwd[None, None, :], axis=-1)
-            front = z > 1e-6
-            if not np.any(front):
+        # A pure yaw change is a horizontal shift of the ERP: warp relative to the
+        # sticker column and place the patch at the integer part of its center.
+        center_u = round(((yaw / 360.0) + 0.5) * output_w * YAW_SUBPIXEL_STEPS) / YAW_SUBPIXEL_STEPS
+        col = math.floor(center_u)
+        frac = center_u - col
+        half_cols = min(half_u, output_w // 2)
+        yaw_q = (center_u / output_w - 0.5) * 360.0
+
+        basis, shift_invariant = _yaw_frame_basis(yaw_q, pitch)
+        key = (
+            asset_id, pitch, h_fov, v_fov, rot, (cx0, cy0, cx1, cy1),
+            frac, half_cols, y_min, y_max, None if shift_invariant else yaw_q,
+        )
+        jobs.append((key, asset_id, basis, col - half_cols))
+
+    max_patch = max(((k[9] - k[8], min(2 * k[7] + 1, output_w)) for k, *_ in jobs), default=(0, 0))
+    bg_shape = None if bg_erp is None else bg_erp.shape[:2]
+    band_rows, estimate = plan_compose_band_rows(output_w, output_h, bg_shape, max_patch, nearest=preview, itemsize=dtype.itemsize)
+    mem.update(estimate_bytes=estimate, band_rows=band_rows)
+
+    if band_rows is not None:
+        # Over the memory budget: each sticker is warped and blended in row
+        # bands, and no patch is kept for reuse.
+        for key, asset_id, basis, start in jobs:
+            with profiling.span("stickers.load_asset", asset=asset_id):
+                img = _load_asset_rgba(assets[asset_id], base_dir=base_dir)
+            if img is None:
                 continue
-
-            local_x = np.sum(dirs * right[None, None, :], axis=-1) / np.maximum(z, 1e-6)
-            local_y = np.sum(dirs * up[None, None, :], axis=-1) / np.maximum(z, 1e-6)
-
-            rr = -rot * DEG2RAD
-            cr = math.cos(rr)
-            sr = math.sin(rr)
-            xr = local_x * cr - local_y * sr
-            yr = local_x * sr + local_y * cr
-
-            xn = xr / math.tan(h_fov * 0.5 * DEG2RAD)
-            yn = yr / math.tan(v_fov * 0.5 * DEG2RAD)
-
-            inside = front & (np.abs(xn) <= 1.0) & (np.abs(yn) <= 1.0)
-            if not np.any(inside):
+            for r0 in range(key[8], key[9], band_rows):
+                warped = _warp_rows(img, key, basis, output_w, output_h, r0, min(key[9], r0 + band_rows), preview, ws)
+                if warped is not None:
+                    with profiling.span("stickers.blend", asset=asset_id):
+                        _blend_patch(canvas, *warped, start, r0, ws)
+    else:
+        # Warped patches are shared by stickers with the same key and released after
+        # their last use.
+        remaining = {}
+        for key, *_ in jobs:
+            remaining[key] = remaining.get(key, 0) + 1
+        patches = {}
+
+        for key, asset_id, basis, start in jobs:
+            if key in patches:
+                warped = patches[key]
+            else:
+                with profiling.span("stickers.load_asset", asset=asset_id):
+                    img = _load_asset_rgba(assets[asset_id], base_dir=base_dir)
+                warped = None if img is None else _warp_rows(img, key, basis, output_w, output_h, key[8], key[9], preview, ws)
+            remaining[key] -= 1
+            if remaining[key] > 0:
+                # The next warp reuses the workspace, so kept patches are copied out.
+                if key not in patches:
+                    patches[key] = None if warped is None else (warped[0].copy(), warped[1].copy())
+            else:
+                patches.pop(key, None)
+            if warped is None:
                 continue
 
-            su = (xn * 0.5 + 0.5)
-            sv = (0.5 - yn * 0.5)
-            su = cx0 + (cx1 - cx0) * su
-            sv = cy0 + (cy1 - cy0) * sv
-
-            ih, iw, _ = img.shape
-            px = su * (iw - 1)
-            py = sv * (ih - 1)
-            rgba = _sample_rgba_bilinear(img, px, py)
-
-            patch = canvas[y_min:y_max, ux0:ux1, :]
-            blended = _alpha_over_straight(patch, rgba)
-            patch[inside] = blended[inside]
-            canvas[y_min:y_max, ux0:ux1, :] = patch
+            with profiling.span("stickers.blend", asset=asset_id):
+                _blend_patch(canvas, *warped, start, key[8], ws)
 
-    return np.clip(canvas, 0.0, 1.0).astype(np.float32)
+    with profiling.span("stickers.finalize"):
+        # The canvas is owned by this call, so float storage is clipped in place;
+        # uint8 writes are already rounded into range.
+        out = canvas if dtype == np.uint8 else np.clip(canvas, 0.0, 1.0, out=canvas)
+        if (output_w, output_h) != (final_w, final_h):
+            out = resize_image(out, final_w, final_h, nearest=True)
+    return out
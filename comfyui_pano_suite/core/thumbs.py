@@ -0,0 +1,94 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+from PIL import Image
+
+try:
+    import folder_paths
+except Exception:  # pragma: no cover - optional in non-Comfy test environments
+    folder_paths = None
+
+# Resized sticker thumbnails are cached in <temp>/THUMB_SUBFOLDER as WebP (alpha
+# kept), named by a digest of (source path, mtime, size, thumbnail side). Hits
+# touch the file; the least recently used files go once the cache is over
+# THUMB_CACHE_MAX_BYTES.
+THUMB_SUBFOLDER = "pano_thumbs"
+THUMB_CACHE_MAX_BYTES = 256 * 1024 * 1024
+THUMB_QUALITY = 90
+THUMB_MIN_SIDE = 16
+THUMB_MAX_SIDE = 4096
+
+_evict_lock = threading.Lock()
+
+
+def default_thumb_dir() -> Path:
+    if folder_paths is not None:
+        return Path(folder_paths.get_temp_directory()) / THUMB_SUBFOLDER
+    return Path(tempfile.gettempdir()) / f"comfyui_{THUMB_SUBFOLDER}"
+
+
+def thumb_key(src: Path, size: int) -> str:
+    st = src.stat()
+    text = f"{src.resolve()}|{st.st_mtime_ns}|{st.st_size}|{int(size)}"
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def get_thumbnail(src: str | Path, size: int, cache_dir: str | Path | None = None, max_bytes: int = THUMB_CACHE_MAX_BYTES) -> tuple[Path, str]:
+    """Returns (thumbnail path, cache key) for ``src`` fitted into ``size`` x ``size``."""
+    src = Path(src)
+    size = max(THUMB_MIN_SIDE, min(THUMB_MAX_SIDE, int(size)))
+    cache = Path(cache_dir) if cache_dir is not None else default_thumb_dir()
+    key = thumb_key(src, size)
+    path = cache / f"{key}.webp"
+    if path.is_file():
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path, key
+
+    with Image.open(src) as img:
+        # JPEG decodes straight at a reduced scale when it can.
+        img.draft("RGB", (size, size))
+        has_alpha = "A" in img.getbands() or "transparency" in img.info
+        img = img.convert("RGBA" if has_alpha else "RGB")
+        img.thumbnail((size, size), Image.LANCZOS, reducing_gap=3.0)
+        cache.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        img.save(tmp, format="WEBP", quality=THUMB_QUALITY, method=4)
+    tmp.replace(path)
+    evict_thumbnails(cache, max_bytes)
+    return path, key
+
+
+def evict_thumbnails(cache_dir: str | Path, max_bytes: int = THUMB_CACHE_MAX_BYTES) -> int:
+    # Deletes least recently used thumbnails until the cache fits; returns how many.
+    with _evict_lock:
+        entries = []
+        total = 0
+        try:
+            with os.scandir(cache_dir) as it:
+                for e in it:
+                    if not e.name.endswith(".webp") or not e.is_file():
+                        continue
+                    st = e.stat()
+                    entries.append((st.st_mtime_ns, st.st_size, e.path))
+                    total += st.st_size
+        except OSError:
+            return 0
+        removed = 0
+        for _, nbytes, p in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(p)
+            except OSError:
+                logging.getLogger(__name__).warning("Could not evict thumbnail %s", p)
+                continue
+            total -= nbytes
+            removed += 1
+        return removed
@@ -1,3 +1,4 @@
+from functools import wraps
 from pathlib import Path
 import logging
 
@@ -10,14 +11,75 @@ try:
 except ImportError:
     nodes = None
 
-from .core.cutout import cutout_from_erp
-from .core.math import calculate_output_dimensions, calculate_dimensions_from_megapixels, finite_float, finite_int
-from .core.state import merge_state
-from .core.stickers import compose_stickers_to_erp
+try:
+    import folder_paths
+except ImportError:
+    folder_paths = None
 
+try:
+    from server import PromptServer
+except ImportError:
+    PromptServer = None
 
-def _save_input_preview(images, key="pano_input_images"):
-    if nodes is None or images is None:
+from .core import profiling
+from .core.cutout import cutout_from_erp
+from .core.map_bundle import DEFAULT_MAX_SIDE as BUNDLE_MAX_SIDE, load_map_bundle
+from .core.math import QUALITY_MODES, calculate_output_dimensions
+from .core.model import Shot, compile_state
+from .core.preview import save_previews_async
+from .core.state import merge_state, state_fingerprint
+from .core.stickers import COMPOSE_PRECISIONS, compose_stickers_to_erp, referenced_asset_stamps
+
+
+def _notify_preview_ready(unique_id, key, entries):
+    server = getattr(PromptServer, "instance", None) if PromptServer is not None else None
+    if server is None:
+        return
+    server.send_sync("pano_suite.preview_ready", {"node": unique_id, "key": key, "images": entries})
+
+
+def _profiled(name):
+    # With profiling on, the run's span records are returned as ui["pano_profile"].
+    def wrap(fn):
+        @wraps(fn)
+        def run(self, *args, **kwargs):
+            with profiling.collect() as records:
+                with profiling.span(name, node=kwargs.get("unique_id")):
+                    out = fn(self, *args, **kwargs)
+            if records and isinstance(out, dict):
+                out["ui"] = {**(out.get("ui") or {}), "pano_profile": records}
+            return out
+        return run
+    return wrap
+
+
+def _to_image_tensor(arr: np.ndarray) -> torch.Tensor:
+    # (H, W, C) float32/float16/uint8 array -> ComfyUI's (1, H, W, C) float32 IMAGE.
+    t = torch.from_numpy(arr)
+    if arr.dtype == np.uint8:
+        t = t.to(torch.float32).div_(255.0)
+    elif arr.dtype != np.float32:
+        t = t.to(torch.float32)
+    return t[None, ...]
+
+
+def _save_input_preview(images, key="pano_input_images", unique_id=None):
+    if images is None:
+        return {}
+    if folder_paths is not None:
+        # Encoding happens off the node's critical path; the frontend gets the
+        # reserved filenames now and a "pano_suite.preview_ready" event later.
+        try:
+            with profiling.span("node.preview_queue", key=key):
+                entries, _ = save_previews_async(
+                    images,
+                    folder_paths.get_temp_directory(),
+                    on_ready=lambda ready: _notify_preview_ready(unique_id, key, ready),
+                )
+            return {key: entries}
+        except Exception:
+            logging.getLogger(__name__).exception(f"Failed to queue preview for {key}")
+    if nodes is None:
         return {}
     try:
         # PreviewImage().save_images(images) returns {"ui": {"images": [...]}}
@@ -57,6 +119,8 @@ class PanoramaStickersNode:
             },
             "optional": {
                 "bg_erp": ("IMAGE",),
+                "quality": (list(QUALITY_MODES), {"default": "export"}),
+                "precision": (list(COMPOSE_PRECISIONS), {"default": "float32"}),
             },
             "hidden": {
                 "unique_id": "UNIQUE_ID",
@@ -88,19 +152,36 @@ class PanoramaStickersNode:
             return "#00ff00"
         return f"#{s.lower()}"
 
-    def run(self, output_preset, bg_color, state_json, unique_id=None, bg_erp=None):
-        out_w = self._parse_output_preset(output_preset, max_val=self.MAX_OUTPUT_SIDE)
-        bg_hex = self._normalize_hex_color(bg_color)
+    @classmethod
+    def _resolve_state(cls, output_preset, bg_color, state_json):
+        out_w = cls._parse_output_preset(output_preset, max_val=cls.MAX_OUTPUT_SIDE)
+        bg_hex = cls._normalize_hex_color(bg_color)
         state = merge_state(state_in=None, internal_state=state_json, fallback_preset=out_w, fallback_bg=bg_hex)
         state["output_preset"] = out_w
         state["bg_color"] = bg_hex
+        return state, out_w
+
+    @classmethod
+    def IS_CHANGED(cls, output_preset, bg_color, state_json, **kwargs):
+        # Sticker images referenced by path live outside the prompt, so their
+        # (path, mtime, size) is part of the fingerprint.
+        try:
+            state, _ = cls._resolve_state(output_preset, bg_color, state_json)
+            stamps = referenced_asset_stamps(state, base_dir=Path.cwd())
+            return state_fingerprint(state, stamps, kwargs.get("quality", "export"), kwargs.get("precision", "float32"))
+        except Exception:
+            return float("nan")
+
+    @_profiled("node.stickers")
+    def run(self, output_preset, bg_color, state_json, unique_id=None, bg_erp=None, quality="export", precision="float32"):
+        state, out_w = self._resolve_state(output_preset, bg_color, state_json)
 
         w = out_w
         h = w // 2
 
         bg_np = None
         if bg_erp is not None:
-            bg_np = bg_erp[0].detach().cpu().numpy().astype(np.float32)
+            bg_np = np.asarray(bg_erp[0].detach().cpu().numpy(), dtype=np.float32)
 
         out = compose_stickers_to_erp(
             state=state,
@@ -108,14 +189,17 @@ class PanoramaStickersNode:
             output_h=h,
             bg_erp=bg_np,
             base_dir=Path.cwd(),
-            quality="export",
+            quality=quality if quality in QUALITY_MODES else "export",
+            precision=precision if precision in COMPOSE_PRECISIONS else "float32",
+            bg_owner=bg_erp,
         )
 
-        out_t = torch.from_numpy(out)[None, ...]
+        # The compositor keeps its canvas in ``precision``; ComfyUI gets float32.
+        out_t = _to_image_tensor(out)
 
         ui_ret = {}
         if bg_erp is not None:
-            ui_ret = _save_input_preview(bg_erp)
+            ui_ret = _save_input_preview(bg_erp, unique_id=unique_id)
 
         return {"ui": ui_ret, "result": (out_t,)}
 
@@ -126,7 +210,8 @@ class PanoramaCutoutNode:
     RETURN_TYPES = ("IMAGE",)
     RETURN_NAMES = ("rect_image",)
     OUTPUT_NODE = True
-    MAX_OUTPUT_SIDE = 4096
+    # Map bundles resolve shot sizes with the same limit.
+    MAX_OUTPUT_SIDE = BUNDLE_MAX_SIDE
     DEFAULT_LONG_SIDE = 1024
 
     @classmethod
@@ -147,6 +232,11 @@ class PanoramaCutoutNode:
                     {"default": 1.0, "min": 0.01, "step": 0.05},
                 ),
             },
+            "optional": {
+                "fast_math": ("BOOLEAN", {"default": False}),
+                "map_bundle": ("STRING", {"default": ""}),
+                "quality": (list(QUALITY_MODES), {"default": "export"}),
+            },
             "hidden": {
                 "unique_id": "UNIQUE_ID",
             },
@@ -161,51 +251,28 @@ class PanoramaCutoutNode:
             max_side=cls.MAX_OUTPUT_SIDE,
         )
 
+    @_profiled("node.cutout")
     def run(
         self,
         erp_image,
         state_json,
         output_megapixels=1.0,
         unique_id=None,
+        fast_math=False,
+        map_bundle="",
+        quality="export",
     ):
-        output_megapixels = max(0.01, finite_float(output_megapixels, 1.0))
-        state = merge_state(state_in=None, internal_state=state_json)
-        shots = state.get("shots", []) if isinstance(state, dict) else []
-        shot = shots[0] if shots else {
-            "yaw_deg": 0.0,
-            "pitch_deg": 0.0,
-            "hFOV_deg": 90.0,
-            "vFOV_deg": 60.0,
-            "roll_deg": 0.0,
-            "out_w": 1024,
-            "out_h": 1024,
-        }
-
-        yaw = finite_float(shot.get("yaw_deg", 0.0), 0.0)
-        pitch = finite_float(shot.get("pitch_deg", 0.0), 0.0)
-        hfov = float(np.clip(finite_float(shot.get("hFOV_deg", 90.0), 90.0), 1.0, 179.0))
-        vfov = float(np.clip(finite_float(shot.get("vFOV_deg", 60.0), 60.0), 1.0, 179.0))
-        roll = finite_float(shot.get("roll_deg", 0.0), 0.0)
-        ow_raw = finite_int(shot.get("out_w", 1024), 1024)
-        oh_raw = finite_int(shot.get("out_h", 1024), 1024)
-
-        # Logic: If out_w/out_h are explicitly customized (non-default/non-square/non-zero), use them.
-        # Otherwise, derive from megapixels target.
-        # Default in JSON is often 1024x1024.
-        use_megapixels = (ow_raw <= 0 or oh_raw <= 0 or (ow_raw == 1024 and oh_raw == 1024))
-
-        if use_megapixels:
-            ow, oh = calculate_dimensions_from_megapixels(
-                output_megapixels, hfov, vfov, max_side=self.MAX_OUTPUT_SIDE
-            )
-        else:
-            ow = int(np.clip(ow_raw, 8, self.MAX_OUTPUT_SIDE))
-            oh = int(np.clip(oh_raw, 8, self.MAX_OUTPUT_SIDE))
+        state = compile_state(merge_state(state_in=None, internal_state=state_json))
+        shot = state.shots[0] if state.shots else Shot()
+        yaw, pitch, hfov, vfov, roll = shot.yaw_deg, shot.pitch_deg, shot.hfov_deg, shot.vfov_deg, shot.roll_deg
+        ow, oh = shot.output_size(output_megapixels, self.MAX_OUTPUT_SIDE)
 
         src = None
         try:
             if erp_image is not None and hasattr(erp_image, "detach"):
-                arr = erp_image.detach().cpu().numpy().astype(np.float32)
+                # No dtype conversion here: the cutout only slices and converts
+                # the part of the ERP the shot samples.
+                arr = erp_image.detach().cpu().numpy()
                 if arr.ndim == 4 and arr.shape[0] > 0:
                     src = arr[0]
                 elif arr.ndim == 3:
@@ -229,10 +296,22 @@ class PanoramaCutoutNode:
 
         ui_ret = {}
         if erp_image is not None:
-            ui_ret = _save_input_preview(erp_image)
+            ui_ret = _save_input_preview(erp_image, unique_id=unique_id)
+
+        bundle = None
+        if isinstance(map_bundle, str) and map_bundle.strip():
+            try:
+                bundle = load_map_bundle(map_bundle.strip())
+            except Exception:
+                logging.getLogger(__name__).exception("Failed to load map bundle %s", map_bundle)
 
         try:
-            out = cutout_from_erp(src, yaw, pitch, hfov, vfov, roll, ow, oh)
+            out = cutout_from_erp(
+                src, yaw, pitch, hfov, vfov, roll, ow, oh,
+                fast_math=bool(fast_math),
+                map_bundle=bundle,
+                quality=quality if quality in QUALITY_MODES else "export",
+            )
             if out.ndim != 3 or out.shape[-1] != 3:
                 out = np.zeros((oh, ow, 3), dtype=np.float32)
             out_t = torch.from_numpy(out)[None, ...]
@@ -263,16 +342,20 @@ class PanoramaPreviewNode:
         return {
             "required": {
                 "erp_image": ("IMAGE",),
-            }
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+            },
         }
 
-    def run(self, erp_image):
+    @_profiled("node.preview")
+    def run(self, erp_image, unique_id=None):
         ui_ret = {}
         if erp_image is not None:
             # We use "pano_input_images" to pass the temp preview info to our frontend logic.
             # We do NOT copy this to "images" to avoid the standard ComfyUI preview widget
             # from double-rendering the image below our custom interactive preview.
-            ui_ret = _save_input_preview(erp_image)
+            ui_ret = _save_input_preview(erp_image, unique_id=unique_id)
         return {"ui": ui_ret}
 
 
@@ -0,0 +1,258 @@
+import asyncio
+import io
+import logging
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from .core import profiling
+from .core.assets import UPLOAD_SUBFOLDER, externalize_state_json, store_upload
+from .core.cutout import cutout_from_erp
+from .core.math import calculate_output_dimensions, finite_int
+from .core.model import compile_shot
+from .core.state import STATE_STORE, StateConflict
+from .core.stickers import resolve_asset_path
+from .core.thumbs import get_thumbnail
+
+try:
+    from aiohttp import web
+except ImportError:
+    web = None
+
+try:
+    from server import PromptServer
+except ImportError:
+    PromptServer = None
+
+# Node types whose state_json may carry embedded sticker images.
+STATE_NODE_TYPES = ("PanoramaStickers", "PanoramaCutout")
+
+CUTOUT_PREVIEW_MAX_SIDE = 2048
+_IMAGE_FORMATS = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+def externalize_prompt(json_data: dict) -> dict:
+    """Swaps data URL assets in queued prompts (and the workflow stored with them)
+    for content-addressed references, before they reach history or saved images."""
+    prompt = json_data.get("prompt") if isinstance(json_data, dict) else None
+    if isinstance(prompt, dict):
+        for node in prompt.values():
+            if not isinstance(node, dict) or node.get("class_type") not in STATE_NODE_TYPES:
+                continue
+            inputs = node.get("inputs")
+            if isinstance(inputs, dict) and isinstance(inputs.get("state_json"), str):
+                inputs["state_json"] = externalize_state_json(inputs["state_json"])
+
+    extra = json_data.get("extra_data") if isinstance(json_data, dict) else None
+    workflow = ((extra or {}).get("extra_pnginfo") or {}).get("workflow") if isinstance(extra, dict) else None
+    if isinstance(workflow, dict):
+        for node in workflow.get("nodes") or []:
+            if not isinstance(node, dict) or node.get("type") not in STATE_NODE_TYPES:
+                continue
+            values = node.get("widgets_values")
+            if isinstance(values, list):
+                node["widgets_values"] = [externalize_state_json(v) if isinstance(v, str) else v for v in values]
+    return json_data
+
+
+def _on_prompt(json_data):
+    # A fallback: the editor externalizes assets itself, so this normally
+    # finds no data URLs and parses nothing.
+    try:
+        return externalize_prompt(json_data)
+    except Exception:
+        logging.getLogger(__name__).exception("Failed to externalize panorama sticker assets")
+        return json_data
+
+
+async def _json_body(request):
+    try:
+        body = await request.json()
+    except Exception:
+        return None
+    return body if isinstance(body, dict) else None
+
+
+async def externalize_route(request):
+    body = await _json_body(request)
+    text = body.get("state_json") if body is not None else None
+    if not isinstance(text, str):
+        return web.json_response({"error": "state_json must be a string"}, status=400)
+    if "data:image" in text:
+        # Decoding, hashing and writing the files stays off the event loop.
+        text = await asyncio.get_running_loop().run_in_executor(None, externalize_state_json, text)
+    return web.json_response({"state_json": text})
+
+
+async def get_state_route(request):
+    entry = STATE_STORE.get(request.match_info["key"])
+    if entry is None:
+        return web.json_response({"error": "unknown state"}, status=404)
+    return web.json_response({"version": entry[0], "state": entry[1]})
+
+
+async def post_state_route(request):
+    # {"state": {...}} stores a full document; {"base_version": n, "ops": [...]}
+    # patches the latest version. Replies with the new version, or 409 and
+    # the current version when the base is stale.
+    key = request.match_info["key"]
+    body = await _json_body(request)
+    if body is None:
+        return web.json_response({"error": "body must be a JSON object"}, status=400)
+    try:
+        if "state" in body:
+            version = STATE_STORE.put(key, body["state"])
+        else:
+            version = STATE_STORE.patch(key, body.get("base_version", -1), body.get("ops"))
+    except StateConflict as e:
+        return web.json_response({"error": str(e), "version": e.version}, status=409)
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+    return web.json_response({"version": version, "state_ref": {"state_ref": key, "version": version}})
+
+
+def resolve_image_ref(ref) -> Path | None:
+    # A ComfyUI image entry ({"filename", "subfolder", "type"}) resolved with the
+    # sticker loader's directory and traversal checks.
+    if not isinstance(ref, dict):
+        return None
+    return resolve_asset_path({
+        "type": "comfy_image",
+        "filename": ref.get("filename"),
+        "subfolder": ref.get("subfolder"),
+        "storage": ref.get("type") or ref.get("storage") or "input",
+    })
+
+
+@lru_cache(maxsize=2)
+def _load_erp_cached(path: str, mtime_ns: int, size: int) -> np.ndarray:
+    # Decoded sources stay uint8; the cutout converts only the shot footprint.
+    with Image.open(path) as img:
+        arr = np.asarray(img.convert("RGB"))
+    arr.flags.writeable = False
+    profiling.add_cache_bytes("server.erp_sources", arr.nbytes)
+    return arr
+
+
+profiling.register_cache("server.erp_sources", _load_erp_cached)
+
+
+def load_erp_image(path) -> np.ndarray:
+    st = path.stat()
+    return _load_erp_cached(str(path), st.st_mtime_ns, st.st_size)
+
+
+def render_cutout_preview(path, shot: dict, long_side: int, fmt: str = "jpeg", quality: int = 85, fast_math: bool = True) -> bytes:
+    erp = load_erp_image(path)
+    s = compile_shot(shot if isinstance(shot, dict) else {})
+    ow, oh = calculate_output_dimensions(s.hfov_deg, s.vfov_deg, long_side=long_side, max_side=CUTOUT_PREVIEW_MAX_SIDE)
+    out = cutout_from_erp(erp, s.yaw_deg, s.pitch_deg, s.hfov_deg, s.vfov_deg, s.roll_deg, ow, oh, fast_math=fast_math)
+    pixels = np.clip(out * 255.0 + 0.5, 0.0, 255.0).astype(np.uint8)
+    bio = io.BytesIO()
+    Image.fromarray(pixels).save(bio, format=fmt.upper(), quality=int(quality))
+    return bio.getvalue()
+
+
+async def cutout_route(request):
+    # {"image": {filename, subfolder, type}, "shot": {...state shot...},
+    #  "long_side": 1024, "format": "jpeg"|"webp", "quality": 85, "fast_math": true}
+    body = await _json_body(request)
+    if body is None:
+        return web.json_response({"error": "body must be a JSON object"}, status=400)
+    path = resolve_image_ref(body.get("image"))
+    if path is None:
+        return web.json_response({"error": "image not found"}, status=404)
+    fmt = str(body.get("format") or "jpeg").lower()
+    if fmt not in _IMAGE_FORMATS:
+        return web.json_response({"error": f"unsupported format: {fmt}"}, status=400)
+    long_side = int(np.clip(finite_int(body.get("long_side", 1024), 1024), 8, CUTOUT_PREVIEW_MAX_SIDE))
+    quality = int(np.clip(finite_int(body.get("quality", 85), 85), 1, 100))
+    fast_math = bool(body.get("fast_math", True))
+    try:
+        data = await asyncio.get_running_loop().run_in_executor(
+            None, render_cutout_preview, path, body.get("shot"), long_side, fmt, quality, fast_math
+        )
+    except Exception as e:
+        logging.getLogger(__name__).exception("Cutout preview render failed")
+        return web.json_response({"error": str(e)}, status=500)
+    return web.Response(body=data, content_type=_IMAGE_FORMATS[fmt], headers={"Cache-Control": "no-store"})
+
+
+async def thumb_route(request):
+    # GET ?filename=&subfolder=&type=input|output|temp&size=512
+    q = request.rel_url.query
+    path = resolve_image_ref({"filename": q.get("filename"), "subfolder": q.get("subfolder"), "type": q.get("type")})
+    if path is None:
+        return web.json_response({"error": "image not found"}, status=404)
+    size = finite_int(q.get("size", 512), 512)
+    try:
+        thumb, key = await asyncio.get_running_loop().run_in_executor(None, get_thumbnail, path, size)
+    except Exception as e:
+        logging.getLogger(__name__).exception("Thumbnail failed for %s", path)
+        return web.json_response({"error": str(e)}, status=500)
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("If-None-Match") == etag:
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=thumb.read_bytes(), content_type="image/webp", headers=headers)
+
+
+async def upload_route(request):
+    # multipart: "image" file, optional "subfolder". Replies with a comfy_image
+    # asset; identical bytes already in the input directory are not written again.
+    try:
+        form = await request.post()
+    except Exception:
+        form = {}
+    field = form.get("image")
+    if field is None or not hasattr(field, "file"):
+        return web.json_response({"error": "missing image file"}, status=400)
+    data = field.file.read()
+    subfolder = str(form.get("subfolder") or UPLOAD_SUBFOLDER)
+    try:
+        asset = await asyncio.get_running_loop().run_in_executor(None, store_upload, data, field.filename, subfolder)
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+    except Exception as e:
+        logging.getLogger(__name__).exception("Sticker upload failed")
+        return web.json_response({"error": str(e)}, status=500)
+    return web.json_response(asset)
+
+
+async def profile_route(request):
+    # Cumulative span timings and cache stats; ?reset=1 clears the timings.
+    data = profiling.snapshot()
+    if request.rel_url.query.get("reset") in ("1", "true"):
+        profiling.reset()
+    return web.json_response(data)
+
+
+ROUTES = [
+    ("POST", "/pano_suite/assets/externalize", externalize_route),
+    ("GET", "/pano_suite/state/{key}", get_state_route),
+    ("POST", "/pano_suite/state/{key}", post_state_route),
+    ("POST", "/pano_suite/cutout", cutout_route),
+    ("GET", "/pano_suite/thumb", thumb_route),
+    ("POST", "/pano_suite/upload", upload_route),
+    ("GET", "/pano_suite/profile", profile_route),
+]
+
+
+def add_routes(router) -> None:
+    # Works for PromptServer's RouteTableDef and a plain aiohttp app router.
+    for method, path, handler in ROUTES:
+        if hasattr(router, "add_route"):
+            router.add_route(method, path, handler)
+        else:
+            router.route(method, path)(handler)
+
+
+def register_routes() -> bool:
+    if PromptServer is None or getattr(PromptServer, "instance", None) is None:
+        return False
+    server = PromptServer.instance
+    server.add_on_prompt_handler(_on_prompt)
+    add_routes(server.routes)
+    return True
@@ -111,11 +111,11 @@ def _normalize_gradio_rgb_image(value) -> np.ndarray | None:
     return np.clip(rgb, 0.0, 1.0)
 
 
-def on_render_cutout(generated_erp_image, cutout_state_json: str, output_megapixels: float):
+def on_render_cutout(generated_erp_image, cutout_state_json: str, output_megapixels: float, quality: str = "export"):
     erp = _normalize_gradio_rgb_image(generated_erp_image)
     if erp is None:
         raise RuntimeError("Generated panorama is missing. Please run Generate again.")
-    frame = render_cutout(erp, cutout_state_json, output_megapixels)
+    frame = render_cutout(erp, cutout_state_json, output_megapixels, quality)
     return frame, "Frame ready"
 
 
@@ -239,6 +239,14 @@ The first **Generate** may download the base model from Hugging Face into your l
                     elem_id="pano-output-megapixels",
                     scale=0,
                 )
+                render_quality = gr.Radio(
+                    choices=["export", "preview"],
+                    value="export",
+                    label="quality",
+                    info="preview renders at a quarter of the size and upscales, for fast framing.",
+                    elem_id="pano-render-quality",
+                    scale=0,
+                )
                 with gr.Row():
                     gr.Button("Save Frame", elem_id="pano-save-frame-btn", variant="primary")
                     gr.Button("Save ERP", elem_id="pano-save-erp-btn", variant="primary")
@@ -269,7 +277,7 @@ The first **Generate** may download the base model from Hugging Face into your l
         )
         render_btn.click(
             fn=on_render_cutout,
-            inputs=[generated_erp_image, cutout_state_json, output_megapixels],
+            inputs=[generated_erp_image, cutout_state_json, output_megapixels, render_quality],
             outputs=[frame_preview, status],
         )
 
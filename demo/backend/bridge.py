@@ -2,7 +2,6 @@ from __future__ import annotations
 
 import base64
 import io
-from copy import deepcopy
 
 import numpy as np
 from PIL import Image
@@ -30,7 +29,9 @@ def decode_dataurl_asset(asset: dict) -> np.ndarray:
 
 
 def materialize_state_assets_for_demo(state: dict) -> dict:
-    result = deepcopy(state if isinstance(state, dict) else {})
+    # Shallow: merge_state output shares nested data with its parse memo, and
+    # everything below builds new asset dicts instead of editing them.
+    result = dict(state) if isinstance(state, dict) else {}
     assets = result.get("assets")
     if not isinstance(assets, dict):
         result["assets"] = {}
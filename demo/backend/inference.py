@@ -8,7 +8,8 @@ import numpy as np
 from PIL import Image
 
 from comfyui_pano_suite.core.cutout import cutout_from_erp
-from comfyui_pano_suite.core.math import calculate_dimensions_from_megapixels, finite_float, finite_int
+from comfyui_pano_suite.core.math import QUALITY_MODES, finite_float, finite_int
+from comfyui_pano_suite.core.model import Shot, compile_state
 from comfyui_pano_suite.core.stickers import compose_stickers_to_erp
 
 from demo import config
@@ -213,33 +214,16 @@ def generate_erp(prompt: str, advanced_settings: str, stickers_state_json: str,
     return _generate_erp_with_diffusers(prompt, settings, stickers_state_json, progress_cb=progress_cb)
 
 
-def render_cutout(erp: np.ndarray, cutout_state_json: str, output_megapixels: float) -> np.ndarray:
+def render_cutout(erp: np.ndarray, cutout_state_json: str, output_megapixels: float, quality: str = "export") -> np.ndarray:
     if not isinstance(erp, np.ndarray) or erp.ndim != 3:
         return np.zeros((512, 512, 3), dtype=np.float32)
 
-    state = parse_state_json(cutout_state_json)
-    shots = state.get("shots", []) if isinstance(state, dict) else []
-    if shots:
-        first_shot = shots[0]
-        shot = first_shot if isinstance(first_shot, dict) else next((s for s in shots if isinstance(s, dict)), {})
-    else:
-        shot = {}
-
-    yaw = finite_float(shot.get("yaw_deg", 0.0), 0.0)
-    pitch = finite_float(shot.get("pitch_deg", 0.0), 0.0)
-    hfov = float(np.clip(finite_float(shot.get("hFOV_deg", 90.0), 90.0), 1.0, 179.0))
-    vfov = float(np.clip(finite_float(shot.get("vFOV_deg", 60.0), 60.0), 1.0, 179.0))
-    roll = finite_float(shot.get("roll_deg", 0.0), 0.0)
-    ow_raw = finite_int(shot.get("out_w", 1024), 1024)
-    oh_raw = finite_int(shot.get("out_h", 1024), 1024)
-    megapixels = max(0.01, finite_float(output_megapixels, 1.0))
-
-    use_megapixels = (ow_raw <= 0 or oh_raw <= 0 or (ow_raw == 1024 and oh_raw == 1024))
-    if use_megapixels:
-        out_w, out_h = calculate_dimensions_from_megapixels(megapixels, hfov, vfov, max_side=4096)
-    else:
-        out_w = int(np.clip(ow_raw, 8, 4096))
-        out_h = int(np.clip(oh_raw, 8, 4096))
+    state = compile_state(parse_state_json(cutout_state_json))
+    shot = state.shots[0] if state.shots else Shot()
+    out_w, out_h = shot.output_size(output_megapixels, 4096)
 
-    frame = cutout_from_erp(erp, yaw, pitch, hfov, vfov, roll, out_w, out_h)
+    frame = cutout_from_erp(
+        erp, shot.yaw_deg, shot.pitch_deg, shot.hfov_deg, shot.vfov_deg, shot.roll_deg, out_w, out_h,
+        quality=quality if quality in QUALITY_MODES else "export",
+    )
     return np.clip(np.asarray(frame, dtype=np.float32), 0.0, 1.0)
@@ -0,0 +1,302 @@
+"""End-to-end CPU benchmarks for the render hot paths.
+
+    python -m tests.benchmark_suite                      # run, compare with the baseline
+    python -m tests.benchmark_suite --quick -k cutout    # smaller subset
+    python -m tests.benchmark_suite --update-baseline    # rewrite the baseline
+
+Inputs are synthetic and seeded. Results are written as JSON; a case regresses
+when its median exceeds the baseline median by more than --threshold (and by
+more than MIN_REGRESSION_MS), and the process then exits with status 1. Baselines are machine specific: regenerate
+one on the machine that does the comparing.
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from comfyui_pano_suite.core import cutout as cutout_mod
+from comfyui_pano_suite.core import math as math_mod
+from comfyui_pano_suite.core import state as state_mod
+from comfyui_pano_suite.core import stickers as stickers_mod
+from comfyui_pano_suite.core.cutout import cutout_from_erp
+from comfyui_pano_suite.core.state import merge_state
+from comfyui_pano_suite.core.stickers import compose_stickers_to_erp
+
+DEFAULT_BASELINE = Path(__file__).with_name("benchmark_baseline.json")
+DEFAULT_THRESHOLD = 1.3
+# Differences below this are timer noise, whatever the ratio.
+MIN_REGRESSION_MS = 0.5
+MIN_TIME_S = 0.5
+MAX_REPEATS = 7
+
+CUTOUT_FOVS = ((60.0, 40.0), (90.0, 60.0), (120.0, 80.0))
+CUTOUT_LONG_SIDES = (512, 1024, 2048)
+POLE_PITCH = 80.0
+COMPOSE_PRESETS = (1024, 2048, 4096)
+COMPOSE_COUNTS = (1, 10, 100)
+
+
+def _rng(seed: int) -> np.random.Generator:
+    return np.random.default_rng(seed)
+
+
+def _erp(w: int, h: int, seed: int = 0) -> np.ndarray:
+    # Smooth gradients plus noise, so sampling cost is not data dependent.
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    base = np.stack([xx / w, yy / h, 0.5 + 0.5 * np.sin(xx / 37.0)], axis=-1)
+    return np.clip(base + _rng(seed).random((h, w, 3), dtype=np.float32) * 0.1, 0.0, 1.0)
+
+
+def _png_bytes(side: int, seed: int) -> bytes:
+    arr = (_rng(seed).random((side, side, 4)) * 255).astype(np.uint8)
+    bio = io.BytesIO()
+    Image.fromarray(arr, "RGBA").save(bio, format="PNG", compress_level=1)
+    return bio.getvalue()
+
+
+def _dataurl(side: int, seed: int) -> str:
+    return "data:image/png;base64," + base64.b64encode(_png_bytes(side, seed)).decode("ascii")
+
+
+def _sticker_state(count: int, n_assets: int = 4, asset_side: int = 256) -> dict:
+    rng = _rng(count)
+    assets = {f"a{i}": {"type": "dataurl", "value": _dataurl(asset_side, i)} for i in range(n_assets)}
+    stickers = [
+        {
+            "id": f"s{i}",
+            "asset_id": f"a{i % n_assets}",
+            "yaw_deg": float(rng.uniform(-180.0, 180.0)),
+            "pitch_deg": float(rng.uniform(-60.0, 60.0)),
+            "hFOV_deg": float(rng.uniform(10.0, 40.0)),
+            "vFOV_deg": float(rng.uniform(10.0, 40.0)),
+            "rot_deg": float(rng.uniform(-30.0, 30.0)),
+            "z_index": i,
+        }
+        for i in range(count)
+    ]
+    return {"bg_color": "#203040", "assets": assets, "stickers": stickers, "shots": []}
+
+
+def _clear_caches():
+    cutout_mod._camera_ray_grid.cache_clear()
+    cutout_mod._yaw0_uv_maps.cache_clear()
+    state_mod._parse_state_text.cache_clear()
+    stickers_mod._load_dataurl_cached.cache_clear()
+    stickers_mod._load_hashed_file_cached.cache_clear()
+
+
+@contextmanager
+def _sampling_backend(name: str):
+    saved = (math_mod.HAS_TORCH, math_mod.HAS_CV2)
+    math_mod.HAS_TORCH = name == "torch"
+    math_mod.HAS_CV2 = name == "cv2"
+    try:
+        yield
+    finally:
+        math_mod.HAS_TORCH, math_mod.HAS_CV2 = saved
+
+
+def _available_backends() -> list[str]:
+    out = ["numpy"]
+    if math_mod.HAS_CV2:
+        out.insert(0, "cv2")
+    if math_mod.HAS_TORCH:
+        out.insert(0, "torch")
+    return out
+
+
+def build_cases(quick: bool = False) -> list[tuple[str, object, object]]:
+    """(name, setup, fn) triples; setup() runs before every repeat and is not timed."""
+    cases = []
+    erp_w, erp_h = (4096, 2048) if quick else (8192, 4096)
+    erp = _erp(erp_w, erp_h)
+    poses = [(float(y), float(p)) for y, p in zip(_rng(1).uniform(-180, 180, 16), _rng(2).uniform(-40, 40, 16))]
+
+    fovs = CUTOUT_FOVS[1:2] if quick else CUTOUT_FOVS
+    sides = CUTOUT_LONG_SIDES[:2] if quick else CUTOUT_LONG_SIDES
+    for hfov, vfov in fovs:
+        for side in sides:
+            ow, oh = math_mod.calculate_output_dimensions(hfov, vfov, long_side=side)
+            for fast in (False, True):
+                pose = iter(poses * 1000)
+
+                def run(hfov=hfov, vfov=vfov, ow=ow, oh=oh, fast=fast, pose=pose):
+                    yaw, pitch = next(pose)
+                    cutout_from_erp(erp, yaw, pitch, hfov, vfov, 0.0, ow, oh, fast_math=fast)
+
+                tag = "fast" if fast else "exact"
+                cases.append((f"cutout/erp{erp_w}/{int(hfov)}x{int(vfov)}/{side}/{tag}", _clear_caches, run))
+
+    # A pole in frame: fast math has to reject it and fall back to exact maps.
+    for side in sides:
+        ow, oh = math_mod.calculate_output_dimensions(90.0, 60.0, long_side=side)
+        for fast in (False, True):
+            pose = iter([(float(y), POLE_PITCH) for y, _ in poses] * 1000)
+
+            def run(ow=ow, oh=oh, fast=fast, pose=pose):
+                yaw, pitch = next(pose)
+                cutout_from_erp(erp, yaw, pitch, 90.0, 60.0, 0.0, ow, oh, fast_math=fast)
+
+            tag = "fast" if fast else "exact"
+            cases.append((f"cutout/erp{erp_w}/pole/{side}/{tag}", _clear_caches, run))
+
+    presets = COMPOSE_PRESETS[:2] if quick else COMPOSE_PRESETS
+    counts = COMPOSE_COUNTS[:2] if quick else COMPOSE_COUNTS
+    for count in counts:
+        state = _sticker_state(count)
+        for preset in presets:
+            for quality in ("export", "preview"):
+                def run(state=state, preset=preset, quality=quality):
+                    compose_stickers_to_erp(state, preset, preset // 2, quality=quality)
+
+                cases.append((f"compose/{count}/{preset}/{quality}", stickers_mod._load_dataurl_cached.cache_clear, run))
+
+    # A multi-MB state: large embedded assets plus many stickers.
+    big = _sticker_state(200, n_assets=4, asset_side=512)
+    text = json.dumps(big)
+    size_mb = len(text) / 1e6
+    cases.append((f"merge_state/{size_mb:.0f}MB/cold", state_mod._parse_state_text.cache_clear, lambda: merge_state(None, text)))
+    cases.append((f"merge_state/{size_mb:.0f}MB/warm", lambda: merge_state(None, text), lambda: merge_state(None, text)))
+
+    asset_side = 512 if quick else 1024
+    url = _dataurl(asset_side, 7)
+    cases.append((f"asset_decode/dataurl/{asset_side}", stickers_mod._load_dataurl_cached.cache_clear, lambda: stickers_mod._load_dataurl_cached(url)))
+    tmp = Path(tempfile.mkdtemp(prefix="pano_bench_"))
+    png = tmp / "asset.png"
+    png.write_bytes(_png_bytes(asset_side, 8))
+    cases.append((f"asset_decode/file/{asset_side}", None, lambda: stickers_mod._load_asset_rgba({"type": "path", "value": str(png)}, base_dir=tmp)))
+
+    rng = _rng(3)
+    su = (rng.random((1024, 1024), dtype=np.float32) * erp_w).astype(np.float32)
+    sv = (rng.random((1024, 1024), dtype=np.float32) * (erp_h - 1)).astype(np.float32)
+    for backend in _available_backends():
+        def run(backend=backend):
+            with _sampling_backend(backend):
+                math_mod.sample_erp_bilinear(erp, su, sv)
+
+        cases.append((f"sample/{backend}/erp{erp_w}/1024x1024", None, run))
+    return cases
+
+
+def time_case(setup, fn, min_time: float = MIN_TIME_S, max_repeats: int = MAX_REPEATS) -> dict:
+    if setup is not None:
+        setup()
+    fn()  # warm-up: imports, allocator, lazy initialisation
+    times = []
+    total = 0.0
+    while len(times) < max_repeats and (total < min_time or len(times) < 3):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        times.append(dt * 1000.0)
+        total += dt
+        if dt > min_time * 4:
+            break
+    return {
+        "median_ms": round(statistics.median(times), 3),
+        "min_ms": round(min(times), 3),
+        "repeats": len(times),
+    }
+
+
+def environment() -> dict:
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "sample_backend": math_mod.SAMPLE_BACKEND,
+    }
+    if math_mod.HAS_TORCH:
+        import torch
+
+        info["torch"] = torch.__version__
+        info["torch_threads"] = torch.get_num_threads()
+    return info
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[dict]:
+    rows = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if not base:
+            rows.append({"name": name, "median_ms": res["median_ms"], "baseline_ms": None, "ratio": None, "regressed": False})
+            continue
+        ratio = res["median_ms"] / max(base["median_ms"], 1e-9)
+        rows.append({
+            "name": name,
+            "median_ms": res["median_ms"],
+            "baseline_ms": base["median_ms"],
+            "ratio": round(ratio, 3),
+            "regressed": ratio > threshold and res["median_ms"] - base["median_ms"] > MIN_REGRESSION_MS,
+        })
+    return rows
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-k", "--filter", default="", help="only run cases whose name contains this text")
+    ap.add_argument("--quick", action="store_true", help="smaller inputs and fewer cases")
+    ap.add_argument("--out", default="benchmark_results.json", help="JSON results path")
+    ap.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    ap.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed median ratio over the baseline")
+    ap.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    args = ap.parse_args(argv)
+
+    results = {}
+    for name, setup, fn in build_cases(quick=args.quick):
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = time_case(setup, fn)
+        print(f"{name:<44} {results[name]['median_ms']:>10.2f} ms", flush=True)
+
+    baseline_path = Path(args.baseline)
+    baseline = {}
+    if baseline_path.is_file():
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8")).get("results", {})
+    rows = compare(results, baseline, args.threshold)
+
+    payload = {
+        "environment": environment(),
+        "quick": args.quick,
+        "threshold": args.threshold,
+        "results": results,
+        "comparison": rows,
+    }
+    Path(args.out).write_text(json.dumps(payload, indent=2), encoding="utf-8")
+
+    if args.update_baseline:
+        merged = {**baseline, **results}
+        baseline_path.write_text(
+            json.dumps({"environment": environment(), "results": dict(sorted(merged.items()))}, indent=2) + "\n",
+            encoding="utf-8",
+        )
+        print(f"baseline updated: {baseline_path}")
+        return 0
+
+    regressed = [r for r in rows if r["regressed"]]
+    for r in regressed:
+        print(f"REGRESSION {r['name']}: {r['median_ms']:.2f} ms vs {r['baseline_ms']:.2f} ms (x{r['ratio']:.2f})")
+    missing = sum(1 for r in rows if r["baseline_ms"] is None)
+    if missing:
+        print(f"{missing} case(s) have no baseline")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+import base64
+import hashlib
+import io
+import json
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from comfyui_pano_suite.core import assets as assets_mod
+from comfyui_pano_suite.core import stickers as stickers_mod
+from comfyui_pano_suite.server import externalize_prompt
+
+
+def _dataurl(color=(10, 20, 30, 255)):
+    bio = io.BytesIO()
+    Image.new("RGBA", (3, 2), color=color).save(bio, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(bio.getvalue()).decode("ascii")
+
+
+class _DummyFolderPaths:
+    def __init__(self, input_dir):
+        self._input = str(input_dir)
+
+    def get_input_directory(self):
+        return self._input
+
+
+def test_externalize_replaces_dataurls_with_hash_refs(tmp_path):
+    du = _dataurl()
+    text = json.dumps({
+        "assets": {
+            "a": {"type": "dataurl", "value": du, "w": 3, "h": 2},
+            "b": {"type": "comfy_image", "filename": "x.png"},
+        },
+        "stickers": [{"asset_id": "a"}],
+    })
+    out = json.loads(assets_mod.externalize_state_json(text, store_dir=tmp_path))
+
+    ref = out["assets"]["a"]
+    assert ref["type"] == "hash" and ref["ext"] == "png" and "value" not in ref
+    assert (ref["w"], ref["h"]) == (3, 2)
+    assert out["assets"]["b"] == {"type": "comfy_image", "filename": "x.png"}
+    assert out["stickers"] == [{"asset_id": "a"}]
+    assert (tmp_path / f"{ref['hash']}.png").read_bytes() == base64.b64decode(du.split(",", 1)[1])
+
+    # Same content lands on the same file; text without data URLs is untouched.
+    again = json.loads(assets_mod.externalize_state_json(text, store_dir=tmp_path))
+    assert again["assets"]["a"]["hash"] == ref["hash"]
+    assert len(list(tmp_path.iterdir())) == 1
+    plain = json.dumps({"assets": {}})
+    assert assets_mod.externalize_state_json(plain, store_dir=tmp_path) is plain
+
+
+def test_externalize_handles_embedded_state_refs(tmp_path):
+    text = json.dumps({"state_ref": "k", "version": 2, "state": {"assets": {"a": {"type": "dataurl", "value": _dataurl()}}}})
+    out = json.loads(assets_mod.externalize_state_json(text, store_dir=tmp_path))
+    assert (out["state_ref"], out["version"]) == ("k", 2)
+    assert out["state"]["assets"]["a"]["type"] == "hash"
+    bare = json.dumps({"state_ref": "k", "version": 2})
+    assert assets_mod.externalize_state_json(bare, store_dir=tmp_path) is bare
+
+
+def test_hash_assets_load_from_store(monkeypatch, tmp_path):
+    monkeypatch.setattr(assets_mod, "folder_paths", _DummyFolderPaths(tmp_path))
+    state = json.loads(assets_mod.externalize_state_json(json.dumps({"assets": {"a": {"type": "dataurl", "value": _dataurl()}}})))
+    ref = state["assets"]["a"]
+    assert (tmp_path / assets_mod.ASSET_SUBFOLDER / f"{ref['hash']}.png").is_file()
+
+    rgba = stickers_mod._load_asset_rgba(ref)
+    assert rgba is not None and rgba.shape == (2, 3, 4)
+    assert np.allclose(rgba[0, 0], np.array([10, 20, 30, 255]) / 255.0)
+
+    assert stickers_mod._load_asset_rgba({"type": "hash", "hash": "../../etc/passwd"}) is None
+    assert stickers_mod._load_asset_rgba({"type": "hash", "hash": "0" * 64}) is None
+
+
+def test_externalize_prompt_rewrites_inputs_and_workflow(monkeypatch, tmp_path):
+    monkeypatch.setattr(assets_mod, "folder_paths", _DummyFolderPaths(tmp_path))
+    text = json.dumps({"assets": {"a": {"type": "dataurl", "value": _dataurl()}}})
+    data = {
+        "prompt": {
+            "1": {"class_type": "PanoramaStickers", "inputs": {"state_json": text}},
+            "2": {"class_type": "Other", "inputs": {"state_json": text}},
+        },
+        "extra_data": {"extra_pnginfo": {"workflow": {"nodes": [
+            {"type": "PanoramaStickers", "widgets_values": ["2048 x 1024", "#00ff00", text]},
+        ]}}},
+    }
+    out = externalize_prompt(data)
+    assert "data:image" not in out["prompt"]["1"]["inputs"]["state_json"]
+    assert out["prompt"]["2"]["inputs"]["state_json"] is text
+    assert "data:image" not in out["extra_data"]["extra_pnginfo"]["workflow"]["nodes"][0]["widgets_values"][2]
+
+
+def _png_bytes(color):
+    bio = io.BytesIO()
+    Image.new("RGBA", (3, 2), color=color).save(bio, format="PNG")
+    return bio.getvalue()
+
+
+def test_store_upload_deduplicates_against_input_dir(tmp_path):
+    root = tmp_path / "input"
+    (root / "old").mkdir(parents=True)
+    red = _png_bytes((255, 0, 0, 255))
+    (root / "old" / "red.png").write_bytes(red)
+    assets_mod.input_hash_index(root).refresh()
+
+    hit = assets_mod.store_upload(red, "mine.png", input_dir=root)
+    assert hit["deduplicated"] is True
+    assert (hit["type"], hit["subfolder"], hit["filename"], hit["storage"]) == ("comfy_image", "old", "red.png", "input")
+    assert not (root / assets_mod.UPLOAD_SUBFOLDER).exists()
+
+    blue = _png_bytes((0, 0, 255, 255))
+    first = assets_mod.store_upload(blue, "red.png", subfolder="old", input_dir=root)
+    assert first["deduplicated"] is False
+    assert first["filename"] == "red (1).png"
+    assert assets_mod.store_upload(blue, "other.png", input_dir=root)["filename"] == "red (1).png"
+
+    assets_mod.input_hash_index(root).refresh()
+    index = json.loads((root / assets_mod.ASSET_SUBFOLDER / assets_mod.INPUT_INDEX_NAME).read_text())
+    assert set(index["files"]) == {"old/red.png", "old/red (1).png"}
+
+
+def test_input_index_rehashes_changed_files_only(tmp_path, monkeypatch):
+    root = tmp_path / "input"
+    root.mkdir()
+    (root / "a.png").write_bytes(_png_bytes((1, 2, 3, 255)))
+    (root / "b.png").write_bytes(_png_bytes((4, 5, 6, 255)))
+    index = assets_mod.InputHashIndex(root)
+    index.refresh()
+    index.save()
+
+    hashed = []
+    real = assets_mod._sha256_file
+    monkeypatch.setattr(assets_mod, "_sha256_file", lambda p: hashed.append(p.name) or real(p))
+    reloaded = assets_mod.InputHashIndex(root)
+    assert reloaded.refresh() is False and hashed == []
+
+    new = _png_bytes((7, 8, 9, 255))
+    (root / "b.png").write_bytes(new)
+    assert reloaded.refresh() is True and hashed == ["b.png"]
+    assert reloaded.find(hashlib.sha256(new).hexdigest()) == "b.png"
+
+
+def test_store_upload_refreshes_index_off_the_request_path(tmp_path, monkeypatch):
+    root = tmp_path / "input"
+    root.mkdir()
+    red = _png_bytes((255, 0, 0, 255))
+    (root / "red.png").write_bytes(red)
+
+    hashed = []
+    real = assets_mod._sha256_file
+    monkeypatch.setattr(assets_mod, "_sha256_file", lambda p: hashed.append(threading.get_ident()) or real(p))
+    first = assets_mod.store_upload(_png_bytes((0, 255, 0, 255)), "green.png", input_dir=root)
+    assert first["deduplicated"] is False
+    index = assets_mod.input_hash_index(root)
+    index._refresh_thread.join(5)
+    assert hashed and threading.get_ident() not in hashed
+
+    # The background scan indexed the pre-existing file and kept the upload.
+    assert assets_mod.store_upload(red, "mine.png", input_dir=root)["filename"] == "red.png"
+    assert index.find(first["hash"]) == f"{assets_mod.UPLOAD_SUBFOLDER}/green.png"
+    # Recently refreshed: no further scans until the interval passes.
+    assert index.refresh_in_background() is None
+    assert index.refresh_in_background(max_age=0) is not None
+    index._refresh_thread.join(5)
+
+
+def test_input_index_keeps_entries_added_during_a_scan(tmp_path, monkeypatch):
+    root = tmp_path / "input"
+    root.mkdir()
+    (root / "a.png").write_bytes(_png_bytes((1, 2, 3, 255)))
+    up = _png_bytes((9, 9, 9, 255))
+    index = assets_mod.InputHashIndex(root)
+
+    real = assets_mod._sha256_file
+
+    def hash_and_upload(p):
+        # An upload lands after the walk, while the scan is still hashing.
+        if not (root / "up.png").exists():
+            (root / "up.png").write_bytes(up)
+            index.add("up.png", hashlib.sha256(up).hexdigest())
+        return real(p)
+
+    monkeypatch.setattr(assets_mod, "_sha256_file", hash_and_upload)
+    index.refresh()
+    assert index.find(hashlib.sha256(up).hexdigest()) == "up.png"
+    assert index.find(real(root / "a.png")) == "a.png"
+
+
+def test_store_upload_rejects_bad_names_and_subfolders(tmp_path):
+    data = _png_bytes((1, 1, 1, 255))
+    with pytest.raises(ValueError):
+        assets_mod.store_upload(data, "evil.exe", input_dir=tmp_path)
+    with pytest.raises(ValueError):
+        assets_mod.store_upload(data, "ok.png", subfolder="../..", input_dir=tmp_path)
+    ref = assets_mod.store_upload(data, "../../x.png", input_dir=tmp_path)
+    assert (tmp_path / ref["subfolder"] / ref["filename"]).read_bytes() == data
@@ -0,0 +1,11 @@
+from tests.benchmark_suite import compare
+
+
+def test_compare_flags_only_real_regressions():
+    baseline = {"a": {"median_ms": 10.0}, "b": {"median_ms": 10.0}, "tiny": {"median_ms": 0.01}}
+    results = {"a": {"median_ms": 14.0}, "b": {"median_ms": 12.0}, "tiny": {"median_ms": 0.05}, "new": {"median_ms": 1.0}}
+    rows = {r["name"]: r for r in compare(results, baseline, threshold=1.3)}
+    assert rows["a"]["regressed"] and rows["a"]["ratio"] == 1.4
+    assert not rows["b"]["regressed"]
+    assert not rows["tiny"]["regressed"]
+    assert rows["new"]["baseline_ms"] is None and not rows["new"]["regressed"]
@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+
+from comfyui_pano_suite.core import cutout as cutout_mod
+from comfyui_pano_suite.core.cutout import FAST_MAP_MAX_ERR_PX, cutout_from_erp, cutout_uv_maps
+from comfyui_pano_suite.core.math import sample_erp_bilinear
+
+
+def _wrapped_u_error(u_a, u_b, erp_w):
+    du = np.abs(u_a - u_b)
+    return np.minimum(du, erp_w - du)
+
+
+@pytest.mark.parametrize(
+    "shot",
+    [
+        (0.0, 0.0, 90.0, 60.0, 0.0, 512, 384),
+        (179.0, -20.0, 70.0, 50.0, 5.0, 384, 320),
+        (-120.0, 35.0, 120.0, 80.0, -15.0, 640, 400),
+        (45.0, 60.0, 40.0, 30.0, 30.0, 256, 192),
+    ],
+)
+def test_fast_math_maps_within_error_budget(shot):
+    erp_w, erp_h = 2048, 1024
+    assert cutout_mod._fast_cutout_uv(*shot, erp_w, erp_h) is not None
+    u_exact, v_exact = cutout_uv_maps(*shot, erp_w, erp_h)
+    u_fast, v_fast = cutout_uv_maps(*shot, erp_w, erp_h, fast_math=True)
+
+    assert u_fast.shape == u_exact.shape
+    assert float(_wrapped_u_error(u_fast, u_exact, erp_w).max()) <= FAST_MAP_MAX_ERR_PX
+    assert float(np.abs(v_fast - v_exact).max()) <= FAST_MAP_MAX_ERR_PX
+
+
+def test_fast_math_falls_back_to_exact_when_pole_is_in_frame():
+    erp_w, erp_h = 2048, 1024
+    shot = (10.0, 80.0, 100.0, 80.0, 0.0, 256, 256)
+    assert cutout_mod._fast_cutout_uv(*shot, erp_w, erp_h) is None
+
+    u_exact, v_exact = cutout_uv_maps(*shot, erp_w, erp_h)
+    u_fast, v_fast = cutout_uv_maps(*shot, erp_w, erp_h, fast_math=True)
+    assert np.array_equal(u_fast, u_exact)
+    assert np.array_equal(v_fast, v_exact)
+
+
+def test_fast_math_rejects_pole_frames_without_probing(monkeypatch):
+    probes = []
+    real = cutout_mod._shot_lon_lat
+    monkeypatch.setattr(cutout_mod, "_shot_lon_lat", lambda *a: probes.append(1) or real(*a))
+    assert cutout_mod._pole_in_frame(10.0, 80.0, 100.0, 80.0, 0.0)
+    assert cutout_mod._pole_in_frame(0.0, -70.0, 90.0, 60.0, 90.0)
+    assert not cutout_mod._pole_in_frame(0.0, 40.0, 90.0, 60.0, 0.0)
+    assert cutout_mod._fast_cutout_uv(10.0, 80.0, 100.0, 80.0, 0.0, 256, 256, 2048, 1024) is None
+    assert probes == []
+
+
+def test_fast_math_skips_steps_predicted_to_fail(monkeypatch):
+    probed = []
+    real = cutout_mod._shot_lon_lat
+    monkeypatch.setattr(cutout_mod, "_shot_lon_lat", lambda *a: probed.append(len(a[-2])) or real(*a))
+    # Small output on a large ERP: every output pixel spans many ERP pixels, so
+    # the step-8 error is far above what halving the step can fix.
+    assert cutout_mod._fast_cutout_uv(0.0, 30.0, 120.0, 80.0, 0.0, 128, 86, 16384, 8192) is None
+    assert len(probed) == 4
+
+
+def test_cutout_fast_math_matches_exact_image():
+    rng = np.random.default_rng(0)
+    erp = rng.random((256, 512, 3)).astype(np.float32)
+    exact = cutout_from_erp(erp, 30.0, 10.0, 90.0, 60.0, 5.0, 128, 96)
+    fast = cutout_from_erp(erp, 30.0, 10.0, 90.0, 60.0, 5.0, 128, 96, fast_math=True)
+
+    assert fast.shape == exact.shape == (96, 128, 3)
+    assert fast.dtype == np.float32
+    # A sub-pixel map error can only move each sample a fraction of a texel.
+    assert float(np.abs(fast - exact).mean()) < 0.05
+
+
+def test_camera_rays_are_cached_per_intrinsics():
+    a = cutout_mod._camera_ray_grid(90.0, 60.0, 64, 48)
+    b = cutout_mod._camera_ray_grid(90.0, 60.0, 64, 48)
+    assert a is b
+    assert not a.flags.writeable
+    assert np.allclose(np.linalg.norm(a, axis=-1), 1.0, atol=1e-6)
+
+
+def test_rotation_only_update_tracks_orientation():
+    erp_w, erp_h = 1024, 512
+    for yaw, pitch, roll in [(0.0, 0.0, 0.0), (90.0, 20.0, 15.0), (-150.0, -45.0, -30.0)]:
+        u, v = cutout_uv_maps(yaw, pitch, 60.0, 60.0, roll, 64, 64, erp_w, erp_h)
+        # The frame center lies between the four middle pixels.
+        cu = float(np.mean(u[31:33, 31:33]))
+        cv = float(np.mean(v[31:33, 31:33]))
+        assert abs(cu - ((yaw / 360.0) + 0.5) * erp_w) < 0.5
+        assert abs(cv - (0.5 - pitch / 180.0) * erp_h) < 0.5
+
+
+def test_yaw_change_reuses_shifted_maps():
+    erp_w, erp_h = 1024, 512
+    cutout_mod._yaw0_uv_maps.cache_clear()
+    u_a, v_a = cutout_uv_maps(10.0, 15.0, 80.0, 60.0, 5.0, 96, 64, erp_w, erp_h)
+    u_b, v_b = cutout_uv_maps(-135.0, 15.0, 80.0, 60.0, 5.0, 96, 64, erp_w, erp_h)
+    info = cutout_mod._yaw0_uv_maps.cache_info()
+    assert info.misses == 1 and info.hits == 1
+
+    du = np.mod(u_b - u_a, erp_w)
+    assert np.allclose(du, (-145.0 / 360.0) % 1.0 * erp_w, atol=1e-2)
+    assert np.array_equal(v_a, v_b)
+    assert float(u_b.min()) >= 0.0 and float(u_b.max()) < erp_w
+
+
+@pytest.mark.parametrize("shot", [(30.0, 10.0, 90.0, 60.0, 5.0), (0.0, 80.0, 120.0, 90.0, 0.0), (179.0, -30.0, 60.0, 40.0, -20.0)])
+def test_banded_cutout_matches_full_frame(shot):
+    rng = np.random.default_rng(1)
+    erp = rng.random((128, 256, 3)).astype(np.float32)
+    full = cutout_from_erp(erp, *shot, 96, 72)
+    banded = cutout_from_erp(erp, *shot, 96, 72, band_pixels=96 * 10)
+
+    assert banded.shape == full.shape == (72, 96, 3)
+    assert banded.dtype == np.float32
+    assert np.allclose(banded, full, atol=1e-4)
+
+
+def test_preview_quality_cutout_is_close_to_export():
+    yy, xx = np.mgrid[0:256, 0:512].astype(np.float32)
+    erp = np.stack([xx / 512.0, yy / 256.0, np.full_like(xx, 0.5)], axis=-1)
+    export = cutout_from_erp(erp, 20.0, 10.0, 90.0, 60.0, 0.0, 640, 424)
+    preview = cutout_from_erp(erp, 20.0, 10.0, 90.0, 60.0, 0.0, 640, 424, quality="preview")
+    assert preview.shape == export.shape
+    assert float(np.abs(preview - export).mean()) < 0.01
+
+
+@pytest.mark.parametrize("flip", [np.s_[:, ::-1], np.s_[::-1], np.s_[..., ::-1]])
+def test_cutout_accepts_reversed_views(flip):
+    rng = np.random.default_rng(2)
+    erp = rng.random((64, 128, 3)).astype(np.float32)
+    view = erp[flip]
+    expected = cutout_from_erp(np.ascontiguousarray(view), 20.0, 10.0, 90.0, 60.0, 0.0, 48, 32)
+    out = cutout_from_erp(view, 20.0, 10.0, 90.0, 60.0, 0.0, 48, 32)
+    assert np.allclose(out, expected, atol=1e-6)
+    u = np.full((2, 2), 5.5, np.float32)
+    v = np.full((2, 2), 7.25, np.float32)
+    assert np.allclose(sample_erp_bilinear(view, u, v), sample_erp_bilinear(np.ascontiguousarray(view), u, v))
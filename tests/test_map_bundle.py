@@ -0,0 +1,68 @@
+import json
+
+import numpy as np
+import pytest
+
+from comfyui_pano_suite.core.cutout import cutout_from_erp, cutout_uv_maps
+from comfyui_pano_suite.core.map_bundle import DEFAULT_MAX_SIDE, MANIFEST_NAME, compile_map_bundle, load_map_bundle
+from comfyui_pano_suite.core.model import compile_shot
+
+SHOTS = [
+    {"yaw_deg": 30.0, "pitch_deg": 10.0, "hFOV_deg": 90.0, "vFOV_deg": 60.0, "roll_deg": 5.0, "out_w": 96, "out_h": 64},
+    {"yaw_deg": -170.0, "pitch_deg": 85.0, "hFOV_deg": 70.0, "vFOV_deg": 70.0, "roll_deg": 0.0, "out_w": 64, "out_h": 64},
+]
+
+
+def test_bundle_maps_match_computed_maps(tmp_path):
+    compile_map_bundle(SHOTS, 512, 256, tmp_path)
+    bundle = load_map_bundle(tmp_path)
+    assert len(bundle) == 2
+
+    u, v = bundle.get(30.0, 10.0, 90.0, 60.0, 5.0, 96, 64, 512, 256)
+    assert isinstance(u, np.memmap)
+    u_ref, v_ref = cutout_uv_maps(30.0, 10.0, 90.0, 60.0, 5.0, 96, 64, 512, 256)
+    assert np.array_equal(u, u_ref) and np.array_equal(v, v_ref)
+
+    # Keyed by ERP size as well as geometry.
+    assert bundle.get(30.0, 10.0, 90.0, 60.0, 5.0, 96, 64, 1024, 512) is None
+
+
+@pytest.mark.parametrize("band_pixels", [None, 64 * 5])
+def test_cutout_with_bundle_matches_direct(tmp_path, band_pixels):
+    rng = np.random.default_rng(4)
+    erp = rng.random((256, 512, 3)).astype(np.float32)
+    compile_map_bundle(SHOTS, 512, 256, tmp_path)
+    bundle = load_map_bundle(tmp_path)
+
+    for shot in SHOTS:
+        args = [shot[k] for k in ("yaw_deg", "pitch_deg", "hFOV_deg", "vFOV_deg", "roll_deg", "out_w", "out_h")]
+        direct = cutout_from_erp(erp, *args, band_pixels=band_pixels)
+        bundled = cutout_from_erp(erp, *args, band_pixels=band_pixels, map_bundle=bundle)
+        # The streaming path builds its maps per band, so allow float rounding.
+        assert np.allclose(bundled, direct, atol=1e-3)
+
+
+def test_bundle_rejects_other_versions(tmp_path):
+    compile_map_bundle(SHOTS[:1], 512, 256, tmp_path)
+    manifest = json.loads((tmp_path / MANIFEST_NAME).read_text())
+    manifest["version"] = 999
+    (tmp_path / MANIFEST_NAME).write_text(json.dumps(manifest))
+    with pytest.raises(ValueError):
+        load_map_bundle(tmp_path)
+
+
+def test_default_size_shots_resolve_like_the_node(tmp_path, caplog):
+    # The editor's default 1024x1024 means "derive from megapixels", and FOVs are clamped.
+    raw = {"yaw_deg": 10.0, "pitch_deg": 0.0, "hFOV_deg": 200.0, "vFOV_deg": 60.0, "out_w": 1024, "out_h": 1024}
+    compile_map_bundle([raw], 512, 256, tmp_path, megapixels=0.05)
+    bundle = load_map_bundle(tmp_path)
+
+    shot = compile_shot(raw)
+    ow, oh = shot.output_size(0.05, DEFAULT_MAX_SIDE)
+    assert (ow, oh) != (1024, 1024)
+    assert bundle.get(shot.yaw_deg, shot.pitch_deg, shot.hfov_deg, shot.vfov_deg, shot.roll_deg, ow, oh, 512, 256) is not None
+
+    with caplog.at_level("WARNING"):
+        assert bundle.get(shot.yaw_deg, shot.pitch_deg, shot.hfov_deg, shot.vfov_deg, shot.roll_deg, 1024, 1024, 512, 256) is None
+        bundle.get(shot.yaw_deg, shot.pitch_deg, shot.hfov_deg, shot.vfov_deg, shot.roll_deg, 1024, 1024, 512, 256)
+    assert sum("no maps" in r.getMessage() for r in caplog.records) == 1
@@ -8,6 +8,9 @@ from comfyui_pano_suite.core.math import (
     round_to_multiple,
     finite_float,
     finite_int,
+    preview_render_size,
+    resize_erp,
+    resize_image,
     dir_to_lon_lat,
     yaw_pitch_to_dir,
 )
@@ -263,3 +266,35 @@ def test_calculate_dimensions_from_megapixels():
     w, h = calculate_dimensions_from_megapixels(100.0, 90, 90, max_side=4096)
     assert w == 4096
     assert h == 4096
+
+
+def test_preview_render_size():
+    assert preview_render_size(4096, 2048) == (1024, 512)
+    assert preview_render_size(100, 50) == (64, 32)
+    assert preview_render_size(40, 20) == (40, 20)
+
+
+def test_resize_image_modes():
+    img = np.arange(2 * 4 * 3, dtype=np.float32).reshape(2, 4, 3)
+    up = resize_image(img, 8, 4, nearest=True)
+    assert up.shape == (4, 8, 3)
+    assert np.array_equal(up[::2, ::2], img)
+    assert resize_image(img, 4, 2) is img
+    smooth = resize_image(np.ones((16, 16, 3), np.float32), 5, 3)
+    assert smooth.shape == (3, 5, 3)
+    assert np.allclose(smooth, 1.0)
+
+
+def test_resize_erp_wraps_across_seam():
+    img = np.zeros((4, 8, 3), np.float32)
+    img[:, -1] = 1.0
+    up = resize_erp(img, 16, 8)
+    assert up.shape == (8, 16, 3) and up.dtype == np.float32
+    # The first output column sits left of the first source center and blends
+    # with the last source column rather than clamping to the first.
+    assert np.allclose(up[:, 0], 0.25)
+    assert np.allclose(up[:, -1], 0.75)
+
+    down = resize_erp(np.ones((64, 128, 3), np.float32) * 0.5, 32, 16)
+    assert down.shape == (16, 32, 3) and np.allclose(down, 0.5)
+    assert resize_erp(img, 8, 4) is img
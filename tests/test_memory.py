@@ -0,0 +1,135 @@
+import base64
+import io
+import threading
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from comfyui_pano_suite.core import memory
+from comfyui_pano_suite.core import profiling
+from comfyui_pano_suite.core.cutout import cutout_from_erp
+from comfyui_pano_suite.core.stickers import compose_stickers_to_erp
+
+
+def _state():
+    rng = np.random.default_rng(0)
+    arr = (rng.random((16, 24, 4)) * 255).astype(np.uint8)
+    bio = io.BytesIO()
+    Image.fromarray(arr, "RGBA").save(bio, format="PNG")
+    url = "data:image/png;base64," + base64.b64encode(bio.getvalue()).decode("ascii")
+    stickers = [
+        {"id": f"s{i}", "asset_id": "a0", "yaw_deg": yaw, "pitch_deg": pitch, "hFOV_deg": 40.0, "vFOV_deg": 30.0, "rot_deg": 15.0, "z_index": i}
+        for i, (yaw, pitch) in enumerate([(170.0, 10.0), (-20.0, -30.0), (-20.0, -30.0)])
+    ]
+    return {"bg_color": "#102030", "assets": {"a0": {"type": "dataurl", "value": url}}, "stickers": stickers, "shots": []}
+
+
+def test_parse_bytes_units():
+    assert memory.parse_bytes("512M") == 512 << 20
+    assert memory.parse_bytes("1.5GiB") == int(1.5 * (1 << 30))
+    assert memory.parse_bytes("1000") == 1000
+    assert memory.parse_bytes("lots") is None
+    assert memory.parse_bytes("0") is None
+
+
+def test_memory_budget_from_env(monkeypatch):
+    monkeypatch.setenv(memory.MEMORY_BUDGET_ENV, "2G")
+    assert memory.memory_budget() == 2 << 30
+    monkeypatch.setenv(memory.MEMORY_BUDGET_ENV, "nonsense")
+    assert memory.memory_budget() == memory.DEFAULT_MEMORY_BUDGET
+
+
+def test_plans_shrink_bands_under_small_budget():
+    rows, est = memory.plan_cutout_band_rows(4096, 2048, 16384, 8192, 3, 90.0, 60.0)
+    assert rows == 2048 and est < memory.DEFAULT_MEMORY_BUDGET
+    rows, small = memory.plan_cutout_band_rows(4096, 2048, 16384, 8192, 3, 90.0, 60.0, budget=600 << 20)
+    assert rows < 2048 and small < est
+
+    assert memory.plan_compose_band_rows(1024, 512, None, (200, 300))[0] is None
+    band, _ = memory.plan_compose_band_rows(1024, 512, None, (200, 300), budget=10 << 20)
+    assert memory.MIN_BAND_ROWS <= band < 200
+
+
+def test_banded_compose_matches_unbanded(monkeypatch):
+    state = _state()
+    full = compose_stickers_to_erp(state, 256, 128)
+    monkeypatch.setenv(memory.MEMORY_BUDGET_ENV, "1M")
+    banded = compose_stickers_to_erp(state, 256, 128)
+    np.testing.assert_allclose(banded, full, atol=1e-6)
+
+
+def test_banded_cutout_matches_unbanded(monkeypatch):
+    erp = np.random.default_rng(1).random((128, 256, 3), dtype=np.float32)
+    full = cutout_from_erp(erp, 40.0, 10.0, 90.0, 60.0, 5.0, 96, 64)
+    monkeypatch.setenv(memory.MEMORY_BUDGET_ENV, "100K")
+    banded = cutout_from_erp(erp, 40.0, 10.0, 90.0, 60.0, 5.0, 96, 64)
+    # Banded cutouts use the exact per-band maps rather than the cached yaw-0 maps.
+    np.testing.assert_allclose(banded, full, atol=1e-3)
+
+
+def test_peak_memory_is_reported_when_profiling():
+    profiling.set_enabled(True)
+    profiling.reset()
+    try:
+        with profiling.collect() as records:
+            compose_stickers_to_erp(_state(), 128, 64)
+    finally:
+        profiling.set_enabled(False)
+    events = [r for r in records if r.get("event") == "stickers.memory"]
+    assert len(events) == 1
+    assert events[0]["peak_bytes"] >= 128 * 64 * 3 * 4
+    assert events[0]["band_rows"] is None
+    assert profiling.snapshot()["events"]["stickers.memory"]["count"] == 1
+    profiling.reset()
+
+
+def test_track_peak_leaves_foreign_tracing_alone():
+    profiling.set_enabled(True)
+    tracemalloc.start()
+    try:
+        with profiling.collect() as records:
+            with memory.track_peak("outer.memory"):
+                pass
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+        profiling.set_enabled(False)
+        profiling.reset()
+    assert records == [{"event": "outer.memory", "peak_bytes": None}]
+
+
+def test_track_peak_measures_one_thread_at_a_time():
+    profiling.set_enabled(True)
+    entered, release = threading.Event(), threading.Event()
+
+    def other():
+        with memory.track_peak("other.memory"):
+            entered.set()
+            release.wait(5)
+
+    t = threading.Thread(target=other)
+    t.start()
+    try:
+        entered.wait(5)
+        with profiling.collect() as records:
+            with memory.track_peak("busy.memory"):
+                pass
+    finally:
+        release.set()
+        t.join()
+        profiling.set_enabled(False)
+    assert records[0]["peak_bytes"] is None
+    assert profiling.snapshot()["events"]["other.memory"]["last"]["peak_bytes"] is not None
+    assert not tracemalloc.is_tracing()
+    profiling.reset()
+
+
+def test_cutout_estimate_counts_retained_map_caches():
+    src = (8192, 4096, 3, 90.0, 60.0)
+    plain = memory.estimate_cutout_bytes(2048, 1365, 1365, *src)
+    cached = memory.estimate_cutout_bytes(2048, 1365, 1365, *src, cache_bytes_per_pixel=112)
+    assert cached - plain == 2048 * 1365 * 112
+    # Banded cutouts do not fill the caches.
+    banded = memory.estimate_cutout_bytes(2048, 1365, 64, *src, cache_bytes_per_pixel=112)
+    assert banded == memory.estimate_cutout_bytes(2048, 1365, 64, *src)
@@ -0,0 +1,43 @@
+import dataclasses
+
+import numpy as np
+import pytest
+
+from comfyui_pano_suite.core.model import Shot, compile_state
+
+
+def test_compile_state_validates_once_and_sorts():
+    state = {
+        "bg_color": "#112233",
+        "assets": {"a": {"type": "dataurl", "value": ""}},
+        "stickers": [
+            {"id": "top", "asset_id": "a", "yaw_deg": "nan", "hFOV_deg": -5, "z_index": 2},
+            {"id": "low", "asset_id": "a", "yaw_deg": 40, "crop": {"x0": 0.8, "x1": 0.2, "y0": -1, "y1": 2}, "z_index": 1},
+            {"id": "no_asset", "asset_id": "missing"},
+            {"id": "empty_crop", "asset_id": "a", "crop": {"x0": 0.5, "x1": 0.5}},
+            "not a sticker",
+        ],
+        "shots": ["bad", {"yaw_deg": 10, "hFOV_deg": 500, "out_w": "640", "out_h": 480}],
+    }
+    compiled = compile_state(state)
+
+    assert [s.id for s in compiled.stickers] == ["low", "top"]
+    low, top = compiled.stickers
+    assert low.crop == (0.2, 0.0, 0.8, 1.0)
+    assert top.yaw_deg == 0.0 and top.hfov_deg == 0.1
+
+    assert len(compiled.shots) == 1
+    shot = compiled.shots[0]
+    assert shot.hfov_deg == 179.0 and (shot.out_w, shot.out_h) == (640, 480)
+    assert shot.output_size(1.0, 4096) == (640, 480)
+
+    assert compiled.sticker_array().shape == (2, 5)
+    assert np.allclose(compiled.shot_array()[0, :3], [10.0, 0.0, 179.0])
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        shot.yaw_deg = 1.0
+
+
+def test_default_shot_sizes_from_megapixels():
+    w, h = Shot().output_size(1.0, 4096)
+    assert w % 8 == 0 and h % 8 == 0
+    assert abs(w * h - 1_000_000) < 50_000
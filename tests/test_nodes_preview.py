@@ -103,8 +103,8 @@ class TestNodesPreview(unittest.TestCase):
         node = PanoramaCutoutNode()
         dummy_erp = MagicMock()
         # Setup detach logic for cutout logic in nodes.py which does:
-        # arr = erp_image.detach().cpu().numpy().astype(np.float32)
-        dummy_erp.detach.return_value.cpu.return_value.numpy.return_value.astype.return_value = MagicMock(ndim=4, shape=(1, 512, 1024, 3))
+        # arr = erp_image.detach().cpu().numpy()
+        dummy_erp.detach.return_value.cpu.return_value.numpy.return_value = MagicMock(ndim=4, shape=(1, 512, 1024, 3))
 
         with patch("comfyui_pano_suite.nodes.cutout_from_erp") as mock_cutout:
             # Return a valid numpy array mock so it doesn't fail
@@ -0,0 +1,84 @@
+import numpy as np
+import torch
+from PIL import Image
+
+from comfyui_pano_suite.core.preview import downscale_to_uint8, save_previews_async
+
+
+def test_preview_is_downscaled_and_deduplicated(tmp_path):
+    rng = np.random.default_rng(0)
+    images = torch.from_numpy(rng.random((2, 600, 1200, 3), dtype=np.float32))
+
+    entries, future = save_previews_async(images, tmp_path, max_side=512, lod_sides=())
+    future.result(timeout=30)
+    assert len(entries) == 2 and entries[0]["filename"] != entries[1]["filename"]
+    assert all(e["type"] == "temp" and e["filename"].endswith(".jpg") for e in entries)
+    with Image.open(tmp_path / entries[0]["filename"]) as img:
+        assert img.size == (512, 256)
+    mtime = (tmp_path / entries[0]["filename"]).stat().st_mtime_ns
+
+    # The same tensor again: the same names, nothing new on disk.
+    ready = []
+    again, future = save_previews_async(images, tmp_path, on_ready=ready.append, max_side=512, lod_sides=())
+    assert future.result(timeout=30) is entries and again is entries
+    assert ready == [entries]
+    assert (tmp_path / entries[0]["filename"]).stat().st_mtime_ns == mtime
+    files = len([p for p in tmp_path.iterdir() if not p.name.startswith(".")])
+    assert files == 2 + 2
+
+    # Equal pixels in a new tensor get new names but share the encoded files.
+    copy, future = save_previews_async(images.clone(), tmp_path, max_side=512, lod_sides=())
+    future.result(timeout=30)
+    assert copy[0]["filename"] != entries[0]["filename"]
+    assert (tmp_path / copy[0]["filename"]).read_bytes() == (tmp_path / entries[0]["filename"]).read_bytes()
+
+    # An in-place edit invalidates the reuse.
+    images.mul_(0.5)
+    edited, future = save_previews_async(images, tmp_path, max_side=512, lod_sides=())
+    future.result(timeout=30)
+    assert edited[0]["filename"] != entries[0]["filename"]
+
+
+def test_area_downscale_matches_between_tensor_and_array():
+    rng = np.random.default_rng(1)
+    arr = rng.random((64, 128, 4), dtype=np.float32)
+    a = downscale_to_uint8(torch.from_numpy(arr), max_side=32).astype(np.int16)
+    b = downscale_to_uint8(arr, max_side=32).astype(np.int16)
+    assert a.shape == b.shape == (16, 32, 3)
+    assert np.abs(a - b).max() <= 2
+    # Area filtering of a 4x4 block is its mean.
+    assert abs(int(a[0, 0, 0]) - round(float(arr[:4, :4, 0].mean()) * 255.0)) <= 1
+
+
+def test_async_previews_reserve_names_and_notify(tmp_path):
+    rng = np.random.default_rng(2)
+    images = torch.from_numpy(rng.random((1, 64, 128, 3), dtype=np.float32))
+    ready = []
+
+    entries, future = save_previews_async(images, tmp_path, on_ready=ready.append, max_side=64)
+    assert len(entries) == 1 and entries[0]["type"] == "temp"
+    assert future.result(timeout=30) == entries
+    assert ready == [entries]
+    reserved = tmp_path / entries[0]["filename"]
+    with Image.open(reserved) as img:
+        assert img.size == (64, 32)
+
+    # Same pixels in a new tensor: a new reserved name sharing the one encoded file.
+    again, future = save_previews_async(images.clone(), tmp_path, max_side=64)
+    future.result(timeout=30)
+    assert again[0]["filename"] != entries[0]["filename"]
+    assert (tmp_path / again[0]["filename"]).read_bytes() == reserved.read_bytes()
+    assert len([p for p in tmp_path.iterdir() if not p.name.startswith(".")]) == 3
+
+
+def test_async_previews_include_lower_levels(tmp_path):
+    rng = np.random.default_rng(3)
+    images = torch.from_numpy(rng.random((1, 256, 512, 3), dtype=np.float32))
+    entries, future = save_previews_async(images, tmp_path, max_side=256, lod_sides=(64, 128, 1024))
+    future.result(timeout=30)
+
+    lods = entries[0]["lods"]
+    assert [lod["max_side"] for lod in lods] == [64, 128]
+    for lod, size in zip(lods, [(64, 32), (128, 64)]):
+        with Image.open(tmp_path / lod["filename"]) as img:
+            assert img.size == size
@@ -0,0 +1,61 @@
+import json
+
+import numpy as np
+import pytest
+
+from comfyui_pano_suite.core import profiling
+from comfyui_pano_suite.core import state as state_mod
+from comfyui_pano_suite.core.cutout import cutout_from_erp
+from comfyui_pano_suite.core.stickers import compose_stickers_to_erp
+
+
+@pytest.fixture
+def profiling_on():
+    profiling.set_enabled(True)
+    profiling.reset()
+    yield
+    profiling.set_enabled(False)
+    profiling.reset()
+
+
+def test_spans_are_noops_when_disabled():
+    profiling.set_enabled(False)
+    with profiling.collect() as records:
+        with profiling.span("x"):
+            pass
+    assert records is None
+    assert "x" not in profiling.snapshot()["spans"]
+
+
+def test_collect_gathers_nested_spans(profiling_on):
+    with profiling.collect() as outer:
+        with profiling.span("a", n=1):
+            with profiling.collect() as inner:
+                with profiling.span("b"):
+                    pass
+    assert [r["span"] for r in inner] == ["b"]
+    assert [r["span"] for r in outer] == ["b", "a"]
+    assert outer[1]["n"] == 1 and outer[1]["ms"] >= 0.0
+    spans = profiling.snapshot()["spans"]
+    assert spans["a"]["count"] == 1 and spans["b"]["count"] == 1
+
+
+def test_render_paths_report_stages_and_cache_stats(profiling_on):
+    state_mod._parse_state_text.cache_clear()
+    text = json.dumps({"bg_color": "#102030", "stickers": [], "shots": []})
+    with profiling.collect() as records:
+        state_mod.merge_state(None, text)
+        state_mod.merge_state(None, text)
+        compose_stickers_to_erp(state_mod.merge_state(None, text), 64, 32)
+        cutout_from_erp(np.zeros((32, 64, 3), np.float32), 0.0, 0.0, 90.0, 60.0, 0.0, 32, 24)
+    names = {r["span"] for r in records if "span" in r}
+    assert {"state.merge", "state.parse", "stickers.compose", "stickers.finalize", "cutout", "math.sample"} <= names
+    memory = [r for r in records if r.get("event") == "cutout.memory"]
+    assert len(memory) == 1 and memory[0]["peak_bytes"] > 0 and memory[0]["estimate_bytes"] > 0
+
+    snap = profiling.snapshot()
+    parse = snap["caches"]["state.parse"]
+    assert (parse["misses"], parse["hits"]) == (1, 2)
+    assert parse["bytes_loaded"] == len(text)
+    assert snap["spans"]["state.merge"]["count"] == 3
+    assert "cutout.yaw0_maps" in snap["caches"]
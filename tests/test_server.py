@@ -0,0 +1,138 @@
+import asyncio
+import base64
+import io
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from comfyui_pano_suite import server as server_mod
+from comfyui_pano_suite.core import assets as assets_mod
+from comfyui_pano_suite.core import stickers as stickers_mod
+from comfyui_pano_suite.core import thumbs as thumbs_mod
+
+aiohttp = pytest.importorskip("aiohttp")
+web = pytest.importorskip("aiohttp.web")
+test_utils = pytest.importorskip("aiohttp.test_utils")
+
+
+class _DummyFolderPaths:
+    def __init__(self, root: Path):
+        self._root = root
+
+    def get_input_directory(self):
+        return str(self._root / "input")
+
+    def get_output_directory(self):
+        return str(self._root / "output")
+
+    def get_temp_directory(self):
+        return str(self._root / "temp")
+
+
+def _request(method, path, **kwargs):
+    async def run():
+        app = web.Application()
+        server_mod.add_routes(app.router)
+        async with test_utils.TestClient(test_utils.TestServer(app)) as client:
+            resp = await client.request(method, path, **kwargs)
+            return resp.status, resp.headers, await resp.read()
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def comfy_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(stickers_mod, "folder_paths", _DummyFolderPaths(tmp_path))
+    monkeypatch.setattr(thumbs_mod, "folder_paths", _DummyFolderPaths(tmp_path))
+    monkeypatch.setattr(assets_mod, "folder_paths", _DummyFolderPaths(tmp_path))
+    (tmp_path / "input").mkdir()
+    erp = np.zeros((64, 128, 3), dtype=np.uint8)
+    erp[..., 0] = np.linspace(0, 255, 128, dtype=np.uint8)[None, :]
+    Image.fromarray(erp).save(tmp_path / "input" / "pano.png")
+    return tmp_path
+
+
+def test_cutout_route_renders_requested_size(comfy_dirs):
+    status, headers, data = _request("POST", "/pano_suite/cutout", json={
+        "image": {"filename": "pano.png", "subfolder": "", "type": "input"},
+        "shot": {"yaw_deg": 0, "pitch_deg": 0, "hFOV_deg": 90, "vFOV_deg": 60},
+        "long_side": 256,
+        "format": "webp",
+    })
+    assert status == 200
+    assert headers["Content-Type"] == "image/webp"
+    with Image.open(io.BytesIO(data)) as img:
+        assert max(img.size) == 256
+        assert img.size[0] > img.size[1]
+
+
+def test_cutout_route_reuses_decoded_source(comfy_dirs):
+    server_mod._load_erp_cached.cache_clear()
+    body = {"image": {"filename": "pano.png", "type": "input"}, "shot": {"yaw_deg": 30}, "long_side": 64}
+    assert _request("POST", "/pano_suite/cutout", json=body)[0] == 200
+    assert _request("POST", "/pano_suite/cutout", json={**body, "shot": {"yaw_deg": 60}})[0] == 200
+    info = server_mod._load_erp_cached.cache_info()
+    assert info.misses == 1 and info.hits == 1
+
+
+def test_cutout_route_rejects_bad_requests(comfy_dirs):
+    missing = {"image": {"filename": "nope.png", "type": "input"}, "shot": {}}
+    assert _request("POST", "/pano_suite/cutout", json=missing)[0] == 404
+    escape = {"image": {"filename": "../../etc/passwd", "type": "input"}, "shot": {}}
+    assert _request("POST", "/pano_suite/cutout", json=escape)[0] == 404
+    bad_fmt = {"image": {"filename": "pano.png"}, "shot": {}, "format": "bmp"}
+    assert _request("POST", "/pano_suite/cutout", json=bad_fmt)[0] == 400
+    assert _request("POST", "/pano_suite/cutout", data=b"[1]")[0] == 400
+
+
+def test_thumb_route_serves_cached_webp(comfy_dirs):
+    url = "/pano_suite/thumb?filename=pano.png&type=input&size=32"
+    status, headers, data = _request("GET", url)
+    assert status == 200
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.size == (32, 16)
+    assert len(list((comfy_dirs / "temp" / thumbs_mod.THUMB_SUBFOLDER).glob("*.webp"))) == 1
+
+    status, _, _ = _request("GET", url, headers={"If-None-Match": headers["ETag"]})
+    assert status == 304
+    assert _request("GET", "/pano_suite/thumb?filename=../x.png&type=input")[0] == 404
+
+
+def test_upload_route_returns_existing_file_for_same_bytes(comfy_dirs):
+    def form(name):
+        data = aiohttp.FormData()
+        data.add_field("image", (comfy_dirs / "input" / "pano.png").read_bytes(), filename=name, content_type="image/png")
+        return data
+
+    assets_mod.input_hash_index(comfy_dirs / "input").refresh()
+    status, _, body = _request("POST", "/pano_suite/upload", data=form("copy.png"))
+    assert status == 200
+    asset = json.loads(body)
+    assert (asset["filename"], asset["subfolder"], asset["deduplicated"]) == ("pano.png", "", True)
+    assert not (comfy_dirs / "input" / assets_mod.UPLOAD_SUBFOLDER).exists()
+    assert _request("POST", "/pano_suite/upload", data=b"x")[0] == 400
+
+
+def test_profile_route_reports_cache_stats():
+    status, _, body = _request("GET", "/pano_suite/profile")
+    assert status == 200
+    data = json.loads(body)
+    assert set(data) == {"enabled", "spans", "caches", "events"}
+    assert {"state.parse", "server.erp_sources"} <= set(data["caches"])
+
+
+def test_externalize_route_returns_hash_refs(comfy_dirs):
+    buf = io.BytesIO()
+    Image.new("RGBA", (2, 2), (1, 2, 3, 255)).save(buf, format="PNG")
+    du = "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+    text = json.dumps({"assets": {"a": {"type": "dataurl", "value": du}}})
+    status, _, body = _request("POST", "/pano_suite/assets/externalize", json={"state_json": text})
+    assert status == 200
+    ref = json.loads(json.loads(body)["state_json"])["assets"]["a"]
+    assert ref["type"] == "hash"
+    assert (comfy_dirs / "input" / assets_mod.ASSET_SUBFOLDER / f"{ref['hash']}.png").is_file()
+    plain = json.dumps({"assets": {}})
+    assert json.loads(_request("POST", "/pano_suite/assets/externalize", json={"state_json": plain})[2])["state_json"] == plain
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from comfyui_pano_suite.core.cutout import cutout_from_erp, cutout_uv_maps, map_footprint
+from comfyui_pano_suite.core.math import sample_erp_bilinear
+from comfyui_pano_suite.core.source import ErpSource, open_erp_source
+
+
+def test_read_wraps_columns_and_normalizes_integers():
+    arr = np.arange(4 * 6 * 3, dtype=np.uint8).reshape(4, 6, 3)
+    src = ErpSource(arr)
+    assert src.shape == (4, 6, 3)
+
+    block = src.read(1, 3, 4, 8)
+    assert block.dtype == np.float32
+    assert block.shape == (2, 4, 3)
+    expected = np.concatenate([arr[1:3, 4:6], arr[1:3, 0:2]], axis=1) / 255.0
+    assert np.allclose(block, expected)
+
+
+def test_footprint_wraps_across_seam():
+    u = np.array([[1020.0, 1023.5, 0.2, 3.9]], dtype=np.float32)
+    v = np.array([[10.2, 11.0, 12.7, 10.0]], dtype=np.float32)
+    row0, row1, col0, col1 = map_footprint(u, v, 1024, 512)
+    assert (row0, row1) == (10, 14)
+    assert col0 == 1020
+    assert col1 == 1024 + 5
+
+
+def test_footprint_covers_narrow_shot_only():
+    u, v = cutout_uv_maps(45.0, 10.0, 40.0, 30.0, 0.0, 64, 48, 2048, 1024)
+    row0, row1, col0, col1 = map_footprint(u, v, 2048, 1024)
+    assert (row1 - row0) < 1024 // 4
+    assert (col1 - col0) < 2048 // 6
+
+
+@pytest.mark.parametrize("shot", [(179.0, 5.0, 60.0, 40.0, 0.0), (-30.0, 85.0, 90.0, 70.0, 10.0)])
+def test_cutout_from_source_matches_in_memory(shot, tmp_path):
+    rng = np.random.default_rng(2)
+    erp = rng.random((128, 256, 3)).astype(np.float32)
+    path = tmp_path / "erp.npy"
+    np.save(path, erp)
+
+    src = open_erp_source(path)
+    expected = cutout_from_erp(erp, *shot, 64, 48)
+    assert np.allclose(cutout_from_erp(src, *shot, 64, 48), expected, atol=1e-5)
+    assert np.allclose(cutout_from_erp(src, *shot, 64, 48, band_pixels=64 * 7), expected, atol=1e-4)
+
+
+def test_unpadded_crop_sampling_matches_wrapped_sampling():
+    rng = np.random.default_rng(2)
+    erp = rng.random((32, 64, 3)).astype(np.float32)
+    u = rng.uniform(10.0, 20.0, size=(8, 8)).astype(np.float32)
+    v = rng.uniform(4.0, 12.0, size=(8, 8)).astype(np.float32)
+
+    full = sample_erp_bilinear(erp, u, v)
+    crop = sample_erp_bilinear(erp[4:14, 10:22], u - 10.0, v - 4.0, wrap=False)
+    assert np.allclose(crop, full, atol=1e-5)
+
+
+def test_cutout_accepts_integer_erp_without_full_conversion():
+    rng = np.random.default_rng(3)
+    erp = rng.integers(0, 256, size=(128, 256, 3), dtype=np.uint8)
+    shot = (20.0, 5.0, 60.0, 45.0, 0.0, 64, 48)
+    out = cutout_from_erp(erp, *shot)
+    ref = cutout_from_erp(erp.astype(np.float32) / 255.0, *shot)
+    assert out.dtype == np.float32
+    assert np.allclose(out, ref, atol=1e-5)
+
+
+def test_raw_source_requires_layout(tmp_path):
+    path = tmp_path / "erp.raw"
+    np.zeros((8, 16, 3), dtype=np.uint16).tofile(path)
+    with pytest.raises(ValueError):
+        open_erp_source(path)
+    src = open_erp_source(path, shape=(8, 16, 3), dtype="uint16")
+    assert src.read(0, 8).shape == (8, 16, 3)
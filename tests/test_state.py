@@ -1,4 +1,9 @@
-from comfyui_pano_suite.core.state import DEFAULT_STATE, merge_state
+import json
+
+import pytest
+
+from comfyui_pano_suite.core import state as state_mod
+from comfyui_pano_suite.core.state import DEFAULT_STATE, MissingState, StateConflict, StateStore, apply_state_patch, merge_state, state_fingerprint
 
 
 def test_merge_state_handles_none_inputs():
@@ -45,3 +50,90 @@ def test_merge_state_fills_missing_active_keys():
 
     assert state["active"]["selected_sticker_id"] == "st_1"
     assert state["active"]["selected_shot_id"] is None
+
+
+def test_state_fingerprint_ignores_key_order_and_selection():
+    a = merge_state(None, '{"stickers": [{"id": "s1", "yaw_deg": 10}], "active": {"selected_sticker_id": "s1"}}')
+    b = merge_state(None, '{"active": {"selected_sticker_id": null}, "stickers": [{"yaw_deg": 10, "id": "s1"}]}')
+    c = merge_state(None, '{"stickers": [{"id": "s1", "yaw_deg": 11}]}')
+    assert state_fingerprint(a) == state_fingerprint(b)
+    assert state_fingerprint(a) != state_fingerprint(c)
+    assert state_fingerprint(a, [("x", 1)]) != state_fingerprint(a, [("x", 2)])
+
+
+def test_merge_state_reuses_parse_but_returns_fresh_top_level():
+    text = '{"stickers": [{"id": "s1"}], "active": {"selected_sticker_id": "s1"}}'
+    a = merge_state(None, text)
+    a["bg_color"] = "#123456"
+    a["active"]["selected_sticker_id"] = None
+    b = merge_state(None, text)
+
+    assert b["stickers"] is a["stickers"]
+    assert b["bg_color"] == "#00ff00"
+    assert b["active"]["selected_sticker_id"] == "s1"
+    assert DEFAULT_STATE["stickers"] == [] and DEFAULT_STATE["active"]["selected_sticker_id"] is None
+
+
+def test_merge_state_accepts_non_strict_json():
+    state = merge_state(None, '{"shots": [{"yaw_deg": NaN}]}')
+    assert len(state["shots"]) == 1
+
+
+def test_apply_state_patch_is_copy_on_write():
+    base = merge_state(None, '{"stickers": [{"id": "s1", "yaw_deg": 0}, {"id": "s2", "yaw_deg": 5}], "assets": {"a": {"type": "path"}}}')
+    out = apply_state_patch(base, [
+        {"op": "update", "collection": "stickers", "id": "s1", "value": {"yaw_deg": 30, "id": "hijack"}},
+        {"op": "add", "collection": "stickers", "value": {"id": "s3", "yaw_deg": 9}},
+        {"op": "remove", "collection": "stickers", "id": "s2"},
+        {"op": "put_asset", "id": "b", "value": {"type": "path"}},
+        {"op": "set", "key": "bg_color", "value": "#000000"},
+    ])
+    assert [(s["id"], s["yaw_deg"]) for s in out["stickers"]] == [("s1", 30), ("s3", 9)]
+    assert set(out["assets"]) == {"a", "b"} and out["bg_color"] == "#000000"
+    assert [s["yaw_deg"] for s in base["stickers"]] == [0, 5] and set(base["assets"]) == {"a"}
+
+    with pytest.raises(ValueError):
+        apply_state_patch(base, [{"op": "update", "collection": "stickers", "id": "nope", "value": {}}])
+    with pytest.raises(ValueError):
+        apply_state_patch(base, [{"op": "set", "key": "version", "value": 2}])
+
+
+def test_state_store_versions_and_refs():
+    store = StateStore(keep_versions=2)
+    v1 = store.put("node7", {"stickers": [{"id": "s1", "yaw_deg": 0}]})
+    v2 = store.patch("node7", v1, [{"op": "update", "collection": "stickers", "id": "s1", "value": {"yaw_deg": 45}}])
+    assert (v1, v2) == (1, 2)
+    with pytest.raises(StateConflict) as exc:
+        store.patch("node7", v1, [])
+    assert exc.value.version == 2
+
+    assert store.resolve({"state_ref": "node7", "version": 1})["stickers"][0]["yaw_deg"] == 0
+    assert store.resolve({"state_ref": "node7"})["stickers"][0]["yaw_deg"] == 45
+    store.patch("node7", 2, [])
+    with pytest.raises(ValueError):
+        store.resolve({"state_ref": "node7", "version": 1})
+
+
+def test_merge_state_resolves_state_refs(monkeypatch):
+    store = StateStore()
+    monkeypatch.setattr(state_mod, "STATE_STORE", store)
+    version = store.put("n1", {"shots": [{"id": "sh", "yaw_deg": 12}]})
+    state = merge_state(None, json.dumps({"state_ref": "n1", "version": version}))
+    assert state["shots"][0]["yaw_deg"] == 12
+    with pytest.raises(ValueError):
+        merge_state(None, json.dumps({"state_ref": "missing"}))
+
+
+def test_state_refs_fall_back_to_embedded_state_after_restart(monkeypatch):
+    # A fresh store stands in for a restarted server.
+    store = StateStore()
+    monkeypatch.setattr(state_mod, "STATE_STORE", store)
+    saved = {"state_ref": "n1", "version": 3, "state": {"shots": [{"id": "sh", "yaw_deg": 7}]}}
+    assert merge_state(None, json.dumps(saved))["shots"][0]["yaw_deg"] == 7
+    # The embedded document is stored again, so patches can continue from it.
+    assert store.get("n1")[0] == 3
+    assert store.patch("n1", 3, []) == 4
+
+    with pytest.raises(MissingState, match="restarts") as exc:
+        merge_state(None, json.dumps({"state_ref": "n2", "version": 5}))
+    assert (exc.value.key, exc.value.version) == ("n2", 5)
@@ -1,5 +1,6 @@
 import base64
 import io
+import os
 from pathlib import Path
 
 from PIL import Image
@@ -121,3 +122,26 @@ def test_invalid_inputs_return_none(monkeypatch, tmp_path):
     ]
     for asset in cases:
         assert stickers_mod._load_asset_rgba(asset, base_dir=tmp_path) is None
+
+
+def test_referenced_asset_stamps_track_file_changes(tmp_path):
+    _write_png(tmp_path / "sticker.png")
+    state = {
+        "assets": {
+            "a1": {"type": "path", "value": "sticker.png"},
+            "a2": {"type": "path", "value": "missing.png"},
+            "unused": {"type": "path", "value": "sticker.png"},
+        },
+        "stickers": [{"asset_id": "a1"}, {"asset_id": "a2"}],
+    }
+    stamps = stickers_mod.referenced_asset_stamps(state, base_dir=tmp_path)
+    assert [s[0] for s in stamps] == ["a1", "a2"]
+    assert stamps[0][1] == str((tmp_path / "sticker.png").resolve())
+    assert stamps[1] == ("a2", None, -1, -1)
+
+    os.utime(tmp_path / "sticker.png", ns=(1, 1))
+    changed = stickers_mod.referenced_asset_stamps(state, base_dir=tmp_path)
+    assert changed[0] != stamps[0] and changed[1] == stamps[1]
+
+    _write_png(tmp_path / "missing.png")
+    assert stickers_mod.referenced_asset_stamps(state, base_dir=tmp_path)[1][1] is not None
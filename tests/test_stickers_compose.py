@@ -0,0 +1,166 @@
+import base64
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from comfyui_pano_suite.core import stickers as stickers_mod
+from comfyui_pano_suite.core.stickers import compose_stickers_to_erp
+
+
+def _dataurl(seed=0, w=24, h=16):
+    rng = np.random.default_rng(seed)
+    arr = (rng.random((h, w, 4)) * 255).astype(np.uint8)
+    arr[..., 3] = 255
+    bio = io.BytesIO()
+    Image.fromarray(arr, "RGBA").save(bio, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(bio.getvalue()).decode("ascii")
+
+
+def _sticker(sid, yaw, pitch=0.0, z=0, **extra):
+    st = {
+        "id": sid,
+        "asset_id": "a0",
+        "yaw_deg": yaw,
+        "pitch_deg": pitch,
+        "hFOV_deg": 20.0,
+        "vFOV_deg": 15.0,
+        "rot_deg": 10.0,
+        "z_index": z,
+    }
+    st.update(extra)
+    return st
+
+
+def _state(stickers):
+    return {"bg_color": "#000000", "assets": {"a0": {"type": "dataurl", "value": _dataurl()}}, "stickers": stickers}
+
+
+def test_sticker_ring_shares_warped_patches(monkeypatch):
+    calls = []
+    real_warp = stickers_mod._warp_sticker_patch
+
+    def counting_warp(*args, **kwargs):
+        calls.append(1)
+        return real_warp(*args, **kwargs)
+
+    monkeypatch.setattr(stickers_mod, "_warp_sticker_patch", counting_warp)
+    ring = [_sticker(f"s{i}", -180.0 + 30.0 * i, z=i) for i in range(12)]
+    out = compose_stickers_to_erp(_state(ring), 512, 256)
+
+    # 30 degrees is 42.67 columns at 512 px, so only three sub-pixel phases occur.
+    assert len(calls) == 3
+    assert out.shape == (256, 512, 3)
+
+    monkeypatch.setattr(stickers_mod, "_warp_sticker_patch", real_warp)
+    sequential = None
+    for st in ring:
+        sequential = compose_stickers_to_erp(_state([st]), 512, 256, bg_erp=sequential)
+    assert np.allclose(out, sequential, atol=1e-6)
+
+
+def test_seam_and_pole_stickers_render():
+    state = _state([
+        _sticker("seam", 179.0, pitch=5.0),
+        _sticker("pole", 30.0, pitch=88.5, z=1),
+    ])
+    out = compose_stickers_to_erp(state, 512, 256)
+    # The seam sticker covers both the first and the last columns.
+    assert float(out[120:136, :4].max()) > 0.0
+    assert float(out[120:136, -4:].max()) > 0.0
+    # The pole sticker covers the top rows.
+    assert float(out[:4].max()) > 0.0
+
+
+def test_preview_quality_renders_small_and_upscales(monkeypatch):
+    warped = []
+    real = stickers_mod._warp_sticker_patch
+    monkeypatch.setattr(stickers_mod, "_warp_sticker_patch", lambda *a, **k: warped.append(a[-1].shape) or real(*a, **k))
+    state = _state([_sticker("a", 0.0), _sticker("b", 90.0, pitch=20.0)])
+    export = compose_stickers_to_erp(state, 1024, 512)
+    warped.clear()
+    preview = compose_stickers_to_erp(state, 1024, 512, quality="preview")
+
+    assert preview.shape == export.shape and preview.dtype == np.float32
+    # Lat rows of the warped patches come from the 256x128 internal render.
+    assert all(n <= 128 for (n,) in warped)
+    covered = (export.max(axis=-1) > 0) != (preview.max(axis=-1) > 0)
+    assert covered.mean() < 0.01
+
+
+def test_workspace_sampler_matches_reference():
+    rng = np.random.default_rng(3)
+    img = rng.random((9, 13, 4), dtype=np.float32)
+    x = rng.uniform(-1.0, 14.0, (5, 7)).astype(np.float32)
+    y = rng.uniform(-1.0, 10.0, (5, 7)).astype(np.float32)
+
+    xc, yc = np.clip(x, 0, 12), np.clip(y, 0, 8)
+    x0, y0 = np.floor(xc).astype(int), np.floor(yc).astype(int)
+    x1, y1 = np.minimum(x0 + 1, 12), np.minimum(y0 + 1, 8)
+    fx, fy = (xc - x0)[..., None], (yc - y0)[..., None]
+    top = img[y0, x0] * (1 - fx) + img[y0, x1] * fx
+    bottom = img[y1, x0] * (1 - fx) + img[y1, x1] * fx
+    expected = top * (1 - fy) + bottom * fy
+
+    ws = stickers_mod._Workspace()
+    out = stickers_mod._sample_rgba_bilinear(img, x.copy(), y.copy(), ws)
+    assert np.allclose(out, expected, atol=1e-5)
+    # Without a workspace the inputs are left alone.
+    before = x.copy()
+    assert np.allclose(stickers_mod._sample_rgba_bilinear(img, x, y), expected, atol=1e-5)
+    assert np.array_equal(x, before)
+
+
+def test_compose_does_not_modify_background():
+    bg = np.full((128, 256, 3), 0.25, dtype=np.float32)
+    out = compose_stickers_to_erp(_state([_sticker("a", 0.0), _sticker("b", 0.0, z=1)]), 256, 128, bg_erp=bg)
+    assert np.all(bg == 0.25)
+    assert out.dtype == np.float32 and not np.shares_memory(out, bg)
+    assert out.min() >= 0.0 and out.max() <= 1.0
+
+
+def test_narrow_precisions_match_float32():
+    state = _state([_sticker("a", 0.0), _sticker("b", 20.0, pitch=10.0, z=1)])
+    bg = np.random.default_rng(4).random((128, 256, 3), dtype=np.float32)
+    ref = compose_stickers_to_erp(state, 256, 128, bg_erp=bg)
+    half = compose_stickers_to_erp(state, 256, 128, bg_erp=bg, precision="float16")
+    u8 = compose_stickers_to_erp(state, 256, 128, bg_erp=bg, precision="uint8")
+
+    assert half.dtype == np.float16 and u8.dtype == np.uint8
+    assert np.abs(half.astype(np.float32) - ref).max() <= 1e-3
+    # The two stickers overlap, so uint8 storage may round twice in places.
+    assert np.abs(u8.astype(np.float32) / 255.0 - ref).max() <= 1.0 / 255.0
+
+
+def test_unknown_precision_is_rejected():
+    with pytest.raises(ValueError):
+        compose_stickers_to_erp(_state([]), 64, 32, precision="int8")
+
+
+class _Owner:
+    _version = 0
+
+
+def test_resized_background_is_cached_per_owner(monkeypatch):
+    calls = []
+    real = stickers_mod.resize_erp
+    monkeypatch.setattr(stickers_mod, "resize_erp", lambda *a: calls.append(a[1:]) or real(*a))
+    stickers_mod._bg_cache.clear()
+    bg = np.random.default_rng(5).random((64, 128, 3), dtype=np.float32)
+    owner = _Owner()
+    state = _state([_sticker("a", 0.0)])
+
+    first = compose_stickers_to_erp(state, 256, 128, bg_erp=bg, bg_owner=owner)
+    again = compose_stickers_to_erp(state, 256, 128, bg_erp=bg, bg_owner=owner)
+    assert calls == [(256, 128)] and np.array_equal(first, again)
+
+    compose_stickers_to_erp(state, 256, 128, bg_erp=bg, quality="preview", bg_owner=owner)
+    owner._version += 1
+    compose_stickers_to_erp(state, 256, 128, bg_erp=bg, bg_owner=owner)
+    compose_stickers_to_erp(state, 256, 128, bg_erp=bg)
+    assert len(calls) == 4
+
+    del owner
+    assert not stickers_mod._bg_cache
+
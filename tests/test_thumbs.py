@@ -0,0 +1,49 @@
+import os
+
+from PIL import Image
+
+from comfyui_pano_suite.core import thumbs as thumbs_mod
+
+
+def _write(path, size=(300, 200), mode="RGBA"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new(mode, size, color=(10, 200, 30, 128) if mode == "RGBA" else (10, 200, 30)).save(path)
+    return path
+
+
+def test_thumbnail_fits_size_and_keeps_alpha(tmp_path):
+    src = _write(tmp_path / "in" / "a.png")
+    path, _ = thumbs_mod.get_thumbnail(src, 64, cache_dir=tmp_path / "cache")
+    with Image.open(path) as img:
+        assert img.format == "WEBP"
+        assert img.size == (64, 43)
+        assert img.mode == "RGBA"
+
+
+def test_thumbnail_is_cached_and_keyed_on_source(tmp_path):
+    src = _write(tmp_path / "in" / "a.png")
+    cache = tmp_path / "cache"
+    p1, k1 = thumbs_mod.get_thumbnail(src, 64, cache_dir=cache)
+    os.utime(p1, ns=(1, 1))
+    p2, k2 = thumbs_mod.get_thumbnail(src, 64, cache_dir=cache)
+    assert (p1, k1) == (p2, k2)
+    assert p2.stat().st_mtime_ns > 1
+
+    assert thumbs_mod.get_thumbnail(src, 32, cache_dir=cache)[1] != k1
+    _write(src, size=(100, 100))
+    os.utime(src, ns=(10**18, 10**18))
+    assert thumbs_mod.get_thumbnail(src, 64, cache_dir=cache)[1] != k1
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    cache = tmp_path / "cache"
+    paths = []
+    for i in range(3):
+        src = _write(tmp_path / "in" / f"{i}.jpg", mode="RGB")
+        p, _ = thumbs_mod.get_thumbnail(src, 64, cache_dir=cache)
+        os.utime(p, ns=(i + 1, i + 1))
+        paths.append(p)
+    os.utime(paths[0], ns=(10, 10))
+    keep = paths[0].stat().st_size + paths[2].stat().st_size
+    assert thumbs_mod.evict_thumbnails(cache, max_bytes=keep) == 1
+    assert [p.exists() for p in paths] == [True, False, True]
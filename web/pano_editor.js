@@ -9,6 +9,7 @@ import { isPanoramaPreviewNodeName } from "./pano_preview_identity.js";
 import { drawCutoutProjectionPreview, getCutoutShotParams } from "./pano_cutout_projection.js";
 import { createPanoInteractionController } from "./pano_interaction_controller.js";
 import { clamp, wrapYaw, shortestYawDelta } from "./pano_math.js";
+import { commitStateText, externalizeStateText, resolveStateText, stateSession } from "./pano_state_sync.js";
 
 const STATE_WIDGET = "state_json";
 const ENABLE_STICKERS_NODE_PREVIEW = false;
@@ -525,7 +526,7 @@ function drawStickerPreviewPano(ctx, node, rect, viewBasis, tanHalfY, state, ite
 
 function drawPanoramaNodePreview(node, ctx) {
   const stateWidget = getWidget(node, STATE_WIDGET);
-  const raw = String(stateWidget?.value || "");
+  const raw = resolveStateText(node, String(stateWidget?.value || ""));
   const bg = String(getWidget(node, "bg_color")?.value || "#00ff00");
   const state = parseState(raw, 2048, bg);
 
@@ -847,6 +848,23 @@ function comfyImageEntryToUrl(entry) {
   return typeof api?.apiURL === "function" ? api.apiURL(q) : q;
 }
 
+// Sticker assets are drawn from resized server-side thumbnails (cached on disk)
+// instead of the full-resolution file.
+const STICKER_THUMB_SIZE = 1024;
+
+function comfyImageEntryToThumbUrl(entry, size = STICKER_THUMB_SIZE) {
+  if (!entry || typeof entry !== "object") return "";
+  const filename = String(entry.filename || "");
+  if (!filename) return "";
+  const params = new URLSearchParams();
+  params.set("filename", filename);
+  params.set("type", String(entry.type || "input"));
+  if (entry.subfolder) params.set("subfolder", String(entry.subfolder));
+  params.set("size", String(size));
+  const q = `/pano_suite/thumb?${params.toString()}`;
+  return typeof api?.apiURL === "function" ? api.apiURL(q) : q;
+}
+
 function isDirectImageUrl(src) {
   const s = String(src || "").trim();
   if (!s) return false;
@@ -902,12 +920,22 @@ function stickerAssetToPreviewSrc(asset) {
   if (type === "comfy_image") {
     const filename = String(asset.filename || "").trim();
     if (!filename) return "";
-    return comfyImageEntryToUrl({
+    return comfyImageEntryToThumbUrl({
       filename,
       subfolder: String(asset.subfolder || ""),
       type: String(asset.storage || "input"),
     });
   }
+  if (type === "hash") {
+    // Content-addressed store: <input>/pano_assets/<sha256>.<ext>
+    const hash = String(asset.hash || "").trim().toLowerCase();
+    if (!/^[0-9a-f]{64}$/.test(hash)) return "";
+    return comfyImageEntryToThumbUrl({
+      filename: `${hash}.${String(asset.ext || "png")}`,
+      subfolder: "pano_assets",
+      type: "input",
+    });
+  }
   return "";
 }
 
@@ -1142,7 +1170,7 @@ function showEditor(node, type, options = {}) {
   const stateWidget = getWidget(node, STATE_WIDGET);
 
   const state = parseState(
-    String(stateWidget?.value || ""),
+    resolveStateText(node, String(stateWidget?.value || "")),
     parseOutputPresetValue(presetWidget?.value, 2048),
     String(bgWidget?.value || "#00ff00"),
   );
@@ -1458,6 +1486,26 @@ function showEditor(node, type, options = {}) {
     body.append("image", file);
     body.append("type", "input");
     body.append("subfolder", "panorama_stickers");
+    // The package's upload route hashes the bytes and returns the existing
+    // input file on a match; plain /upload/image is the fallback.
+    try {
+      const dedupResp = await api.fetchApi("/pano_suite/upload", { method: "POST", body });
+      if (dedupResp?.status === 200) {
+        const data = await dedupResp.json();
+        const filename = String(data?.filename || "").trim();
+        if (filename) {
+          return {
+            type: "comfy_image",
+            filename,
+            subfolder: String(data?.subfolder || ""),
+            storage: String(data?.storage || "input"),
+            name: String(file?.name || fallbackName),
+          };
+        }
+      }
+    } catch (err) {
+      console.warn("[PanoramaSuite] dedup upload failed, falling back to /upload/image", err);
+    }
     const resp = await api.fetchApi("/upload/image", { method: "POST", body });
     if (!resp || resp.status !== 200) {
       throw new Error(`upload failed (${resp?.status || "no-response"})`);
@@ -2997,7 +3045,21 @@ function showEditor(node, type, options = {}) {
     });
     if (!entries.length) return;
     let changed = false;
+    // One request swaps every embedded image for a hash ref; per-file
+    // uploads remain the fallback when the route is unavailable.
+    const swapped = await externalizeStateText(JSON.stringify({ assets: Object.fromEntries(entries) }));
+    let refs = {};
+    try {
+      refs = swapped ? (JSON.parse(swapped)?.assets || {}) : {};
+    } catch {
+      refs = {};
+    }
     for (const [assetId, asset] of entries) {
+      if (String(refs[assetId]?.type || "") === "hash") {
+        state.assets[assetId] = refs[assetId];
+        changed = true;
+        continue;
+      }
       try {
         const dataUrl = String(asset?.value || "");
         if (!dataUrl) continue;
@@ -3278,10 +3340,7 @@ function showEditor(node, type, options = {}) {
   function commitState() {
     if (readOnly) return;
     const text = JSON.stringify(state);
-    if (stateWidget) {
-      stateWidget.value = text;
-      stateWidget.callback?.(text);
-    }
+    if (stateWidget) commitStateText(node, stateWidget, text);
   }
   function persistUiSettings() {
     state.ui_settings = saveSharedUiSettings(state.ui_settings);
@@ -4103,6 +4162,7 @@ function installEditorButton(nodeType, nodeData, matchType, buttonText) {
     hideWidget(node, STATE_WIDGET);
 
     const sw = getWidget(node, STATE_WIDGET);
+    stateSession(node, sw);
     if (sw && !sw.__panoPreviewPatchedCb) {
       sw.__panoPreviewPatchedCb = true;
       const prevCb = sw.callback;
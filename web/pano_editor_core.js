@@ -1231,6 +1231,23 @@ function comfyImageEntryToUrl(entry) {
   return typeof api?.apiURL === "function" ? api.apiURL(q) : q;
 }
 
+// Sticker assets are drawn from resized server-side thumbnails (cached on disk)
+// instead of the full-resolution file.
+const STICKER_THUMB_SIZE = 1024;
+
+function comfyImageEntryToThumbUrl(entry, size = STICKER_THUMB_SIZE) {
+  if (!entry || typeof entry !== "object") return "";
+  const filename = String(entry.filename || "");
+  if (!filename) return "";
+  const params = new URLSearchParams();
+  params.set("filename", filename);
+  params.set("type", String(entry.type || "input"));
+  if (entry.subfolder) params.set("subfolder", String(entry.subfolder));
+  params.set("size", String(size));
+  const q = `/pano_suite/thumb?${params.toString()}`;
+  return typeof api?.apiURL === "function" ? api.apiURL(q) : q;
+}
+
 function isDirectImageUrl(src) {
   const s = String(src || "").trim();
   if (!s) return false;
@@ -1289,12 +1306,22 @@ function stickerAssetToPreviewSrc(asset) {
   if (type === "comfy_image") {
     const filename = String(asset.filename || "").trim();
     if (!filename) return "";
-    return comfyImageEntryToUrl({
+    return comfyImageEntryToThumbUrl({
       filename,
       subfolder: String(asset.subfolder || ""),
       type: String(asset.storage || "input"),
     });
   }
+  if (type === "hash") {
+    // Content-addressed store: <input>/pano_assets/<sha256>.<ext>
+    const hash = String(asset.hash || "").trim().toLowerCase();
+    if (!/^[0-9a-f]{64}$/.test(hash)) return "";
+    return comfyImageEntryToThumbUrl({
+      filename: `${hash}.${String(asset.ext || "png")}`,
+      subfolder: "pano_assets",
+      type: "input",
+    });
+  }
   return "";
 }
 
@@ -1901,6 +1928,26 @@ function createNodeBackedEditor(node, type, options = {}) {
     body.append("image", file);
     body.append("type", "input");
     body.append("subfolder", "panorama_stickers");
+    // The package's upload route hashes the bytes and returns the existing
+    // input file on a match; plain /upload/image is the fallback.
+    try {
+      const dedupResp = await api.fetchApi("/pano_suite/upload", { method: "POST", body });
+      if (dedupResp?.status === 200) {
+        const data = await dedupResp.json();
+        const filename = String(data?.filename || "").trim();
+        if (filename) {
+          return {
+            type: "comfy_image",
+            filename,
+            subfolder: String(data?.subfolder || ""),
+            storage: String(data?.storage || "input"),
+            name: String(file?.name || fallbackName),
+          };
+        }
+      }
+    } catch (err) {
+      console.warn("[PanoramaSuite] dedup upload failed, falling back to /upload/image", err);
+    }
     const resp = await api.fetchApi("/upload/image", { method: "POST", body });
     if (!resp || resp.status !== 200) {
       throw new Error(`upload failed (${resp?.status || "no-response"})`);
@@ -101,7 +101,35 @@ function lookupNodeOutputEntry(nodeId) {
   return null;
 }
 
-function getLinkedImageUrl(node, imageInputName = "erp_image") {
+const PREVIEW_RETRY_LIMIT = 6;
+const PREVIEW_RETRY_BASE_MS = 150;
+
+function getLinkedImageOriginId(node, imageInputName = "erp_image") {
+  const inputs = Array.isArray(node?.inputs) ? node.inputs : [];
+  const input = inputs.find((inp) => String(inp?.name || "") === String(imageInputName));
+  if (input?.link == null) return null;
+  const link = node?.graph?.links?.[input.link] || app?.graph?.links?.[input.link];
+  const originId = Number(link?.origin_id);
+  return Number.isFinite(originId) ? originId : null;
+}
+
+function lowestLodSource(candidate) {
+  // Preview pyramid levels from the Python side, smallest first.
+  const lods = Array.isArray(candidate?.lods) ? candidate.lods : [];
+  for (const lod of lods) {
+    const src = imageSourceFromCandidate(lod);
+    if (src) return src;
+  }
+  return "";
+}
+
+function getLinkedImageSources(node, imageInputName = "erp_image") {
+  const found = getLinkedImageUrl(node, imageInputName, true);
+  if (found && typeof found === "object") return found;
+  return { src: String(found || ""), lowSrc: "" };
+}
+
+function getLinkedImageUrl(node, imageInputName = "erp_image", withLowSrc = false) {
   const inputs = Array.isArray(node?.inputs) ? node.inputs : [];
   let linkId = null;
 
@@ -132,7 +160,7 @@ function getLinkedImageUrl(node, imageInputName = "erp_image") {
     if (!Array.isArray(group)) continue;
     for (const cand of group) {
       const src = imageSourceFromCandidate(cand);
-      if (src) return src;
+      if (src) return withLowSrc ? { src, lowSrc: lowestLodSource(cand) } : src;
     }
   }
 
@@ -212,6 +240,8 @@ class PreviewNodeRuntime {
     this.queuedDuringTick = false;
     this.img = null;
     this.imgSrc = "";
+    this.imgIsFull = false;
+    this.imgRetries = new Map();
     this.view = { yaw: 0, pitch: 0, fov: 100 };
     this.controller = createPanoInteractionController({
       getView: () => this.view,
@@ -238,12 +268,14 @@ class PreviewNodeRuntime {
     this.legacyDragPointer = false;
     this.tick = this.tick.bind(this);
     this.onResizeDom = this.onResizeDom.bind(this);
+    this.onPreviewReady = this.onPreviewReady.bind(this);
   }
 
   attach() {
     if (typeof this.node?.addDOMWidget === "function") this.attachDom();
     else this.attachLegacy();
     this.installCommonHooks();
+    api?.addEventListener?.("pano_suite.preview_ready", this.onPreviewReady);
     this.refreshImage();
     this.requestDraw();
   }
@@ -510,29 +542,63 @@ class PreviewNodeRuntime {
   }
 
   refreshImage() {
-    const nextSrc = getLinkedImageUrl(this.node, this.imageInputName);
+    const { src: nextSrc, lowSrc } = getLinkedImageSources(this.node, this.imageInputName);
     if (!nextSrc) {
       this.img = null;
       this.imgSrc = "";
+      this.imgIsFull = false;
       this.requestDraw();
       return;
     }
-    if (nextSrc === this.imgSrc && this.img) return;
+    if (nextSrc === this.imgSrc && this.img && this.imgIsFull) return;
     this.imgSrc = nextSrc;
+    this.imgIsFull = false;
+    if (lowSrc) {
+      // Show the smallest pyramid level first; the full preview replaces it.
+      const low = new Image();
+      low.onload = () => {
+        if (this.imgSrc !== nextSrc || this.imgIsFull) return;
+        this.img = low;
+        this.requestDraw();
+      };
+      low.src = lowSrc;
+    }
     const img = new Image();
     img.onload = () => {
       if (this.imgSrc !== nextSrc) return;
       this.img = img;
+      this.imgIsFull = true;
       this.requestDraw();
     };
     img.onerror = () => {
       if (this.imgSrc !== nextSrc) return;
-      this.img = null;
+      if (!lowSrc) this.img = null;
       this.requestDraw();
+      // Previews are encoded in the background; the file may not exist yet.
+      const attempt = (this.imgRetries.get(nextSrc) || 0) + 1;
+      this.imgRetries.set(nextSrc, attempt);
+      if (attempt > PREVIEW_RETRY_LIMIT) return;
+      setTimeout(() => {
+        if (this.imgSrc !== nextSrc || this.imgIsFull) return;
+        this.imgSrc = "";
+        this.refreshImage();
+      }, PREVIEW_RETRY_BASE_MS * 2 ** (attempt - 1));
     };
     img.src = nextSrc;
   }
 
+  onPreviewReady(evt) {
+    const readyNode = String(evt?.detail?.node ?? "").trim();
+    if (!readyNode) return;
+    const ids = [String(this.node?.id ?? "")];
+    const upstream = getLinkedImageOriginId(this.node, this.imageInputName);
+    if (upstream != null) ids.push(String(upstream));
+    if (!ids.includes(readyNode)) return;
+    this.imgSrc = "";
+    this.imgRetries.clear();
+    this.refreshImage();
+  }
+
   requestDraw() {
     this.needsDraw = true;
     if (this.inTick) {
@@ -594,6 +660,7 @@ class PreviewNodeRuntime {
     }
     this.resizeObserver?.disconnect?.();
     this.resizeObserver = null;
+    api?.removeEventListener?.("pano_suite.preview_ready", this.onPreviewReady);
     try {
       this.root?.remove?.();
     } catch {
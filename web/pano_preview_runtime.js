@@ -15,6 +15,7 @@ import {
 } from "./pano_interaction_controller.js";
 import { clamp, wrapYaw } from "./pano_math.js";
 import { isPanoramaPreviewNodeName } from "./pano_preview_identity.js";
+import { resolveStateText } from "./pano_state_sync.js";
 const { app } = appModule;
 
 function getAnimPreviewWidgetName() {
@@ -539,7 +540,7 @@ function parseState(text, bg = "#00ff00") {
 function getEffectiveStateText(node) {
   const live = node?.__panoLiveStateOverride;
   if (typeof live === "string" && live.trim()) return live;
-  return String(getWidget(node, "state_json")?.value || "");
+  return resolveStateText(node, String(getWidget(node, "state_json")?.value || ""));
 }
 
 function getCachedState(node) {
@@ -699,11 +700,14 @@ const executedRefreshMonitor = {
       });
     };
     api.addEventListener("executed", this.listener);
+    // Background-encoded previews announce themselves once the file is written.
+    api.addEventListener("pano_suite.preview_ready", this.listener);
     this.bound = true;
   },
   ensureUnbound() {
     if (!this.bound || !this.listener || !api?.removeEventListener) return;
     api.removeEventListener("executed", this.listener);
+    api.removeEventListener("pano_suite.preview_ready", this.listener);
     this.listener = null;
     this.bound = false;
   },
@@ -730,6 +734,23 @@ function comfyImageEntryToUrl(entry) {
   return typeof api?.apiURL === "function" ? api.apiURL(q) : q;
 }
 
+// Sticker assets are drawn from resized server-side thumbnails (cached on disk)
+// instead of the full-resolution file.
+const STICKER_THUMB_SIZE = 1024;
+
+function comfyImageEntryToThumbUrl(entry, size = STICKER_THUMB_SIZE) {
+  if (!entry || typeof entry !== "object") return "";
+  const filename = String(entry.filename || "");
+  if (!filename) return "";
+  const params = new URLSearchParams();
+  params.set("filename", filename);
+  params.set("type", String(entry.type || "input"));
+  if (entry.subfolder) params.set("subfolder", String(entry.subfolder));
+  params.set("size", String(size));
+  const q = `/pano_suite/thumb?${params.toString()}`;
+  return typeof api?.apiURL === "function" ? api.apiURL(q) : q;
+}
+
 function isDirectImageUrl(src) {
   const s = String(src || "").trim();
   if (!s) return false;
@@ -785,12 +806,22 @@ function stickerAssetToPreviewSrc(asset) {
   if (type === "comfy_image") {
     const filename = String(asset.filename || "").trim();
     if (!filename) return "";
-    return comfyImageEntryToUrl({
+    return comfyImageEntryToThumbUrl({
       filename,
       subfolder: String(asset.subfolder || ""),
       type: String(asset.storage || "input"),
     });
   }
+  if (type === "hash") {
+    // Content-addressed store: <input>/pano_assets/<sha256>.<ext>
+    const hash = String(asset.hash || "").trim().toLowerCase();
+    if (!/^[0-9a-f]{64}$/.test(hash)) return "";
+    return comfyImageEntryToThumbUrl({
+      filename: `${hash}.${String(asset.ext || "png")}`,
+      subfolder: "pano_assets",
+      type: "input",
+    });
+  }
   return "";
 }
 
@@ -1076,7 +1107,9 @@ function findLinkedInputImageSource(node, preferredInputNames = []) {
       const src = imageSourceFromCandidate(item);
       if (src) {
         panoPreviewLog(node, "image-resolve", { sourceType: "selfOutput", src, stage: "hit" });
-        return { src, sourceType: "selfOutput", inputName: "fallback" };
+        const lods = Array.isArray(item?.lods) ? item.lods : [];
+        const lowSrc = lods.length ? imageSourceFromCandidate(lods[0]) : "";
+        return { src, lowSrc, sourceType: "selfOutput", inputName: "fallback" };
       }
     }
   }
@@ -1094,11 +1127,19 @@ function getLinkedInputImage(node, preferredInputNames = []) {
   if (!node.__panoLinkedInputImageCache) node.__panoLinkedInputImageCache = new Map();
   const key = preferredInputNames.join("|") || "image";
   const cached = node.__panoLinkedInputImageCache.get(key);
-  if (cached && cached.srcRaw === srcRaw && cached.img) return cached.img;
+  if (cached && cached.srcRaw === srcRaw && cached.img) return pickLoadedLodImage(cached);
 
   const img = new Image();
-  const cacheEntry = { srcRaw, resolvedSrc: "", img };
+  const cacheEntry = { srcRaw, resolvedSrc: "", img, lowImg: null };
   node.__panoLinkedInputImageCache.set(key, cacheEntry);
+  const lowSrc = String(resolved?.lowSrc || "").trim();
+  if (lowSrc) {
+    // Smallest preview pyramid level, drawn until the full preview has loaded.
+    const lowImg = new Image();
+    lowImg.onload = () => node.setDirtyCanvas?.(true, true);
+    lowImg.src = lowSrc;
+    cacheEntry.lowImg = lowImg;
+  }
   let attempt = -1;
   const tryLoadNext = () => {
     attempt += 1;
@@ -1147,7 +1188,16 @@ function getLinkedInputImage(node, preferredInputNames = []) {
     });
   };
   tryLoadNext();
-  return img;
+  return pickLoadedLodImage(cacheEntry);
+}
+
+function isImageReady(img) {
+  return !!(img && img.complete && (img.naturalWidth || img.width));
+}
+
+function pickLoadedLodImage(entry) {
+  if (!isImageReady(entry.img) && isImageReady(entry.lowImg)) return entry.lowImg;
+  return entry.img;
 }
 
 function getLinkedInputImageForPreview(node, preferredInputNames = [], onLoad = null) {
@@ -0,0 +1,279 @@
+import { api } from "../../scripts/api.js";
+
+// Editor states are mirrored into the server's versioned store
+// (POST /pano_suite/state/{key}): the first sync sends the full document,
+// later ones send patch ops against the version the server acknowledged, and
+// the state_json widget then holds only {"state_ref", "version"}. Saved
+// workflows embed the full document under "state", which the server falls
+// back to when that version is gone (e.g. after a restart). Data URL assets
+// are swapped for hash refs (POST /pano_suite/assets/externalize) before
+// the first sync, so states never carry embedded images past that point.
+
+const SYNC_DEBOUNCE_MS = 150;
+const PATCH_COLLECTIONS = new Set(["stickers", "shots"]);
+const PATCH_SETTABLE = new Set(["bg_color", "output_preset", "active"]);
+
+function randomId() {
+  const uuid = globalThis.crypto?.randomUUID?.();
+  if (uuid) return uuid.replace(/-/g, "").slice(0, 16);
+  return `${Date.now().toString(36)}${Math.random().toString(36).slice(2, 10)}`;
+}
+
+// Node ids repeat across open workflows, so keys are scoped by a page id
+// plus a per-node suffix.
+const CLIENT_ID = randomId();
+const sessions = new Set();
+let reconnectBound = false;
+
+export function parseStateRef(text) {
+  if (typeof text !== "string" || !text.includes("\"state_ref\"")) return null;
+  try {
+    const value = JSON.parse(text);
+    return value && typeof value === "object" && typeof value.state_ref === "string" ? value : null;
+  } catch {
+    return null;
+  }
+}
+
+// Full state JSON for a state_json widget value that may be a reference.
+export function resolveStateText(node, text) {
+  const raw = String(text || "");
+  const session = node?.__panoStateSync;
+  if (session?.text != null && (raw === session.widget?.value || !raw)) return session.text;
+  const ref = parseStateRef(raw);
+  if (!ref) return raw;
+  const memo = node?.__panoResolvedStateText;
+  if (memo?.raw === raw) return memo.text;
+  const resolved = ref.state && typeof ref.state === "object" ? JSON.stringify(ref.state) : "";
+  if (node) node.__panoResolvedStateText = { raw, text: resolved };
+  return resolved;
+}
+
+function sameJson(a, b) {
+  return JSON.stringify(a) === JSON.stringify(b);
+}
+
+function diffCollection(name, prev, next) {
+  if (!Array.isArray(prev) || !Array.isArray(next)) return null;
+  const byId = new Map();
+  for (const item of prev) {
+    if (!item || typeof item !== "object" || item.id == null || byId.has(item.id)) return null;
+    byId.set(item.id, item);
+  }
+  const nextIds = new Set();
+  for (const item of next) {
+    if (!item || typeof item !== "object" || item.id == null || nextIds.has(item.id)) return null;
+    nextIds.add(item.id);
+  }
+  // The server keeps survivors in place and appends additions; any other
+  // reordering is sent as a full document.
+  const order = prev.filter((it) => nextIds.has(it.id)).map((it) => it.id);
+  order.push(...next.filter((it) => !byId.has(it.id)).map((it) => it.id));
+  if (!sameJson(order, next.map((it) => it.id))) return null;
+
+  const ops = [];
+  for (const item of prev) {
+    if (!nextIds.has(item.id)) ops.push({ op: "remove", collection: name, id: item.id });
+  }
+  for (const item of next) {
+    const old = byId.get(item.id);
+    if (!old) {
+      ops.push({ op: "add", collection: name, value: item });
+      continue;
+    }
+    if (Object.keys(old).some((k) => !(k in item))) return null;
+    const value = {};
+    for (const [k, v] of Object.entries(item)) {
+      if (!sameJson(old[k], v)) value[k] = v;
+    }
+    if (Object.keys(value).length) ops.push({ op: "update", collection: name, id: item.id, value });
+  }
+  return ops;
+}
+
+// Patch ops turning ``prev`` into ``next``, or null when only a full
+// document can express the change.
+export function diffStateOps(prev, next) {
+  const ops = [];
+  const keys = new Set([...Object.keys(prev || {}), ...Object.keys(next || {})]);
+  for (const key of keys) {
+    if (PATCH_COLLECTIONS.has(key)) {
+      const sub = diffCollection(key, prev[key] || [], next[key] || []);
+      if (!sub) return null;
+      ops.push(...sub);
+    } else if (key === "assets") {
+      const a = prev.assets || {};
+      const b = next.assets || {};
+      for (const id of Object.keys(a)) {
+        if (!(id in b)) ops.push({ op: "remove_asset", id });
+      }
+      for (const [id, value] of Object.entries(b)) {
+        if (!sameJson(a[id], value)) ops.push({ op: "put_asset", id, value });
+      }
+    } else if (!sameJson(prev[key], next[key])) {
+      if (!PATCH_SETTABLE.has(key) || !(key in next)) return null;
+      ops.push({ op: "set", key, value: next[key] });
+    }
+  }
+  return ops;
+}
+
+function setWidgetValue(session, value) {
+  const widget = session.widget;
+  if (!widget || widget.value === value) return;
+  widget.value = value;
+  widget.callback?.(value);
+}
+
+async function postState(key, body) {
+  return api.fetchApi(`/pano_suite/state/${encodeURIComponent(key)}`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(body),
+  });
+}
+
+// Swaps data URL assets for content-addressed hash refs on the server.
+// Returns the new state text, or null when the route is unavailable.
+export async function externalizeStateText(text) {
+  if (typeof text !== "string" || !text.includes("data:image")) return text;
+  try {
+    const res = await api.fetchApi("/pano_suite/assets/externalize", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ state_json: text }),
+    });
+    if (!res?.ok) return null;
+    const body = await res.json();
+    return typeof body?.state_json === "string" ? body.state_json : null;
+  } catch (err) {
+    console.warn("[PanoramaSuite] asset externalize failed", err);
+    return null;
+  }
+}
+
+async function push(session) {
+  if (session.text.includes("data:image")) {
+    const before = session.text;
+    const swapped = await externalizeStateText(before);
+    // Edits made meanwhile win; they are externalized on their own sync.
+    if (swapped && session.text === before) session.text = swapped;
+  }
+  const text = session.text;
+  let next;
+  try {
+    next = JSON.parse(text);
+  } catch {
+    return;
+  }
+  try {
+    const ops = session.version != null && session.synced ? diffStateOps(session.synced, next) : null;
+    let res = ops ? await postState(session.key, { base_version: session.version, ops }) : null;
+    // A stale base (409) or rejected ops fall back to the full document.
+    if (!res?.ok) res = await postState(session.key, { state: next });
+    if (!res.ok) throw new Error(`state sync failed: ${res.status}`);
+    const body = await res.json();
+    session.version = Number(body.version);
+    session.synced = next;
+    session.syncedText = text;
+    setWidgetValue(session, JSON.stringify({ state_ref: session.key, version: session.version }));
+  } catch (err) {
+    // Without the store the widget carries the full document, as before.
+    session.version = null;
+    session.synced = null;
+    session.syncedText = null;
+    setWidgetValue(session, session.text);
+    console.warn("[PanoramaSuite] state sync failed; sending the full state", err);
+  }
+}
+
+export async function flushState(session) {
+  if (!session) return;
+  clearTimeout(session.timer);
+  session.timer = 0;
+  while (session.running) await session.running;
+  if (session.text == null || session.text === session.syncedText) return;
+  session.running = push(session).finally(() => {
+    session.running = null;
+  });
+  await session.running;
+}
+
+function bindReconnect() {
+  if (reconnectBound || !api?.addEventListener) return;
+  reconnectBound = true;
+  // A restarted server has an empty store: resend full documents.
+  api.addEventListener("reconnected", () => {
+    for (const ref of [...sessions]) {
+      const session = ref.deref();
+      if (!session || !session.node?.graph) {
+        sessions.delete(ref);
+        continue;
+      }
+      session.version = null;
+      session.synced = null;
+      session.syncedText = null;
+    }
+  });
+}
+
+function embeddedValue(session) {
+  if (session.text == null) return session.widget?.value;
+  if (session.version == null || session.text !== session.syncedText) return session.text;
+  return `{"state_ref":${JSON.stringify(session.key)},"version":${session.version},"state":${session.text}}`;
+}
+
+// Creates the node's sync session on first use. Prompts serialize the widget
+// as a reference (after flushing pending edits); saved workflows get the
+// full document embedded.
+export function stateSession(node, widget) {
+  if (!node || !widget) return null;
+  let session = node.__panoStateSync;
+  if (session) return session;
+  session = {
+    node,
+    widget,
+    key: `${CLIENT_ID}-${randomId().slice(0, 8)}`,
+    text: null,
+    version: null,
+    synced: null,
+    syncedText: null,
+    timer: 0,
+    running: null,
+  };
+  node.__panoStateSync = session;
+  const initial = resolveStateText(null, String(widget.value || ""));
+  if (initial.trim()) session.text = initial;
+  // Loaded workflows with embedded images are externalized right away, so
+  // neither the widget nor the next save carries the data URLs.
+  if (session.text?.includes("data:image")) flushState(session);
+
+  widget.serializeValue = async () => {
+    await flushState(session);
+    return widget.value;
+  };
+  const prevSerialize = node.onSerialize;
+  node.onSerialize = function (o) {
+    const out = prevSerialize ? prevSerialize.apply(this, arguments) : undefined;
+    const index = Array.isArray(this.widgets) ? this.widgets.indexOf(widget) : -1;
+    if (index >= 0 && Array.isArray(o?.widgets_values)) o.widgets_values[index] = embeddedValue(session);
+    return out;
+  };
+  sessions.add(new WeakRef(session));
+  bindReconnect();
+  return session;
+}
+
+// Records an edit: readers see ``text`` at once, the server gets it after a
+// short debounce.
+export function commitStateText(node, widget, text) {
+  const session = stateSession(node, widget);
+  if (!session) return;
+  session.text = text;
+  if (session.version == null) setWidgetValue(session, text);
+  else widget.callback?.(widget.value);
+  clearTimeout(session.timer);
+  session.timer = setTimeout(() => {
+    flushState(session);
+  }, SYNC_DEBOUNCE_MS);
+}